@@ -0,0 +1 @@
+# Benchmarks hors ligne (faux provider + dépôts synthétiques)
@@ -0,0 +1,200 @@
+"""
+Faux provider LLM - Serveur local compatible avec l'API OpenAI (chemin utilisé par Ollama via OLLAMA_URL)
+Répond en streaming avec des opérations de fichiers synthétiques, latence et taille configurables.
+"""
+
+import re
+import json
+import time
+import threading
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, List, Dict, Any
+
+_TARGET_RE = re.compile(r"GÉNÈRE UNIQUEMENT: (\w+) (\S+)")
+
+
+@dataclass
+class FakeLLMConfig:
+    """Comportement du faux provider."""
+    first_token_latency: float = 0.2  # secondes avant le premier chunk
+    tokens_per_second: float = 0.0  # débit de sortie (0 = aussi vite que possible)
+    output_files: int = 3  # fichiers par réponse
+    bytes_per_file: int = 2000
+    chunk_chars: int = 64  # taille d'un chunk SSE
+    chars_per_token: float = 4.0
+
+
+def _file_content(path: str, size: int, seed: int) -> str:
+    """Contenu déterministe d'environ `size` octets, selon l'extension."""
+    if path.endswith(".py"):
+        unit = f"def bench_{seed}_{{n}}(value):\n    return value * {seed} + {{n}}\n\n"
+    elif path.endswith(".js"):
+        unit = f"export function bench{seed}_{{n}}(value) {{{{\n  return value * {seed} + {{n}};\n}}}}\n\n"
+    else:
+        unit = f"<section id=\"bench-{seed}-{{n}}\"><p>Contenu {{n}}</p></section>\n"
+    parts, total, n = [], 0, 0
+    while total < size:
+        line = unit.format(n=n)
+        parts.append(line)
+        total += len(line)
+        n += 1
+    return "".join(parts)
+
+
+class FakeLLMServer:
+    """
+    Serveur HTTP local qui imite /v1/chat/completions en streaming (SSE).
+
+    Comprend les trois requêtes du handler: génération classique (N fichiers),
+    étape de planification (liste des fichiers sans contenu) et génération
+    d'un seul fichier du plan.
+    """
+
+    def __init__(self, config: Optional[FakeLLMConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or FakeLLMConfig()
+        self.requests = 0
+        self.output_chars = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeLLMServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    # ------------------------------------------------------------------
+    # Réponses
+    # ------------------------------------------------------------------
+
+    def _next_id(self) -> int:
+        with self._lock:
+            self.requests += 1
+            return self.requests
+
+    def build_response(self, messages: List[Dict[str, Any]]) -> str:
+        """Texte JSON renvoyé pour une conversation."""
+        request_id = self._next_id()
+        prompt = str(messages[-1].get("content", "")) if messages else ""
+        config = self.config
+        paths = [f"bench/r{request_id}/module_{i}.{('py', 'js', 'html')[i % 3]}" for i in range(config.output_files)]
+
+        if "ÉTAPE DE PLANIFICATION" in prompt:
+            doc = {
+                "success": True,
+                "explanation": "Plan synthétique du benchmark",
+                "operations": [{"action": "create", "file_path": p, "description": f"module {i}"} for i, p in enumerate(paths)],
+            }
+        else:
+            target = _TARGET_RE.search(prompt)
+            if target:
+                paths = [target.group(2)]
+            doc = {
+                "success": True,
+                "explanation": f"Réponse synthétique {request_id}",
+                "operations": [
+                    {
+                        "action": "create",
+                        "file_path": path,
+                        "content": _file_content(path, config.bytes_per_file, request_id),
+                        "description": "fichier généré par le benchmark",
+                    }
+                    for path in paths
+                ],
+            }
+        text = json.dumps(doc)
+        with self._lock:
+            self.output_chars += len(text)
+        return text
+
+    def _handler_class(self):
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                messages = body.get("messages", [])
+                text = server.build_response(messages)
+                config = server.config
+                prompt_chars = sum(len(str(m.get("content", ""))) for m in messages)
+                usage = {
+                    "prompt_tokens": int(prompt_chars / config.chars_per_token),
+                    "completion_tokens": int(len(text) / config.chars_per_token),
+                }
+                time.sleep(config.first_token_latency)
+                if body.get("stream"):
+                    self._stream(text, usage, body.get("model", "bench"))
+                else:
+                    self._complete(text, usage, body.get("model", "bench"))
+
+            def _complete(self, text, usage, model):
+                payload = json.dumps({
+                    "id": "bench", "object": "chat.completion", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                    "usage": dict(usage, total_tokens=usage["prompt_tokens"] + usage["completion_tokens"]),
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _stream(self, text, usage, model):
+                config = server.config
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                def send(event: Dict[str, Any]) -> None:
+                    data = f"data: {json.dumps(event)}\n\n".encode()
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+                def chunk(delta: Dict[str, Any], finish: Optional[str] = None, **extra) -> Dict[str, Any]:
+                    event = {
+                        "id": "bench", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                        "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+                    }
+                    event.update(extra)
+                    return event
+
+                pause = 0.0
+                if config.tokens_per_second > 0:
+                    pause = config.chunk_chars / config.chars_per_token / config.tokens_per_second
+                for start in range(0, len(text), config.chunk_chars):
+                    send(chunk({"content": text[start:start + config.chunk_chars]}))
+                    if pause:
+                        self.wfile.flush()
+                        time.sleep(pause)
+                send(chunk({}, "stop", usage=dict(usage, total_tokens=usage["prompt_tokens"] + usage["completion_tokens"])))
+                data = b"data: [DONE]\n\n"
+                self.wfile.write(b"%x\r\n%s\r\n0\r\n\r\n" % (len(data), data))
+                self.wfile.flush()
+
+        return _Handler
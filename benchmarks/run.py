@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de bout en bout, hors ligne:
+process_instruction -> apply_operations -> GitManager.deploy sur des dépôts synthétiques,
+avec un faux provider compatible OpenAI (chemin Ollama via OLLAMA_URL).
+
+Exemples:
+    python benchmarks/run.py --files 1000,10000 --iterations 5 --output results.json
+    python benchmarks/run.py --files 1000 --baseline results.json --threshold 0.2
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import shutil
+import platform
+import tempfile
+import subprocess
+import statistics
+from typing import List, Dict, Any, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_llm import FakeLLMServer, FakeLLMConfig  # noqa: E402
+from benchmarks.workspace import create_workspace  # noqa: E402
+
+logger = logging.getLogger("benchmarks")
+
+# Mesures comparées à la référence (--baseline)
+TRACKED = ("init_s", "process_s", "apply_s", "deploy_s", "total_s")
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, int(q * len(ordered) + 0.5) - 1))]
+
+
+def _summarize(iterations: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    summary = {}
+    for key in ("process_s", "apply_s", "deploy_s", "total_s"):
+        values = [it[key] for it in iterations]
+        summary[key] = {
+            "p50": _percentile(values, 0.5),
+            "p95": _percentile(values, 0.95),
+            "mean": statistics.fmean(values) if values else 0.0,
+            "min": min(values) if values else 0.0,
+        }
+    return summary
+
+
+def _environment() -> Dict[str, Any]:
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    try:
+        git_version = subprocess.run(["git", "--version"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        git_version = None
+    return {
+        "revision": revision,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "git": git_version,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+async def bench_size(files: int, args: argparse.Namespace, server: FakeLLMServer) -> Dict[str, Any]:
+    """Un dépôt de `files` fichiers: création, initialisation du handler puis N instructions."""
+    from src.ai_handler import AIHandler
+    from src.git_manager import GitManager
+    from src.metrics import METRICS
+
+    root = tempfile.mkdtemp(prefix=f"bench-{files}-", dir=args.workdir)
+    workspace = create_workspace(root, files, depth=args.depth, file_padding=args.file_bytes)
+    logger.info(f"📁 {files} fichiers générés en {workspace.setup_s:.1f}s ({workspace.path})")
+
+    METRICS.reset()
+    start = time.perf_counter()
+    handler = AIHandler("ollama", workspace.path, fallback_providers=[])
+    handler.relevance_index.build()  # Construction comptée dans l'initialisation
+    git_manager = GitManager(workspace.path, branch="main", workspace_index=handler.workspace_index)
+    init_s = time.perf_counter() - start
+
+    iterations = []
+    try:
+        for i in range(args.iterations):
+            instruction = f"Ajoute un module de calcul numéro {i} qui réutilise mod{i} et documente-le"
+            t0 = time.perf_counter()
+            response = await handler.process_instruction(instruction)
+            t1 = time.perf_counter()
+            if not response.success:
+                raise RuntimeError(f"Réponse en échec: {response.error}")
+            results = await asyncio.to_thread(handler.apply_operations, response.operations)
+            t2 = time.perf_counter()
+            if not all(r["success"] for r in results):
+                raise RuntimeError(f"Écriture en échec: {results}")
+            deployed, report = await asyncio.to_thread(git_manager.deploy, f"bench {i}")
+            t3 = time.perf_counter()
+            if not deployed:
+                raise RuntimeError(f"Déploiement en échec: {report}")
+            usage = response.usage
+            iterations.append({
+                "process_s": t1 - t0,
+                "apply_s": t2 - t1,
+                "deploy_s": t3 - t2,
+                "total_s": t3 - t0,
+                "operations": len(response.operations),
+                "input_tokens": usage.input_tokens if usage else 0,
+                "output_tokens": usage.output_tokens if usage else 0,
+                "context": handler.last_pack_report.summary() if handler.last_pack_report else "",
+            })
+            logger.info(
+                f"   #{i}: instruction {t1 - t0:.2f}s, écriture {t2 - t1:.3f}s, déploiement {t3 - t2:.2f}s"
+            )
+    finally:
+        await handler.aclose()
+        git_manager.close()
+        handler.file_writer.close()
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    return {
+        "files": files,
+        "depth": args.depth,
+        "setup_s": workspace.setup_s,
+        "init_s": init_s,
+        "iterations": iterations,
+        "summary": _summarize(iterations),
+        "stages": METRICS.snapshot(),
+        "read_cache": handler.read_cache.stats(),
+        "git": git_manager.runner.stats(),
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Régressions (médianes plus lentes que la référence de plus de `threshold`)."""
+    regressions = []
+    reference = {entry["files"]: entry for entry in baseline.get("results", [])}
+    for entry in results["results"]:
+        base = reference.get(entry["files"])
+        if base is None:
+            continue
+        for key in TRACKED:
+            current = entry[key] if key == "init_s" else entry["summary"][key]["p50"]
+            previous = base[key] if key == "init_s" else base["summary"][key]["p50"]
+            if previous > 0 and (current - previous) / previous > threshold:
+                regressions.append(
+                    f"{entry['files']} fichiers, {key}: {previous:.3f}s -> {current:.3f}s "
+                    f"(+{(current - previous) / previous * 100:.0f}%)"
+                )
+    return regressions
+
+
+async def main_async(args: argparse.Namespace) -> Dict[str, Any]:
+    # Imports paresseux du handler (SDK) faits ici: hors du temps d'initialisation mesuré
+    import openai  # noqa: F401
+    import src.ai_handler  # noqa: F401
+
+    config = FakeLLMConfig(
+        first_token_latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        output_files=args.output_files,
+        bytes_per_file=args.output_bytes,
+    )
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+    cache_dir = tempfile.mkdtemp(prefix="bench-cache-", dir=args.workdir)
+    with FakeLLMServer(config) as server:
+        os.environ.update({
+            "OLLAMA_URL": server.url,
+            "OLLAMA_MODEL": "bench",
+            "OLLAMA_NUM_CTX": str(args.context_window),
+            "AI_PLAN_MODE": "always" if args.plan else "off",
+            "AI_CACHE_DIR": cache_dir,
+            "USAGE_DB": os.path.join(cache_dir, "usage.sqlite3"),
+        })
+        os.environ.pop("METRICS_PROMETHEUS_FILE", None)
+        results = []
+        try:
+            for files in args.files:
+                results.append(await bench_size(files, args, server))
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        return {
+            "environment": _environment(),
+            "config": {
+                "files": args.files,
+                "depth": args.depth,
+                "file_bytes": args.file_bytes,
+                "iterations": args.iterations,
+                "latency_s": args.latency,
+                "tokens_per_second": args.tokens_per_second,
+                "output_files": args.output_files,
+                "output_bytes": args.output_bytes,
+                "plan": args.plan,
+            },
+            "results": results,
+            "fake_llm": {"requests": server.requests, "output_chars": server.output_chars},
+        }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark hors ligne instruction -> écriture -> déploiement")
+    parser.add_argument("--files", type=lambda v: [int(x) for x in v.split(",")], default=[1000],
+                        help="Tailles de dépôt, séparées par des virgules (ex: 1000,10000,100000)")
+    parser.add_argument("--depth", type=int, default=4, help="Profondeur de l'arborescence")
+    parser.add_argument("--file-bytes", type=int, default=0, help="Octets de remplissage par fichier")
+    parser.add_argument("--iterations", type=int, default=3, help="Instructions par dépôt")
+    parser.add_argument("--latency", type=float, default=0.2, help="Délai avant le premier token (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Débit de sortie simulé (0 = illimité)")
+    parser.add_argument("--output-files", type=int, default=3, help="Fichiers par réponse")
+    parser.add_argument("--output-bytes", type=int, default=2000, help="Taille de chaque fichier généré")
+    parser.add_argument("--context-window", type=int, default=32768, help="Fenêtre de contexte simulée")
+    parser.add_argument("--plan", action="store_true", help="Planification + génération parallèle (AI_PLAN_MODE=always)")
+    parser.add_argument("--workdir", default=None, help="Dossier des dépôts générés (défaut: dossier temporaire)")
+    parser.add_argument("--keep", action="store_true", help="Conserver les dépôts générés")
+    parser.add_argument("--output", default="-", help="Fichier JSON des résultats ('-' = sortie standard)")
+    parser.add_argument("--baseline", default=None, help="Résultats de référence à comparer")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Régression tolérée (0.2 = +20%%)")
+    parser.add_argument("--verbose", action="store_true", help="Logs détaillés du bot")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format="%(message)s", stream=sys.stderr)
+    logger.setLevel(logging.INFO)
+    if args.verbose:
+        logging.getLogger().setLevel(logging.INFO)
+
+    results = asyncio.run(main_async(args))
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        logger.info(f"💾 Résultats: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for line in regressions:
+            logger.warning(f"📉 Régression: {line}")
+        if regressions:
+            return 1
+        logger.info("✅ Aucune régression par rapport à la référence")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
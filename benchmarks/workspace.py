@@ -0,0 +1,99 @@
+"""
+Workspaces synthétiques - Dépôts git générés (taille et profondeur configurables) avec un remote nu local
+"""
+
+import os
+import time
+import shutil
+import subprocess
+from dataclasses import dataclass
+from typing import Dict, List
+
+_GIT_ENV = {
+    "GIT_AUTHOR_NAME": "bench",
+    "GIT_AUTHOR_EMAIL": "bench@example.invalid",
+    "GIT_COMMITTER_NAME": "bench",
+    "GIT_COMMITTER_EMAIL": "bench@example.invalid",
+}
+
+_TEMPLATES = {
+    ".py": "\"\"\"Module {name}\"\"\"\n\n\ndef {name}_handler(payload):\n    return {{'module': '{name}', 'size': len(payload)}}\n\n\nclass {cls}:\n    def run(self):\n        return {name}_handler('{name}')\n",
+    ".js": "// Module {name}\nexport function {name}Handler(payload) {{\n  return {{ module: '{name}', size: payload.length }};\n}}\n",
+    ".html": "<!DOCTYPE html>\n<html><head><title>{name}</title></head>\n<body><main><section id=\"{name}\"><h1>{cls}</h1></section></main></body></html>\n",
+    ".md": "# {cls}\n\nDocumentation du module {name}.\n",
+}
+
+
+@dataclass
+class SyntheticWorkspace:
+    """Dépôt généré pour un benchmark."""
+    path: str
+    remote: str
+    files: int
+    depth: int
+    setup_s: float
+
+
+def _git(cwd: str, *args: str) -> None:
+    env = dict(os.environ, **_GIT_ENV)
+    subprocess.run(["git", *args], cwd=cwd, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def _layout(files: int, depth: int, per_dir: int) -> List[str]:
+    """Chemins de `files` fichiers répartis dans un arbre de `depth` niveaux."""
+    paths = []
+    extensions = list(_TEMPLATES)
+    for i in range(files):
+        parts = []
+        bucket = i // per_dir
+        for level in range(depth):
+            parts.append(f"d{level}_{bucket % 8}")
+            bucket //= 8
+        name = f"mod{i}"
+        parts.append(name + extensions[i % len(extensions)])
+        paths.append(os.path.join(*parts))
+    return paths
+
+
+def create_workspace(root: str, files: int, depth: int = 4, per_dir: int = 50, file_padding: int = 0) -> SyntheticWorkspace:
+    """
+    Génère un dépôt git de `files` fichiers (commit initial poussé sur un remote nu local).
+
+    Args:
+        root: Dossier parent (vidé s'il existe)
+        files: Nombre de fichiers
+        depth: Profondeur de l'arborescence
+        per_dir: Fichiers par dossier feuille
+        file_padding: Octets de commentaire ajoutés à chaque fichier
+    """
+    start = time.perf_counter()
+    if os.path.exists(root):
+        shutil.rmtree(root)
+    path = os.path.join(root, "workspace")
+    remote = os.path.join(root, "remote.git")
+    os.makedirs(path)
+
+    created_dirs: Dict[str, bool] = {}
+    for index, rel_path in enumerate(_layout(files, depth, per_dir)):
+        directory = os.path.dirname(rel_path)
+        if directory and directory not in created_dirs:
+            os.makedirs(os.path.join(path, directory), exist_ok=True)
+            created_dirs[directory] = True
+        name = f"mod{index}"
+        extension = os.path.splitext(rel_path)[1]
+        content = _TEMPLATES[extension].format(name=name, cls=f"Module{index}")
+        if file_padding:
+            marker = "#" if extension == ".py" else "//" if extension == ".js" else ""
+            content += (f"{marker} " + "x" * 70 + "\n") * (file_padding // 74 + 1) if marker else ""
+        with open(os.path.join(path, rel_path), "w", encoding="utf-8") as f:
+            f.write(content)
+
+    _git(root, "init", "-q", "--bare", remote)
+    _git(path, "init", "-q", "-b", "main")
+    _git(path, "config", "user.name", _GIT_ENV["GIT_AUTHOR_NAME"])
+    _git(path, "config", "user.email", _GIT_ENV["GIT_AUTHOR_EMAIL"])
+    _git(path, "add", "-A")
+    _git(path, "commit", "-q", "-m", "Workspace synthétique")
+    _git(path, "remote", "add", "origin", remote)
+    _git(path, "push", "-q", "-u", "origin", "main")
+    return SyntheticWorkspace(path, remote, files, depth, time.perf_counter() - start)
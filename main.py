@@ -111,7 +111,8 @@ def main():
         
         git_manager = GitManager(
             workspace_path=config["workspace_path"],
-            branch=config["git_branch"]
+            branch=config["git_branch"],
+            workspace_index=ai_handler.workspace_index,
         )
         logger.info("✅ Git Manager initialisé")
         
@@ -4,14 +4,62 @@ Supporte plusieurs providers IA : Gemini (Google), Groq, OpenAI, Anthropic (Clau
 """
 
 import os
+import re
 import json
+import time
+import uuid
+import hashlib
+import datetime
+import asyncio
 import logging
-from typing import Optional, List, Dict, Any
-from dataclasses import dataclass
+import threading
+from typing import Optional, List, Dict, Any, Callable, Awaitable, Tuple
+from dataclasses import dataclass, asdict, fields
 from enum import Enum
 
+from .workspace_index import WorkspaceIndex, IndexDelta
+from .relevance_index import RelevanceIndex
+from .symbol_index import SymbolIndex
+from .context_packer import ContextPacker, PackReport, estimate_tokens, CHARS_PER_TOKEN
+from .stream_parser import OperationStreamParser, ContinuationStitcher, recover_response
+from .patcher import apply_patches, PatchError
+from .response_cache import ResponseCache
+from .read_cache import FileReadCache
+from .provider_chain import ProviderSlot, ProviderAttemptError, classify_error, order_slots
+from .rate_limiter import get_limiter, retry_after, backoff_delay
+from .atomic_writer import AtomicBatchWriter, WriteBatch, WriteStats, BatchWriteError
+from .change_journal import ChangeJournal
+from .validator import FileValidator
+from .metrics import METRICS
+from .session_state import ChatSession
+from .usage_store import UsageStore, UsageRecord, UsageScope, CURRENT_SCOPE, CURRENT_STAGE, parse_prices
+
 logger = logging.getLogger(__name__)
 
+# Part maximale du budget d'entrée consacrée à l'arborescence du projet
+STRUCTURE_BUDGET_SHARE = 0.25
+# L'arborescence garde toujours au moins ce budget, même sur les petites fenêtres
+MIN_STRUCTURE_TOKENS = 200
+
+# Erreurs réessayées sur le même provider (avec backoff) avant de basculer
+RETRYABLE_ERRORS = {"quota", "server", "network"}
+
+# Instructions à planifier: « 12 pages », « 5 nouveaux fichiers », « site complet »...
+PLAN_COUNT_RE = re.compile(
+    r"\b(\d+)\s+(?:\w+\s+)?(?:fichiers|pages|files|composants|components|écrans|modules|sections|vues|endpoints)\b",
+    re.IGNORECASE,
+)
+PLAN_SCOPE_RE = re.compile(
+    r"\b(?:site|projet|application|app|api|jeu)\s+(?:web\s+)?(?:complet|complète|entier|entière|multi-?pages?)\b"
+    r"|\bfrom scratch\b|\bde z[ée]ro\b",
+    re.IGNORECASE,
+)
+
+# Cache des réponses à côté du bot (jamais dans le workspace modifié)
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "responses")
+# Journal de consommation (tokens, coût) au même endroit
+DEFAULT_USAGE_DB = os.path.join(os.path.dirname(DEFAULT_CACHE_DIR), "usage.sqlite3")
+
 
 class AIProvider(Enum):
     OPENAI = "openai"
@@ -24,10 +72,63 @@ class AIProvider(Enum):
 @dataclass
 class FileOperation:
     """Représente une opération sur un fichier."""
-    action: str  # "create", "modify", "delete"
+    action: str  # "create", "modify", "patch", "delete"
     file_path: str
     content: Optional[str] = None
     description: str = ""
+    patches: Optional[List[Dict[str, str]]] = None  # blocs {"search", "replace"} pour "patch"
+    diff: Optional[str] = None  # hunks de diff unifié pour "patch"
+
+
+# Callbacks de progression pendant le streaming
+OperationCallback = Callable[[FileOperation], Awaitable[None]]
+ProgressCallback = Callable[[int], Awaitable[None]]
+TextChunkCallback = Callable[[str], Awaitable[None]]
+
+
+@dataclass
+class PromptContext:
+    """
+    Contexte envoyé au modèle, découpé pour le cache de préfixe des providers:
+    une partie stable (arborescence, règles) identique d'une instruction à
+    l'autre, suivie de la partie volatile (fichiers, instruction).
+    """
+    stable: str
+    volatile: str
+
+    @property
+    def text(self) -> str:
+        return f"{self.stable}\n{self.volatile}"
+
+
+@dataclass
+class TokenUsage:
+    """Consommation de tokens d'un appel (quand le provider la renvoie)."""
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0  # tokens d'entrée servis depuis le cache de préfixe
+    cache_write_tokens: int = 0  # tokens écrits dans le cache (Anthropic)
+    first_token_ms: Optional[float] = None
+    truncated: bool = False  # sortie coupée par la limite de tokens
+    continuations: int = 0  # requêtes de continuation envoyées
+
+    def merge(self, other: "TokenUsage") -> None:
+        """Ajoute la consommation d'un appel (continuation comprise)."""
+        self.input_tokens += other.input_tokens
+        self.output_tokens += other.output_tokens
+        self.cached_tokens += other.cached_tokens
+        self.cache_write_tokens += other.cache_write_tokens
+        if self.first_token_ms is None:
+            self.first_token_ms = other.first_token_ms
+        self.truncated = other.truncated
+
+    def summary(self) -> str:
+        text = f"{self.input_tokens} tokens d'entrée dont {self.cached_tokens} en cache, {self.output_tokens} en sortie"
+        if self.first_token_ms is not None:
+            text += f", 1er token en {self.first_token_ms:.0f} ms"
+        if self.continuations:
+            text += f", {self.continuations} continuation(s)"
+        return text
 
 
 @dataclass
@@ -37,6 +138,9 @@ class AIResponse:
     operations: List[FileOperation]
     explanation: str
     error: Optional[str] = None
+    provider: Optional[str] = None  # provider/modèle qui a produit la réponse
+    usage: Optional[TokenUsage] = None
+    truncated: bool = False  # JSON incomplet: seules les opérations complètes ont été gardées
 
 
 class AIHandler:
@@ -57,7 +161,7 @@ Tu travailles sur un projet situé dans le répertoire de travail. Tu as accès
 📋 RÈGLES CRITIQUES:
 1. Réponds UNIQUEMENT en JSON valide (pas de markdown, pas de texte avant/après)
 2. Ne modifie que les fichiers strictement nécessaires
-3. Fournis le contenu COMPLET des fichiers modifiés ou créés (pas juste les changements)
+3. Pour un changement localisé dans un fichier existant, utilise "patch" (blocs search/replace) ; fournis le contenu COMPLET uniquement pour "create" ou pour une réécriture majeure ("modify")
 4. Sois précis, détaillé et professionnel dans tes explications
 5. Respecte le style de code existant si tu modifies un fichier
 6. Assure-toi que le code est fonctionnel et sans erreurs de syntaxe
@@ -76,9 +180,10 @@ Tu travailles sur un projet situé dans le répertoire de travail. Tu as accès
     "explanation": "Description détaillée et claire de ce qui a été fait, pourquoi, et comment l'utiliser",
     "operations": [
         {
-            "action": "create|modify|delete",
+            "action": "create|modify|patch|delete",
             "file_path": "chemin/relatif/fichier.ext",
             "content": "contenu COMPLET du fichier si create ou modify (avec toutes les balises, imports, etc.)",
+            "patches": [{"search": "lignes existantes copiées à l'identique", "replace": "nouvelles lignes"}],
             "description": "description précise de l'opération effectuée"
         }
     ]
@@ -86,7 +191,8 @@ Tu travailles sur un projet situé dans le répertoire de travail. Tu as accès
 
 🔧 EXEMPLES D'ACTIONS:
 - "create": Créer un nouveau fichier avec tout son contenu complet
-- "modify": Modifier un fichier existant (fournir le contenu COMPLET du fichier modifié, pas juste les changements)
+- "patch": Modifier une partie d'un fichier existant (PRÉFÉRÉ pour les changements localisés). "patches" contient des blocs {"search", "replace"}: "search" recopie EXACTEMENT quelques lignes existantes (assez pour être unique), "replace" donne ces lignes après modification. Pas de "content" pour un patch.
+- "modify": Réécrire entièrement un fichier existant (fournir le contenu COMPLET) — seulement si la majorité du fichier change
 - "delete": Supprimer un fichier
 
 ⚠️ EN CAS D'ERREUR:
@@ -106,62 +212,254 @@ Tu travailles sur un projet situé dans le répertoire de travail. Tu as accès
 - Respect des conventions du langage
 """
 
-    def __init__(self, provider: str = "gemini", workspace_path: str = "."):
+    # Requête de continuation après une sortie coupée par la limite de tokens
+    CONTINUATION_PROMPT = (
+        "Ta réponse précédente a été coupée par la limite de longueur. Continue EXACTEMENT "
+        "à partir du dernier caractère envoyé: ne répète rien, pas de bloc ```json ni de texte "
+        "d'introduction, termine le JSON."
+    )
+
+    # Étape de planification d'une grosse instruction (fichiers sans contenu)
+    PLAN_PROMPT = (
+        "🗺️ ÉTAPE DE PLANIFICATION: ne génère PAS encore le contenu des fichiers. Réponds avec le "
+        "format JSON habituel, mais chaque opération contient seulement \"action\", \"file_path\" et "
+        "\"description\" (rôle du fichier, sections et éléments clés, liens avec les autres fichiers). "
+        "Dans \"explanation\", décris le résultat puis les conventions communes à tous les fichiers "
+        "(fichiers liés, classes CSS, identifiants, fonctions partagées, palette, navigation)."
+    )
+
+    # Génération d'un fichier du plan (une requête par fichier, en parallèle)
+    PLAN_FILE_PROMPT = (
+        "🗺️ PLAN DU PROJET (les fichiers sont générés séparément, en parallèle):\n{plan}\n\n"
+        "📐 CONVENTIONS COMMUNES:\n{conventions}\n\n"
+        "🎯 GÉNÈRE UNIQUEMENT: {action} {file_path}\n{description}\n"
+        "Réponds avec une seule opération pour ce fichier (contenu COMPLET pour create/modify, blocs "
+        "search/replace pour patch), en respectant le plan et les conventions pour que les fichiers "
+        "fonctionnent ensemble."
+    )
+
+    # Fenêtre de contexte (tokens d'entrée) par préfixe de nom de modèle
+    CONTEXT_WINDOWS = {
+        "claude": 200_000,
+        "gpt-4o": 128_000,
+        "gpt-4.1": 1_000_000,
+        "o1": 200_000,
+        "o3": 200_000,
+        "llama-3.1": 131_072,
+        "llama-3.3": 131_072,
+        "mixtral-8x7b": 32_768,
+        "gemma": 8_192,
+        "models/gemini": 1_000_000,
+        "gemini": 1_000_000,
+    }
+
+    # Fenêtre par défaut quand le modèle n'est pas connu
+    DEFAULT_CONTEXT_WINDOWS = {
+        AIProvider.ANTHROPIC: 200_000,
+        AIProvider.OPENAI: 128_000,
+        AIProvider.GROQ: 32_768,
+        # L'endpoint OpenAI-compatible d'Ollama utilise num_ctx (4096 par défaut)
+        AIProvider.OLLAMA: 4_096,
+        AIProvider.GEMINI: 1_000_000,
+    }
+
+    # Pools HTTP keep-alive, un par provider (partagés entre instances)
+    _HTTP_POOLS: Dict[AIProvider, Any] = {}
+
+    def __init__(
+        self,
+        provider: str = "gemini",
+        workspace_path: str = ".",
+        fallback_providers: Optional[List[str]] = None,
+    ):
         """
         Initialise le handler IA.
         
         Args:
             provider: "gemini", "groq", "openai", "anthropic" ou "ollama"
             workspace_path: Chemin vers le répertoire de travail
+            fallback_providers: Providers de secours, dans l'ordre (défaut: AI_FALLBACK_PROVIDERS)
         """
         self.provider = AIProvider(provider.lower())
         self.workspace_path = workspace_path
         self.client = None
+        # Délai maximal d'une requête complète (streaming compris)
+        self.request_timeout = float(os.getenv("AI_REQUEST_TIMEOUT", "180"))
+        if fallback_providers is None:
+            fallback_providers = [p.strip() for p in os.getenv("AI_FALLBACK_PROVIDERS", "").split(",") if p.strip()]
+        self.fallback_providers = fallback_providers
+        # Requête de secours lancée en parallèle si le premier provider n'a rien envoyé après N secondes (0 = désactivé)
+        self.hedge_after = float(os.getenv("AI_HEDGE_AFTER_SECONDS", "0"))
+        self.adaptive_order = os.getenv("AI_ADAPTIVE_PROVIDER_ORDER", "true").lower() in ("1", "true", "yes")
+        self.provider_cooldown = float(os.getenv("AI_PROVIDER_COOLDOWN_SECONDS", "60"))
+        # Nouveaux essais sur le même provider (backoff exponentiel avec jitter, Retry-After respecté)
+        self.max_retries = int(os.getenv("AI_MAX_RETRIES", "2"))
+        self.retry_base_delay = float(os.getenv("AI_RETRY_BASE_DELAY", "1.0"))
+        self.retry_max_wait = float(os.getenv("AI_RETRY_MAX_WAIT", "30"))
+        # Requêtes de continuation quand la sortie atteint AI_MAX_OUTPUT_TOKENS
+        self.max_continuations = int(os.getenv("AI_MAX_CONTINUATIONS", "3"))
+        # Planification des grosses instructions: auto (heuristique), always ou off
+        self.plan_mode = os.getenv("AI_PLAN_MODE", "auto").lower()
+        self.plan_min_files = int(os.getenv("AI_PLAN_MIN_FILES", "3"))
+        self.plan_concurrency = max(1, int(os.getenv("AI_PLAN_CONCURRENCY", "4")))
+        # Cache de préfixe côté provider (cache_control Anthropic, CachedContent Gemini)
+        self.prompt_cache = os.getenv("AI_PROMPT_CACHE", "true").lower() in ("1", "true", "yes")
+        self.prompt_cache_ttl = int(os.getenv("AI_PROMPT_CACHE_TTL_SECONDS", "300"))
+        self._gemini_caches: Dict[str, Tuple[str, float, Any]] = {}  # modèle -> (empreinte, expiration, modèle en cache)
+        self._gemini_cache_failed: set = set()
         self._init_client()
+        # Index construit une seule fois au démarrage, puis mis à jour par deltas
+        self.workspace_index = WorkspaceIndex(workspace_path)
+        self.last_index_delta: Optional[IndexDelta] = None
+        self.relevance_index = RelevanceIndex(self.workspace_index)
+        self.relevance_index.start_background_build()
+        self.symbol_index = SymbolIndex(self.workspace_index)
+        # Contenus déjà décodés, réutilisés tant que (mtime, taille) ne change pas
+        self.read_cache = FileReadCache(
+            max_bytes=int(float(os.getenv("AI_READ_CACHE_MB", "32")) * 1024 * 1024),
+            max_file_bytes=int(os.getenv("AI_READ_MAX_FILE_BYTES", str(2 * 1024 * 1024))),
+        )
+        self.last_pack_report: Optional[PackReport] = None
+        self.response_cache = ResponseCache(
+            directory=os.getenv("AI_CACHE_DIR", DEFAULT_CACHE_DIR),
+            max_entries=int(os.getenv("AI_CACHE_MAX_ENTRIES", "64")),
+            max_disk_entries=int(os.getenv("AI_CACHE_MAX_DISK_ENTRIES", "500")),
+            ttl_seconds=int(os.getenv("AI_CACHE_TTL_SECONDS", str(24 * 60 * 60))),
+        )
+        # Écritures atomiques (temporaire + fsync + renommage) réparties sur un pool borné
+        self.file_writer = AtomicBatchWriter(
+            max_workers=int(os.getenv("AI_WRITE_WORKERS", "0")) or None,
+            fsync=os.getenv("AI_WRITE_FSYNC", "true").lower() in ("1", "true", "yes"),
+        )
+        self.last_write_stats: Optional[WriteStats] = None
+        # Syntaxe vérifiée avant écriture: repair (fichier invalide non écrit, correction ciblée), warn ou off
+        self.validate_mode = os.getenv("VALIDATE_MODE", "repair").lower()
+        self.validator = FileValidator(
+            workers=int(os.getenv("VALIDATE_WORKERS", "0")),
+            node=os.getenv("VALIDATE_NODE", "node"),
+            timeout=float(os.getenv("VALIDATE_TIMEOUT", "5")),
+        )
+        # Tokens et coût estimé de chaque appel, par instruction, provider et jour (USAGE_DB=off pour désactiver)
+        usage_db = os.getenv("USAGE_DB", DEFAULT_USAGE_DB)
+        self.usage_store = UsageStore(
+            None if usage_db.lower() in ("", "off", "none") else usage_db,
+            retention_days=int(os.getenv("USAGE_RETENTION_DAYS", "90")),
+            prices=parse_prices(os.getenv("USAGE_PRICES", "")),
+        )
+        # Une annulation attend la fin d'un lot en cours d'écriture avant de restaurer
+        self._apply_lock = threading.Lock()
+
+    def _http_pool(self, provider: AIProvider):
+        """
+        Pool de connexions HTTP keep-alive partagé par tous les handlers d'un même provider.
+        """
+        import httpx
+        
+        pool = self._HTTP_POOLS.get(provider)
+        if pool is None or pool.is_closed:
+            pool = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=int(os.getenv("AI_HTTP_MAX_CONNECTIONS", "10")),
+                    max_keepalive_connections=int(os.getenv("AI_HTTP_MAX_KEEPALIVE", "5")),
+                    keepalive_expiry=60.0,
+                ),
+                timeout=httpx.Timeout(self.request_timeout, connect=10.0),
+            )
+            self._HTTP_POOLS[provider] = pool
+        return pool
+
+    async def aclose(self) -> None:
+        """Ferme les pools HTTP des providers, les pools d'écriture et de validation, le journal de consommation et la surveillance du workspace (à l'arrêt du bot)."""
+        for slot in self.slots:
+            pool = self._HTTP_POOLS.pop(slot.provider, None)
+            if pool is not None:
+                await pool.aclose()
+        self.file_writer.close()
+        self.validator.close()
+        self.usage_store.close()
+        self.workspace_index.close()
 
     def _init_client(self) -> None:
-        """Initialise le client API selon le provider."""
-        if self.provider == AIProvider.ANTHROPIC:
-            from anthropic import Anthropic
+        """
+        Initialise la chaîne de providers: le provider principal (obligatoire)
+        puis les providers de secours dont la configuration est complète.
+        """
+        self.slots: List[ProviderSlot] = [self._create_slot(self.provider)]
+        for name in self.fallback_providers:
+            try:
+                provider = AIProvider(name.lower())
+            except ValueError:
+                logger.warning(f"⚠️ Provider de secours inconnu ignoré: {name}")
+                continue
+            if any(slot.provider == provider for slot in self.slots):
+                continue
+            try:
+                self.slots.append(self._create_slot(provider))
+            except Exception as e:
+                logger.warning(f"⚠️ Provider de secours {name} ignoré: {e}")
+        
+        # Attributs du provider principal (compatibilité)
+        primary = self.slots[0]
+        self.client = primary.client
+        self.model = primary.model
+        self.context_window = primary.context_window
+        self.input_budget = primary.input_budget
+        if len(self.slots) > 1:
+            logger.info(f"🔗 Chaîne de providers: {' → '.join(slot.label for slot in self.slots)}")
+
+    def _create_slot(self, provider: AIProvider) -> ProviderSlot:
+        """Crée le client API (asynchrone) d'un provider."""
+        if provider == AIProvider.ANTHROPIC:
+            from anthropic import AsyncAnthropic
             api_key = os.getenv("ANTHROPIC_API_KEY")
             if not api_key:
                 raise ValueError("ANTHROPIC_API_KEY non définie")
-            self.client = Anthropic(api_key=api_key)
-            self.model = "claude-sonnet-4-20250514"
+            client = AsyncAnthropic(
+                api_key=api_key, http_client=self._http_pool(provider), timeout=self.request_timeout, max_retries=0
+            )
+            model = "claude-sonnet-4-20250514"
             logger.info("✅ Client Anthropic initialisé")
             
-        elif self.provider == AIProvider.OPENAI:
-            from openai import OpenAI
+        elif provider == AIProvider.OPENAI:
+            from openai import AsyncOpenAI
             api_key = os.getenv("OPENAI_API_KEY")
             if not api_key:
                 raise ValueError("OPENAI_API_KEY non définie")
-            self.client = OpenAI(api_key=api_key)
-            self.model = "gpt-4o"
+            client = AsyncOpenAI(
+                api_key=api_key, http_client=self._http_pool(provider), timeout=self.request_timeout, max_retries=0
+            )
+            model = "gpt-4o"
             logger.info("✅ Client OpenAI initialisé")
         
-        elif self.provider == AIProvider.GROQ:
-            from openai import OpenAI
+        elif provider == AIProvider.GROQ:
+            from openai import AsyncOpenAI
             api_key = os.getenv("GROQ_API_KEY")
             if not api_key:
                 raise ValueError("GROQ_API_KEY non définie")
-            self.client = OpenAI(
+            client = AsyncOpenAI(
                 api_key=api_key,
-                base_url="https://api.groq.com/openai/v1"
+                base_url="https://api.groq.com/openai/v1",
+                http_client=self._http_pool(provider),
+                timeout=self.request_timeout,
+                max_retries=0,
             )
             # Utiliser le meilleur modèle disponible (llama-3.1-70b-versatile est plus récent et performant)
-            self.model = os.getenv("GROQ_MODEL", "llama-3.1-70b-versatile")
-            logger.info(f"✅ Client Groq initialisé (modèle: {self.model})")
+            model = os.getenv("GROQ_MODEL", "llama-3.1-70b-versatile")
+            logger.info(f"✅ Client Groq initialisé (modèle: {model})")
         
-        elif self.provider == AIProvider.OLLAMA:
-            from openai import OpenAI
-            self.client = OpenAI(
+        elif provider == AIProvider.OLLAMA:
+            from openai import AsyncOpenAI
+            client = AsyncOpenAI(
                 api_key="ollama",  # Ollama n'a pas besoin de clé
-                base_url=os.getenv("OLLAMA_URL", "http://localhost:11434/v1")
+                base_url=os.getenv("OLLAMA_URL", "http://localhost:11434/v1"),
+                http_client=self._http_pool(provider),
+                timeout=self.request_timeout,
+                max_retries=0,
             )
-            self.model = os.getenv("OLLAMA_MODEL", "llama3.2")
-            logger.info(f"✅ Client Ollama initialisé (modèle: {self.model})")
+            model = os.getenv("OLLAMA_MODEL", "llama3.2")
+            logger.info(f"✅ Client Ollama initialisé (modèle: {model})")
         
-        elif self.provider == AIProvider.GEMINI:
+        elif provider == AIProvider.GEMINI:
             import google.generativeai as genai
             api_key = os.getenv("GEMINI_API_KEY")
             if not api_key:
@@ -169,50 +467,96 @@ Tu travailles sur un projet situé dans le répertoire de travail. Tu as accès
             genai.configure(api_key=api_key)
             # Important: certains modèles ont un quota gratuit à 0 selon les comptes.
             # `models/gemini-flash-lite-latest` est généralement disponible en "free tier".
-            model_name = os.getenv("GEMINI_MODEL", "models/gemini-flash-lite-latest")
-            self.client = genai.GenerativeModel(model_name)
-            self.model = model_name
-            logger.info(f"✅ Client Google Gemini initialisé (modèle: {self.model})")
+            model = os.getenv("GEMINI_MODEL", "models/gemini-flash-lite-latest")
+            # Les appels passent par generate_content_async (canal gRPC asyncio partagé du SDK) ;
+            # le prompt système est une instruction système, plus un préfixe du message
+            client = genai.GenerativeModel(model, system_instruction=self.SYSTEM_PROMPT)
+            logger.info(f"✅ Client Google Gemini initialisé (modèle: {model})")
+        
+        else:
+            raise ValueError(f"Provider non supporté: {provider}")
+
+        context_window = self._resolve_context_window(provider, model)
+        input_budget = self._resolve_input_budget(context_window)
+        logger.info(f"📦 Budget d'entrée {provider.value}: {input_budget} tokens (fenêtre {context_window})")
+        # Les nouveaux essais passent par le limiteur (pas ceux des SDK: max_retries=0)
+        return ProviderSlot(provider, client, model, context_window, input_budget, limiter=get_limiter(provider.value, model))
+
+    def _resolve_context_window(self, provider: AIProvider, model: str) -> int:
+        """Fenêtre de contexte d'un modèle (surchargeable via AI_CONTEXT_WINDOW)."""
+        if os.getenv("AI_CONTEXT_WINDOW"):
+            return int(os.getenv("AI_CONTEXT_WINDOW"))
+        if provider == AIProvider.OLLAMA:
+            return int(os.getenv("OLLAMA_NUM_CTX", str(self.DEFAULT_CONTEXT_WINDOWS[AIProvider.OLLAMA])))
+        for prefix, window in sorted(self.CONTEXT_WINDOWS.items(), key=lambda x: -len(x[0])):
+            if model.startswith(prefix):
+                return window
+        return self.DEFAULT_CONTEXT_WINDOWS[provider]
+
+    def _resolve_input_budget(self, context_window: int) -> int:
+        """
+        Budget de tokens d'entrée: fenêtre moins la sortie réservée, plafonné par
+        AI_CONTEXT_MAX_TOKENS (inutile d'envoyer 1M de tokens à chaque instruction).
+        """
+        # Sur les petites fenêtres (Ollama), la sortie ne peut pas réserver plus de la moitié
+        reserved_output = min(int(os.getenv("AI_MAX_OUTPUT_TOKENS", "8192")), context_window // 2)
+        cap = int(os.getenv("AI_CONTEXT_MAX_TOKENS", "32000"))
+        return max(1024, min(context_window - reserved_output, cap))
 
     def _get_workspace_structure(self) -> str:
-        """Retourne la structure des fichiers du workspace."""
-        structure = []
-        
-        for root, dirs, files in os.walk(self.workspace_path):
-            # Ignorer les dossiers cachés et node_modules, venv, etc.
-            dirs[:] = [d for d in dirs if not d.startswith('.') 
-                       and d not in ['node_modules', 'venv', '__pycache__', '.git']]
-            
-            level = root.replace(self.workspace_path, '').count(os.sep)
-            indent = '  ' * level
-            folder_name = os.path.basename(root) or '.'
-            structure.append(f"{indent}📁 {folder_name}/")
-            
-            sub_indent = '  ' * (level + 1)
-            for file in files:
-                if not file.startswith('.'):
-                    structure.append(f"{sub_indent}📄 {file}")
-        
-        return '\n'.join(structure) if structure else "Répertoire vide"
+        """Retourne la structure des fichiers du workspace (depuis l'index)."""
+        return self.workspace_index.structure()
 
     def _get_file_content(self, file_path: str) -> Optional[str]:
-        """Lit le contenu d'un fichier."""
+        """Lit le contenu d'un fichier (via le cache de lecture ; None si absent, binaire ou trop gros)."""
         full_path = os.path.join(self.workspace_path, file_path)
         try:
-            with open(full_path, 'r', encoding='utf-8') as f:
-                return f.read()
-        except FileNotFoundError:
-            return None
+            content = self.read_cache.read(full_path)
         except Exception as e:
             logger.error(f"Erreur lecture {file_path}: {e}")
             return None
+        if content is None:
+            reason = self.read_cache.skip_reason(full_path)
+            if reason:
+                logger.info(f"⏭️ {file_path} ignoré ({reason})")
+        return content
 
-    def _build_context(self, instruction: str, relevant_files: List[str] = None) -> str:
-        """Construit le contexte pour l'IA."""
+    def _fit_structure(self, max_tokens: int) -> str:
+        """Retourne l'arborescence la plus détaillée qui tient dans `max_tokens`."""
+        max_tokens = max(max_tokens, MIN_STRUCTURE_TOKENS)
+        structure = self._get_workspace_structure()
+        for max_files in (20, 5, 0):
+            if estimate_tokens(structure) <= max_tokens:
+                return structure
+            structure = self.workspace_index.structure(max_files_per_dir=max_files)
+        if estimate_tokens(structure) > max_tokens:
+            cut = int(max_tokens * CHARS_PER_TOKEN)
+            structure = structure[:cut].rsplit("\n", 1)[0] + "\n… (arborescence tronquée)"
+        return structure
+
+    def _build_context(
+        self,
+        instruction: str,
+        relevant_files: List[str] = None,
+        input_budget: Optional[int] = None,
+        session: Optional[ChatSession] = None,
+    ) -> PromptContext:
+        """
+        Construit le contexte pour l'IA dans le budget de tokens du modèle.
+        
+        Ordre stable → volatile: arborescence et règles d'abord (préfixe
+        réutilisable par le cache des providers), fichiers puis instruction à la fin.
+        
+        Pour une instruction de suivi (`session` avec des échanges), le contexte
+        contient l'historique compact, les fichiers touchés par les derniers
+        échanges en entier et, en plan seulement, ceux déjà envoyés et inchangés.
+        """
+        start = time.perf_counter()
         workspace_name = os.path.basename(os.path.abspath(self.workspace_path))
+        budget = (input_budget or self.input_budget) - estimate_tokens(self.SYSTEM_PROMPT) - estimate_tokens(instruction)
+        structure = self._fit_structure(int(budget * STRUCTURE_BUDGET_SHARE))
         context_parts = [
-            f"📂 STRUCTURE DU PROJET (répertoire de travail: {workspace_name}):\n{self._get_workspace_structure()}",
-            f"\n📝 INSTRUCTION UTILISATEUR:\n{instruction}",
+            f"📂 STRUCTURE DU PROJET (répertoire de travail: {workspace_name}):\n{structure}",
             f"\n🚨 RÈGLE ABSOLUE POUR LES CHEMINS DE FICHIERS:",
             f"- Les chemins doivent TOUJOURS commencer directement par le nom du fichier ou un sous-dossier",
             f"- Exemples CORRECTS: 'index.html', 'style.css', 'src/app.py', 'assets/logo.png'",
@@ -222,31 +566,95 @@ Tu travailles sur un projet situé dans le répertoire de travail. Tu as accès
             f"\n💡 AUTRES INSTRUCTIONS:",
             f"- Analyse bien l'instruction, comprends ce qui est demandé, et produit un code de qualité professionnelle."
         ]
-        
-        # Ajouter le contenu des fichiers pertinents
+        instruction_part = f"\n📝 INSTRUCTION UTILISATEUR:\n{instruction}"
+        budget -= estimate_tokens("\n".join(context_parts)) + estimate_tokens(instruction_part)
+
+        max_files = int(os.getenv("AI_CONTEXT_MAX_FILES", "20"))
+        required = list(relevant_files or [])
+        history_part = ""
+        follow_up = session is not None and session.is_follow_up
+        if follow_up:
+            # Suite d'une conversation: les fichiers en cours de travail d'abord, moins de candidats froids
+            required += [p for p in session.working_set() if p not in required and self.workspace_index.file_stat(p)]
+            max_files = min(max_files, int(os.getenv("SESSION_CONTEXT_FILES", "5")))
+            history_part = self._session_history(session)
+            budget -= estimate_tokens(history_part)
+
+        # Fichiers explicites d'abord, sinon les fichiers les plus pertinents pour l'instruction
         if relevant_files:
-            context_parts.append(f"\n📄 FICHIERS PERTINENTS À CONSIDÉRER:")
-            for file_path in relevant_files:
-                content = self._get_file_content(file_path)
-                if content:
-                    context_parts.append(f"\n📄 {file_path}:\n```\n{content}\n```")
-                else:
-                    context_parts.append(f"\n⚠️ {file_path}: fichier non trouvé")
+            title = "📄 FICHIERS PERTINENTS À CONSIDÉRER:"
+            candidates = []
         else:
-            # Si aucun fichier spécifique, inclure les fichiers principaux du projet
-            main_files = self._find_main_files()
-            if main_files:
-                context_parts.append(f"\n📄 FICHIERS PRINCIPAUX DU PROJET:")
-                for file_path in main_files[:5]:  # Limiter à 5 fichiers pour ne pas surcharger
-                    content = self._get_file_content(file_path)
-                    if content:
-                        # Limiter la taille du contenu pour ne pas dépasser les limites
-                        if len(content) > 2000:
-                            content = content[:2000] + "\n... (tronqué)"
-                        context_parts.append(f"\n📄 {file_path}:\n```\n{content}\n```")
-        
-        return "\n".join(context_parts)
+            title = "📄 FICHIERS LES PLUS PERTINENTS:"
+            candidates = self._rank_files(instruction, limit=max_files)
+
+        packer = ContextPacker(
+            budget - estimate_tokens(title),
+            self._get_file_content,
+            symbols=self.symbol_index.get,
+            # Au-delà des N premiers fichiers: plan des symboles + corps des symboles pertinents
+            full_files=int(os.getenv("AI_CONTEXT_FULL_FILES", "3")),
+            already_sent=session.unchanged_since_sent if follow_up else None,
+        )
+        files_text, report = packer.pack(candidates, instruction, required=required)
+        self.last_pack_report = report
+        if session is not None:
+            for packed in report.included:
+                if packed.mode == "full":
+                    content = self._get_file_content(packed.path)
+                    if content is not None:
+                        session.mark_sent(packed.path, content)
+        logger.info(f"📦 Contexte: {report.summary()}")
+        logger.info(f"📖 Cache de lecture: {self.read_cache.summary()}")
+        if report.dropped:
+            logger.info(f"   Écartés (budget): {', '.join(report.dropped)}")
+        volatile_parts = [history_part] if history_part else []
+        if files_text:
+            volatile_parts.append(f"\n{title}")
+            volatile_parts.append(files_text)
+        volatile_parts.append(instruction_part)
+        METRICS.observe("build_context", time.perf_counter() - start)
+        
+        return PromptContext(stable="\n".join(context_parts), volatile="\n".join(volatile_parts))
     
+    def _session_history(self, session: ChatSession) -> str:
+        """Section « suite de conversation »: échanges précédents et fichiers modifiés ailleurs depuis."""
+        text = (
+            "\n🕘 SUITE D'UNE CONVERSATION - échanges précédents (du plus ancien au plus récent):\n"
+            f"{session.history_text()}"
+        )
+        working = set(session.working_set())
+        delta = self.last_index_delta
+        external = [p for p in (delta.added + delta.modified + delta.removed) if p not in working] if delta else []
+        if external:
+            text += f"\n✏️ Modifiés hors du bot depuis le dernier échange: {', '.join(external[:20])}"
+        text += (
+            "\nLes fichiers inchangés depuis le dernier échange sont montrés en plan (symboles, extraits): "
+            "pour les modifier, utilise des patches sur les lignes affichées."
+        )
+        return text
+
+    def _rank_files(self, instruction: str, limit: int = 5) -> List[str]:
+        """
+        Classe les fichiers du workspace par pertinence pour l'instruction.
+        Complète avec les fichiers principaux si l'index lexical ne trouve rien
+        (ou n'est pas encore construit: il n'est jamais attendu).
+        """
+        start = time.perf_counter()
+        if self.relevance_index.ready:
+            ranked = [r.path for r in self.relevance_index.search(instruction, limit=limit)]
+            logger.info(f"🔎 {len(ranked)} fichier(s) pertinent(s) trouvé(s) en {(time.perf_counter() - start) * 1000:.1f} ms")
+        else:
+            ranked = []
+            self.relevance_index.start_background_build()
+            logger.info("🔎 Index de pertinence en construction: fichiers principaux utilisés")
+        for file_path in self._find_main_files():
+            if len(ranked) >= limit:
+                break
+            if file_path not in ranked:
+                ranked.append(file_path)
+        return ranked
+
     def _find_main_files(self) -> List[str]:
         """Trouve les fichiers principaux du projet (index.html, main.py, app.py, etc.)."""
         main_patterns = [
@@ -254,48 +662,170 @@ Tu travailles sur un projet situé dans le répertoire de travail. Tu as accès
             "main.py", "app.py", "main.js", "app.js", "App.jsx", "App.tsx",
             "package.json", "requirements.txt", "README.md"
         ]
-        
-        found_files = []
-        for root, dirs, files in os.walk(self.workspace_path):
-            # Ignorer les dossiers cachés et dépendances
-            if any(skip in root for skip in ['.git', 'node_modules', 'venv', '__pycache__', '.']):
-                continue
-            
-            for file in files:
-                if file in main_patterns:
-                    rel_path = os.path.relpath(os.path.join(root, file), self.workspace_path)
-                    found_files.append(rel_path)
-        
-        return found_files
+        return self.workspace_index.find_by_name(main_patterns)
+
+    def refresh_workspace_index(self) -> IndexDelta:
+        """Met à jour l'index du workspace et mémorise le delta depuis la dernière instruction."""
+        delta = self.workspace_index.refresh()
+        self.relevance_index.update(delta)
+        self.symbol_index.update(delta)
+        self.last_index_delta = delta
+        logger.info(
+            f"📂 Index du workspace: {delta.count} changement(s) depuis la dernière instruction "
+            f"({delta.elapsed_ms:.1f} ms)"
+        )
+        return delta
 
     async def process_instruction(
         self, 
         instruction: str, 
-        relevant_files: List[str] = None
+        relevant_files: List[str] = None,
+        on_operation: Optional[OperationCallback] = None,
+        on_progress: Optional[ProgressCallback] = None,
+        plan: Optional[bool] = None,
+        session: Optional[ChatSession] = None,
     ) -> AIResponse:
         """
         Traite une instruction et retourne les opérations à effectuer.
         
+        La réponse du modèle est lue en streaming: chaque opération est
+        transmise à `on_operation` dès que son objet JSON est complet.
+        En cas de quota, d'erreur serveur ou de délai dépassé, la requête
+        bascule sur le provider suivant de la chaîne.
+        
         Args:
             instruction: L'instruction en langage naturel
             relevant_files: Liste des fichiers à inclure dans le contexte
+            on_operation: Callback async appelé pour chaque FileOperation complète
+            on_progress: Callback async appelé avec le nombre de caractères reçus
+            plan: Planifier puis générer chaque fichier en parallèle (défaut: AI_PLAN_MODE)
+            session: Conversation en cours: une instruction de suivi reçoit l'historique
+                compact et seulement les fichiers qui ont changé depuis l'échange précédent
             
         Returns:
             AIResponse contenant les opérations à effectuer
         """
-        context = self._build_context(instruction, relevant_files or [])
+        # Comparaison des mtimes (jusqu'à un stat par fichier) hors de la boucle asyncio
+        await asyncio.to_thread(self.refresh_workspace_index)
+        slots = order_slots(self.slots, adaptive=self.adaptive_order)
+        # Les appels faits pendant cette instruction lui sont rattachés dans le journal de consommation
+        scope = UsageScope(instruction_id=uuid.uuid4().hex[:12], instruction=instruction)
+        scope_token = CURRENT_SCOPE.set(scope)
+        try:
+            return await self._process_in_scope(
+                instruction, relevant_files, slots, scope, on_operation, on_progress, plan, session
+            )
+        finally:
+            CURRENT_SCOPE.reset(scope_token)
+
+    async def _process_in_scope(
+        self,
+        instruction: str,
+        relevant_files: Optional[List[str]],
+        slots: List[ProviderSlot],
+        scope: UsageScope,
+        on_operation: Optional[OperationCallback],
+        on_progress: Optional[ProgressCallback],
+        plan: Optional[bool],
+        session: Optional[ChatSession],
+    ) -> AIResponse:
+        """Corps de `process_instruction` (cache de réponses, planification ou génération directe)."""
+        if session is not None:
+            session.pending.clear()  # Fichiers envoyés pour un échange précédent qui n'a pas abouti
+        
+        # Un contexte par budget d'entrée (les providers de même fenêtre le partagent),
+        # construit hors de la boucle asyncio (lectures de fichiers, classement)
+        contexts: Dict[int, asyncio.Future] = {}
+
+        async def context_for(slot: ProviderSlot) -> PromptContext:
+            future = contexts.get(slot.input_budget)
+            if future is None:
+                future = contexts[slot.input_budget] = asyncio.ensure_future(asyncio.to_thread(
+                    self._build_context, instruction, relevant_files or [], slot.input_budget, session=session
+                ))
+            # Partagé entre requêtes concurrentes (hedging): l'annulation de l'une ne l'interrompt pas
+            return await asyncio.shield(future)
+
+        context = await context_for(slots[0])
+        if self.last_pack_report:
+            scope.context = self.last_pack_report.summary()
+        
+        # Même instruction sur le même contexte: réponse instantanée depuis le cache
+        cache_key = ResponseCache.make_key(slots[0].provider.value, slots[0].model, instruction, context.text)
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"⚡ Réponse servie depuis le cache ({cache_key[:12]})")
+            response = self._response_from_dict(cached)
+            if on_operation:
+                for op in response.operations:
+                    await on_operation(op)
+            return response
+        
+        if plan is None:
+            plan = self._needs_plan(instruction)
+        if plan:
+            parsed = await self._process_planned(instruction, slots, context_for, on_operation, on_progress)
+        else:
+            parsed = await self._run_generation(slots, context_for, on_operation, on_progress)
+        if parsed.success and not parsed.truncated:
+            self.response_cache.put(cache_key, asdict(parsed))
+        return parsed
+
+    async def _run_generation(
+        self,
+        slots: List[ProviderSlot],
+        context_for: Callable[[ProviderSlot], Awaitable[PromptContext]],
+        on_operation: Optional[OperationCallback] = None,
+        on_progress: Optional[ProgressCallback] = None,
+    ) -> AIResponse:
+        """
+        Une génération complète (chaîne de providers, streaming, continuations)
+        convertie en AIResponse ; les erreurs sont rendues dans la réponse.
+        """
+        state = {"parser": OperationStreamParser(), "emitted": 0}
+
+        async def handle_chunk(chunk: str) -> None:
+            parser = state["parser"]
+            for op in parser.feed(chunk):
+                state["emitted"] += 1
+                if on_operation:
+                    await on_operation(self._operation_from_dict(op))
+            if on_progress:
+                await on_progress(len(parser.text))
+
+        def restart() -> bool:
+            # Bascule possible tant qu'aucune opération n'a été transmise
+            if state["emitted"]:
+                return False
+            state["parser"] = OperationStreamParser()
+            return True
         
         try:
-            if self.provider == AIProvider.ANTHROPIC:
-                response = await self._call_anthropic(context)
-            elif self.provider == AIProvider.GEMINI:
-                response = await self._call_gemini(context)
-            else:
-                # OpenAI, Groq et Ollama utilisent le même format
-                response = await self._call_openai(context)
+            # Annulable: une annulation de la tâche ferme les requêtes HTTP en cours
+            response, usage, slot = await self._generate(slots, context_for, handle_chunk, restart)
             
-            return self._parse_response(response)
+            with METRICS.span("parse_response", slot.label):
+                parsed = self._parse_response(response)
+            parsed.provider = slot.label
+            parsed.usage = usage
+            return parsed
             
+        except ProviderAttemptError as e:
+            if e.kind == "timeout":
+                logger.error(f"Erreur IA: délai de {self.request_timeout:.0f}s dépassé ({e.slot.label})")
+                error = f"Le provider n'a pas répondu en {self.request_timeout:.0f}s (AI_REQUEST_TIMEOUT)"
+            elif e.kind == "invalid_json":
+                error = f"Erreur de parsing: {e.original}\nRéponse: {getattr(e.original, 'doc', '')[:200]}"
+            else:
+                logger.error(f"Erreur IA ({e.slot.label}): {e}")
+                error = str(e)
+            return AIResponse(
+                success=False,
+                operations=[],
+                explanation="",
+                error=error,
+                provider=e.slot.label,
+            )
         except Exception as e:
             logger.error(f"Erreur IA: {e}")
             return AIResponse(
@@ -305,117 +835,781 @@ Tu travailles sur un projet situé dans le répertoire de travail. Tu as accès
                 error=str(e)
             )
 
-    async def _call_anthropic(self, context: str) -> str:
-        """Appelle l'API Anthropic."""
-        import asyncio
-        
-        def sync_call():
-            message = self.client.messages.create(
-                model=self.model,
-                max_tokens=4096,
-                system=self.SYSTEM_PROMPT,
-                messages=[
-                    {"role": "user", "content": context}
-                ]
+    def _needs_plan(self, instruction: str) -> bool:
+        """Indique si l'instruction annonce assez de fichiers pour être planifiée (AI_PLAN_MODE)."""
+        if self.plan_mode == "always":
+            return True
+        if self.plan_mode != "auto":
+            return False
+        for match in PLAN_COUNT_RE.finditer(instruction):
+            if int(match.group(1)) >= self.plan_min_files:
+                return True
+        return bool(PLAN_SCOPE_RE.search(instruction))
+
+    async def _process_planned(
+        self,
+        instruction: str,
+        slots: List[ProviderSlot],
+        context_for: Callable[[ProviderSlot], Awaitable[PromptContext]],
+        on_operation: Optional[OperationCallback] = None,
+        on_progress: Optional[ProgressCallback] = None,
+    ) -> AIResponse:
+        """
+        Génération en deux temps pour les grosses instructions:
+
+        1. plan: une requête courte liste les fichiers à produire (sans contenu) ;
+        2. map: chaque fichier est généré par sa propre requête, en parallèle
+           (AI_PLAN_CONCURRENCY), sur le même contexte (préfixe en cache) et
+           le plan complet pour rester cohérent ;
+        3. reduce: les opérations sont réunies dans une seule AIResponse.
+
+        La durée totale tend vers celle du plan plus le fichier le plus long.
+        """
+        start = time.perf_counter()
+
+        async def plan_context(slot: ProviderSlot) -> PromptContext:
+            context = await context_for(slot)
+            return PromptContext(stable=context.stable, volatile=f"{context.volatile}\n{self.PLAN_PROMPT}")
+
+        stage_token = CURRENT_STAGE.set("plan")
+        try:
+            planned = await self._run_generation(slots, plan_context)
+        finally:
+            CURRENT_STAGE.reset(stage_token)
+        if not planned.success:
+            return planned
+        files = [op for op in planned.operations if op.file_path]
+        if len(files) < 2:
+            # Rien à paralléliser: une génération classique coûte moins cher
+            logger.info("🗺️ Plan d'un seul fichier: génération directe")
+            response = await self._run_generation(slots, context_for, on_operation, on_progress)
+            if response.usage and planned.usage:
+                planned.usage.merge(response.usage)
+                response.usage = planned.usage
+            return response
+
+        plan_text = "\n".join(f"- {op.action} {op.file_path}: {op.description}" for op in files)
+        logger.info(
+            f"🗺️ Plan en {time.perf_counter() - start:.1f}s: {len(files)} fichier(s), "
+            f"{self.plan_concurrency} génération(s) en parallèle"
+        )
+
+        semaphore = asyncio.Semaphore(self.plan_concurrency)
+        received: Dict[int, int] = {}
+        durations: Dict[str, float] = {}
+
+        async def generate_file(index: int, planned_op: FileOperation) -> AIResponse:
+            if planned_op.action == "delete":
+                op = FileOperation(action="delete", file_path=planned_op.file_path, description=planned_op.description)
+                if on_operation:
+                    await on_operation(op)
+                return AIResponse(success=True, operations=[op], explanation="")
+
+            directive = self.PLAN_FILE_PROMPT.format(
+                plan=plan_text,
+                conventions=planned.explanation,
+                action=planned_op.action,
+                file_path=planned_op.file_path,
+                description=planned_op.description,
             )
-            return message.content[0].text
+
+            async def file_context(slot: ProviderSlot) -> PromptContext:
+                context = await context_for(slot)
+                return PromptContext(stable=context.stable, volatile=f"{context.volatile}\n{directive}")
+
+            emitted: List[FileOperation] = []
+
+            async def forward(op: FileOperation) -> None:
+                emitted.append(op)
+                if on_operation:
+                    await on_operation(op)
+
+            async def progress(chars: int) -> None:
+                received[index] = chars
+                if on_progress:
+                    await on_progress(sum(received.values()))
+
+            # Chaque fichier tourne dans sa propre tâche: l'étape ne déborde pas sur les autres
+            CURRENT_STAGE.set("file")
+            async with semaphore:
+                file_start = time.perf_counter()
+                response = await self._run_generation(slots, file_context, forward, progress)
+                durations[planned_op.file_path] = time.perf_counter() - file_start
+            # Opérations que le parser incrémental n'aurait pas vues passer
+            for op in response.operations[len(emitted):]:
+                await forward(op)
+            response.operations = emitted
+            return response
+
+        results = await asyncio.gather(*(generate_file(i, op) for i, op in enumerate(files)))
+
+        operations: List[FileOperation] = []
+        usage = planned.usage or TokenUsage()
+        providers = [planned.provider] if planned.provider else []
+        errors = []
+        truncated = False
+        for planned_op, result in zip(files, results):
+            operations.extend(result.operations)
+            if result.usage:
+                usage.merge(result.usage)
+                usage.continuations += result.usage.continuations
+            if result.provider and result.provider not in providers:
+                providers.append(result.provider)
+            truncated = truncated or result.truncated
+            if not result.success:
+                errors.append(f"{planned_op.file_path}: {result.error}")
+        usage.truncated = any(result.usage.truncated for result in results if result.usage)
+
+        if durations:
+            slowest = max(durations, key=durations.get)
+            logger.info(
+                f"⚡ {len(durations)} fichier(s) générés en {time.perf_counter() - start:.1f}s "
+                f"(le plus long: {slowest} en {durations[slowest]:.1f}s, "
+                f"cumul: {sum(durations.values()):.1f}s)"
+            )
+        return AIResponse(
+            success=not errors,
+            operations=operations,
+            explanation=planned.explanation,
+            error="\n".join(errors) or None,
+            provider=", ".join(providers) or None,
+            usage=usage,
+            truncated=truncated,
+        )
+
+    async def _generate(
+        self,
+        slots: List[ProviderSlot],
+        context_for: Callable[[ProviderSlot], Awaitable[PromptContext]],
+        on_chunk: TextChunkCallback,
+        restart: Callable[[], bool],
+    ):
+        """
+        Parcourt la chaîne de providers jusqu'à obtenir une réponse JSON valide.
+
+        Returns:
+            (texte de la réponse, consommation de tokens, slot qui l'a produite)
+
+        Raises:
+            ProviderAttemptError si aucun provider n'a abouti
+        """
+        remaining = list(slots)
+        while remaining:
+            slot = remaining.pop(0)
+            try:
+                if self.hedge_after > 0 and remaining:
+                    return await self._hedged(slot, remaining, context_for, on_chunk)
+                text, usage = await self._attempt(slot, await context_for(slot), on_chunk)
+                return text, usage, slot
+            except ProviderAttemptError as e:
+                if not e.can_fallback or not remaining or not restart():
+                    raise
+                logger.warning(f"↪️ {e.slot.label} indisponible ({e.kind}), bascule sur {remaining[0].label}")
+        raise RuntimeError("Aucun provider IA disponible")
+
+    async def _hedged(
+        self,
+        primary: ProviderSlot,
+        remaining: List[ProviderSlot],
+        context_for: Callable[[ProviderSlot], Awaitable[PromptContext]],
+        on_chunk: TextChunkCallback,
+    ):
+        """
+        Requête couverte: si `primary` n'a encore rien envoyé après
+        AI_HEDGE_AFTER_SECONDS, le provider suivant est lancé en parallèle.
+        Le premier à streamer devient le meneur (seul son flux est transmis)
+        et l'autre requête est annulée.
+        """
+        tasks: Dict[int, asyncio.Task] = {}
+        slot_of: Dict[asyncio.Task, ProviderSlot] = {}
+        leader: List[ProviderSlot] = []
+
+        def forwarder(slot: ProviderSlot) -> TextChunkCallback:
+            async def forward(chunk: str) -> None:
+                if not leader:
+                    leader.append(slot)
+                    for other, task in tasks.items():
+                        if other != id(slot) and not task.done():
+                            # Le perdant est pénalisé dans le classement adaptatif
+                            slot_of[task].stats.record_failure("slow")
+                            task.cancel()
+                if leader[0] is slot:
+                    await on_chunk(chunk)
+            return forward
+
+        async def attempt(slot: ProviderSlot):
+            return await self._attempt(slot, await context_for(slot), forwarder(slot))
+
+        def launch(slot: ProviderSlot) -> asyncio.Task:
+            task = asyncio.ensure_future(attempt(slot))
+            tasks[id(slot)] = task
+            slot_of[task] = slot
+            return task
+
+        first = launch(primary)
+        try:
+            await asyncio.wait([first], timeout=self.hedge_after)
+            if not first.done() and not leader:
+                backup = remaining.pop(0)
+                logger.info(
+                    f"⏱️ {primary.label} silencieux après {self.hedge_after:.1f}s, "
+                    f"requête couverte vers {backup.label}"
+                )
+                launch(backup)
+
+            pending = set(tasks.values())
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.cancelled():
+                        continue
+                    slot = slot_of[task]
+                    if task.exception() is None:
+                        text, usage = task.result()
+                        return text, usage, slot
+                    if leader and leader[0] is slot:
+                        raise task.exception()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks.values():
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+    async def _attempt(self, slot: ProviderSlot, context: PromptContext, on_chunk: TextChunkCallback) -> Tuple[str, TokenUsage]:
+        """
+        Un appel complet à un provider, validé (JSON lisible) et chronométré.
+        Une réponse coupée par la limite de tokens de sortie est complétée par
+        des requêtes de continuation (AI_MAX_CONTINUATIONS).
+
+        Raises:
+            ProviderAttemptError en cas d'échec (erreur classée pour la bascule)
+        """
+        start = time.perf_counter()
+        usage = TokenUsage()
+        try:
+            response, call_usage = await self._call_with_retries(slot, context, on_chunk)
+            usage.merge(call_usage)
+            while usage.truncated and usage.continuations < self.max_continuations:
+                usage.continuations += 1
+                logger.info(
+                    f"✂️ {slot.label}: réponse coupée à {len(response)} caractères (limite de sortie), "
+                    f"continuation {usage.continuations}/{self.max_continuations}"
+                )
+                # Le pré-remplissage Anthropic refuse les espaces finaux: le modèle les réécrit
+                skip = response[len(response.rstrip()):] if slot.provider == AIProvider.ANTHROPIC else ""
+                stitcher = ContinuationStitcher(response, on_chunk, skip=skip)
+                _, call_usage = await self._call_with_retries(slot, context, stitcher.feed, partial=response)
+                await stitcher.flush()
+                response += stitcher.text
+                usage.merge(call_usage)
+            self._validate_response(response)
+        except Exception as e:
+            kind = classify_error(e)
+            cooldown = self.provider_cooldown if kind in ("quota", "server") else 0.0
+            slot.stats.record_failure(kind, cooldown)
+            logger.warning(f"⚠️ {slot.label}: échec ({kind}) après {time.perf_counter() - start:.1f}s: {e}")
+            raise ProviderAttemptError(slot, kind, e) from e
+        elapsed = time.perf_counter() - start
+        slot.stats.record_success(elapsed)
+        logger.info(f"✅ Réponse de {slot.label} en {elapsed:.1f}s ({usage.summary()})")
+        return response, usage
+
+    async def _call_with_retries(
+        self,
+        slot: ProviderSlot,
+        context: PromptContext,
+        on_chunk: TextChunkCallback,
+        partial: Optional[str] = None,
+    ) -> Tuple[str, TokenUsage]:
+        """
+        Un appel au provider, via son limiteur de débit, réessayé avec backoff
+        sur les erreurs transitoires tant que rien n'a été streamé.
+
+        Args:
+            partial: Texte déjà produit (requête de continuation)
+        """
+        limiter = slot.limiter
+        estimated = estimate_tokens(self.SYSTEM_PROMPT) + estimate_tokens(context.text) + estimate_tokens(partial or "")
+        attempt = 0
+        while True:
+            usage = TokenUsage()
+            call_start = time.perf_counter()
+
+            async def timed_chunk(chunk: str) -> None:
+                if usage.first_token_ms is None:
+                    usage.first_token_ms = (time.perf_counter() - call_start) * 1000
+                await on_chunk(chunk)
+
+            waited = await limiter.acquire(estimated)
+            if limiter.enabled:
+                METRICS.observe("rate_limit_wait", waited, slot.label)
+            call_start = time.perf_counter()
+            try:
+                with METRICS.span("provider_call", slot.label):
+                    response = await asyncio.wait_for(
+                        self._call_slot(slot, context, timed_chunk, usage, partial), timeout=self.request_timeout
+                    )
+                if usage.first_token_ms is not None:
+                    METRICS.observe("first_token", usage.first_token_ms / 1000, slot.label)
+                self._record_usage(slot, usage, estimated, call_start, partial)
+                break
+            except Exception as e:
+                kind = classify_error(e)
+                self._record_usage(slot, usage, estimated, call_start, partial, error=kind)
+                delay = self._retry_delay(e, kind, attempt, usage)
+                if delay is None:
+                    if kind == "quota" and retry_after(e):
+                        limiter.pause(retry_after(e))
+                    raise
+                attempt += 1
+                limiter.retries += 1
+                logger.warning(f"🔁 {slot.label}: {kind}, nouvel essai {attempt}/{self.max_retries} dans {delay:.1f}s")
+                if kind == "quota":
+                    # Tous les appels à ce provider attendent (le limiteur applique la pause)
+                    limiter.pause(delay)
+                else:
+                    await asyncio.sleep(delay)
+        limiter.record_usage(usage.input_tokens + usage.output_tokens, estimated)
+        return response, usage
+
+    def _record_usage(
+        self,
+        slot: ProviderSlot,
+        usage: TokenUsage,
+        estimated: int,
+        call_start: float,
+        partial: Optional[str],
+        error: Optional[str] = None,
+    ) -> None:
+        """Inscrit un appel au journal de consommation, rattaché à l'instruction en cours."""
+        scope = CURRENT_SCOPE.get()
+        self.usage_store.record(UsageRecord(
+            provider=slot.provider.value,
+            model=slot.model,
+            input_tokens=usage.input_tokens,
+            output_tokens=usage.output_tokens,
+            cached_tokens=usage.cached_tokens,
+            cache_write_tokens=usage.cache_write_tokens,
+            estimated_tokens=estimated,
+            duration_ms=(time.perf_counter() - call_start) * 1000,
+            first_token_ms=usage.first_token_ms,
+            success=error is None,
+            error=error,
+            stage="continuation" if partial else CURRENT_STAGE.get(),
+            instruction_id=scope.instruction_id if scope else "",
+            instruction=scope.instruction if scope else "",
+            context=scope.context if scope else "",
+        ))
+
+    def _validate_response(self, response: str) -> None:
+        """
+        Vérifie que la réponse est exploitable: JSON valide, ou à défaut JSON
+        tronqué dont au moins une opération complète est récupérable.
+
+        Raises:
+            json.JSONDecodeError si rien n'est récupérable
+        """
+        try:
+            self._load_json(response)
+        except json.JSONDecodeError:
+            if recover_response(response) is None:
+                raise
+
+    def _retry_delay(self, error: BaseException, kind: str, attempt: int, usage: TokenUsage) -> Optional[float]:
+        """
+        Délai avant un nouvel essai sur le même provider, ou None s'il faut
+        abandonner (erreur non transitoire, essais épuisés, flux déjà commencé,
+        ou Retry-After trop long: mieux vaut basculer sur un autre provider).
+        """
+        if kind not in RETRYABLE_ERRORS or attempt >= self.max_retries or usage.first_token_ms is not None:
+            return None
+        delay = retry_after(error)
+        if delay is None:
+            delay = backoff_delay(attempt, self.retry_base_delay, self.retry_max_wait)
+        if delay > self.retry_max_wait:
+            return None
+        return delay
+
+    def _call_slot(
+        self,
+        slot: ProviderSlot,
+        context: PromptContext,
+        on_chunk: TextChunkCallback,
+        usage: TokenUsage,
+        partial: Optional[str] = None,
+    ) -> Awaitable[str]:
+        """Appel de l'API propre au provider du slot."""
+        if slot.provider == AIProvider.ANTHROPIC:
+            return self._call_anthropic(slot, context, on_chunk, usage, partial)
+        if slot.provider == AIProvider.GEMINI:
+            return self._call_gemini(slot, context, on_chunk, usage, partial)
+        # OpenAI, Groq et Ollama utilisent le même format
+        return self._call_openai(slot, context, on_chunk, usage, partial)
+
+    def provider_stats(self) -> List[Dict[str, Any]]:
+        """Statistiques observées de chaque provider de la chaîne."""
+        return [
+            {
+                "provider": slot.label,
+                "calls": slot.stats.calls,
+                "failures": slot.stats.failures,
+                "latency_s": slot.stats.ewma_latency,
+                "failure_rate": slot.stats.failure_rate,
+                "in_cooldown": slot.stats.in_cooldown,
+                "errors": dict(slot.stats.errors_by_kind),
+                "rate_limit": slot.limiter.stats(),
+            }
+            for slot in self.slots
+        ]
+
+    async def regenerate_files(self, instruction: str, file_paths: List[str]) -> AIResponse:
+        """
+        Redemande le contenu complet de fichiers dont le patch n'a pas pu être appliqué.
         
-        return await asyncio.get_event_loop().run_in_executor(None, sync_call)
+        Args:
+            instruction: Instruction d'origine
+            file_paths: Fichiers à réécrire entièrement
+        """
+        files = ", ".join(file_paths)
+        retry_instruction = (
+            f"{instruction}\n\n"
+            f"⚠️ Les blocs \"patch\" proposés pour {files} ne correspondent pas au contenu actuel. "
+            f"Réponds uniquement avec des opérations \"modify\" contenant le contenu COMPLET de: {files}."
+        )
+        response = await self.process_instruction(retry_instruction, relevant_files=file_paths, plan=False)
+        wanted = {self._normalize_file_path(p) for p in file_paths}
+        response.operations = [
+            op for op in response.operations
+            if op.action == "modify" and self._normalize_file_path(op.file_path) in wanted
+        ]
+        return response
 
-    async def _call_openai(self, context: str) -> str:
-        """Appelle l'API OpenAI (utilisé aussi pour Groq et Ollama)."""
-        import asyncio
+    async def repair_files(
+        self, instruction: str, errors: Dict[str, str], rejected: Optional[Dict[str, str]] = None,
+    ) -> AIResponse:
+        """
+        Redemande seulement les fichiers générés avec une erreur de syntaxe.
         
+        Args:
+            instruction: Instruction d'origine
+            errors: Chemin -> erreur de validation (avec la ligne fautive)
+            rejected: Chemin -> contenu refusé (jamais écrit: absent du contexte lu sur le disque)
+        """
+        details = "\n".join(f"- {path}: {error}" for path, error in errors.items())
+        contents = "".join(
+            f"\n--- {path} (refusé) ---\n{content}\n"
+            for path, content in (rejected or {}).items()
+            if content is not None
+        )
+        repair_instruction = (
+            f"{instruction}\n\n"
+            f"⚠️ Les fichiers générés pour cette instruction contiennent des erreurs de syntaxe et n'ont pas été "
+            f"écrits:\n{details}\n{contents}"
+            f"Réponds uniquement avec des opérations \"create\" ou \"modify\" contenant le contenu COMPLET et "
+            f"corrigé de: {', '.join(errors)}."
+        )
+        response = await self.process_instruction(repair_instruction, relevant_files=list(errors), plan=False)
+        wanted = {self._normalize_file_path(p) for p in errors}
+        response.operations = [
+            op for op in response.operations
+            if op.action in ("create", "modify") and self._normalize_file_path(op.file_path) in wanted
+        ]
+        return response
+
+    async def _call_anthropic(
+        self,
+        slot: ProviderSlot,
+        context: PromptContext,
+        on_chunk: Optional[TextChunkCallback] = None,
+        usage: Optional[TokenUsage] = None,
+        partial: Optional[str] = None,
+    ) -> str:
+        """
+        Appelle l'API Anthropic (client async, streaming, cache de préfixe).
+        En continuation, la réponse partielle pré-remplit le tour de l'assistant.
+        """
+        system: Any = self.SYSTEM_PROMPT
+        content: Any = context.text
+        if self.prompt_cache:
+            # Points de cache après le prompt système et après la partie stable du contexte
+            system = [{"type": "text", "text": self.SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}]
+            content = [
+                {"type": "text", "text": context.stable, "cache_control": {"type": "ephemeral"}},
+                {"type": "text", "text": context.volatile},
+            ]
+        messages = [
+            {"role": "user", "content": content}
+        ]
+        if partial:
+            messages.append({"role": "assistant", "content": partial.rstrip()})
+        parts = []
+        async with slot.client.messages.stream(
+            model=slot.model,
+            max_tokens=int(os.getenv("AI_MAX_OUTPUT_TOKENS", "8192")),
+            system=system,
+            messages=messages,
+        ) as stream:
+            async for text in stream.text_stream:
+                parts.append(text)
+                if on_chunk:
+                    await on_chunk(text)
+            final = await stream.get_final_message()
+        if usage is not None and final.usage is not None:
+            usage.cached_tokens = getattr(final.usage, "cache_read_input_tokens", None) or 0
+            usage.cache_write_tokens = getattr(final.usage, "cache_creation_input_tokens", None) or 0
+            # input_tokens n'inclut pas les tokens lus ou écrits dans le cache
+            usage.input_tokens = (final.usage.input_tokens or 0) + usage.cached_tokens + usage.cache_write_tokens
+            usage.output_tokens = final.usage.output_tokens or 0
+        if usage is not None:
+            usage.truncated = final.stop_reason == "max_tokens"
+        return "".join(parts)
+
+    async def _call_openai(
+        self,
+        slot: ProviderSlot,
+        context: PromptContext,
+        on_chunk: Optional[TextChunkCallback] = None,
+        usage: Optional[TokenUsage] = None,
+        partial: Optional[str] = None,
+    ) -> str:
+        """
+        Appelle l'API OpenAI en streaming (client async, utilisé aussi pour Groq et Ollama).
+        Le cache de préfixe d'OpenAI est automatique: il suffit que le début du prompt soit stable.
+        """
         # Paramètres améliorés pour de meilleurs résultats
         temperature = float(os.getenv("AI_TEMPERATURE", "0.7"))  # 0.7 = équilibre créativité/précision
         max_tokens = int(os.getenv("AI_MAX_OUTPUT_TOKENS", "8192"))  # Plus de tokens pour des réponses complètes
         
-        def sync_call():
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": self.SYSTEM_PROMPT},
-                    {"role": "user", "content": context}
-                ],
-                max_tokens=max_tokens,
-                temperature=temperature,
-                top_p=0.9,  # Nucleus sampling pour plus de diversité
-                response_format={"type": "json_object"}
-            )
-            return response.choices[0].message.content
+        extra: Dict[str, Any] = {}
+        if slot.provider in (AIProvider.OPENAI, AIProvider.OLLAMA):
+            # Dernier morceau du flux avec la consommation (dont les tokens en cache)
+            extra["stream_options"] = {"include_usage": True}
         
-        return await asyncio.get_event_loop().run_in_executor(None, sync_call)
+        messages = [
+            {"role": "system", "content": self.SYSTEM_PROMPT},
+            {"role": "user", "content": context.text}
+        ]
+        if partial:
+            messages.append({"role": "assistant", "content": partial})
+            messages.append({"role": "user", "content": self.CONTINUATION_PROMPT})
+        else:
+            # Le mode JSON forcerait un nouvel objet complet: seulement pour la première requête
+            extra["response_format"] = {"type": "json_object"}
+        
+        parts = []
+        stream = await slot.client.chat.completions.create(
+            model=slot.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            top_p=0.9,  # Nucleus sampling pour plus de diversité
+            stream=True,
+            **extra,
+        )
+        async with stream:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    text = chunk.choices[0].delta.content
+                    parts.append(text)
+                    if on_chunk:
+                        await on_chunk(text)
+                if usage is not None:
+                    if chunk.choices and chunk.choices[0].finish_reason:
+                        usage.truncated = chunk.choices[0].finish_reason == "length"
+                    self._read_openai_usage(chunk, usage)
+        return "".join(parts)
+
+    @staticmethod
+    def _read_openai_usage(chunk, usage: TokenUsage) -> None:
+        """Relève la consommation d'un morceau de flux OpenAI (ou `x_groq.usage` pour Groq)."""
+        data = getattr(chunk, "usage", None)
+        if data is None:
+            x_groq = getattr(chunk, "x_groq", None)
+            data = x_groq.get("usage") if isinstance(x_groq, dict) else getattr(x_groq, "usage", None)
+        if not data:
+            return
+        if not isinstance(data, dict):
+            data = data.model_dump() if hasattr(data, "model_dump") else vars(data)
+        usage.input_tokens = data.get("prompt_tokens") or 0
+        usage.output_tokens = data.get("completion_tokens") or 0
+        details = data.get("prompt_tokens_details") or {}
+        usage.cached_tokens = details.get("cached_tokens") or 0
 
-    async def _call_gemini(self, context: str) -> str:
-        """Appelle l'API Google Gemini."""
-        import asyncio
+    async def _gemini_model(self, slot: ProviderSlot, context: PromptContext):
+        """
+        Modèle Gemini à utiliser: adossé à un CachedContent contenant le prompt
+        système et la partie stable du contexte quand celle-ci est assez grande
+        (GEMINI_CACHE_MIN_TOKENS), sinon le modèle de base.
+        
+        Returns:
+            (modèle, True si la partie stable est déjà dans le cache)
+        """
+        min_tokens = int(os.getenv("GEMINI_CACHE_MIN_TOKENS", "4096"))
+        if (
+            not self.prompt_cache
+            or slot.model in self._gemini_cache_failed
+            or estimate_tokens(self.SYSTEM_PROMPT) + estimate_tokens(context.stable) < min_tokens
+        ):
+            return slot.client, False
+        
+        fingerprint = hashlib.sha256(context.stable.encode("utf-8")).hexdigest()
+        cached = self._gemini_caches.get(slot.model)
+        # Marge de 30 s pour ne pas utiliser un cache sur le point d'expirer
+        if cached and cached[0] == fingerprint and cached[1] - 30 > time.time():
+            return cached[2], True
+        
+        import google.generativeai as genai
+        from google.generativeai import caching
+        try:
+            # Appel bloquant du SDK: exécuté hors de la boucle asyncio
+            content = await asyncio.to_thread(
+                caching.CachedContent.create,
+                model=slot.model,
+                system_instruction=self.SYSTEM_PROMPT,
+                contents=[context.stable],
+                ttl=datetime.timedelta(seconds=self.prompt_cache_ttl),
+            )
+        except Exception as e:
+            # Modèle ou offre sans cache explicite: ne plus réessayer pour ce modèle
+            logger.warning(f"⚠️ Cache de contexte Gemini indisponible pour {slot.model}: {e}")
+            self._gemini_cache_failed.add(slot.model)
+            return slot.client, False
+        model = genai.GenerativeModel.from_cached_content(content)
+        self._gemini_caches[slot.model] = (fingerprint, time.time() + self.prompt_cache_ttl, model)
+        logger.info(f"🧊 Cache de contexte Gemini créé ({self.prompt_cache_ttl}s)")
+        return model, True
+
+    async def _call_gemini(
+        self,
+        slot: ProviderSlot,
+        context: PromptContext,
+        on_chunk: Optional[TextChunkCallback] = None,
+        usage: Optional[TokenUsage] = None,
+        partial: Optional[str] = None,
+    ) -> str:
+        """Appelle l'API Google Gemini (generate_content_async, streaming, cache de contexte)."""
         try:
             # google.api_core n'est pas toujours présent selon les versions
             from google.api_core.exceptions import ResourceExhausted  # type: ignore
         except Exception:  # pragma: no cover
             ResourceExhausted = None  # type: ignore
         
-        full_prompt = f"{self.SYSTEM_PROMPT}\n\n{context}"
         max_out = int(os.getenv("AI_MAX_OUTPUT_TOKENS", "8192"))  # Plus de tokens pour Gemini aussi
         temperature = float(os.getenv("AI_TEMPERATURE", "0.7"))
         
-        def sync_call():
-            try:
-                response = self.client.generate_content(
-                    full_prompt,
-                    generation_config={
-                        "response_mime_type": "application/json",
-                        "max_output_tokens": max_out,
-                        "temperature": temperature,  # Ajouter température pour Gemini
-                        "top_p": 0.9,
-                    },
-                )
+        parts = []
+        try:
+            model, prefix_cached = await self._gemini_model(slot, context)
+            # Avec un CachedContent, seule la partie volatile est envoyée
+            prompt: Any = context.volatile if prefix_cached else context.text
+            generation_config = {
+                "max_output_tokens": max_out,
+                "temperature": temperature,  # Ajouter température pour Gemini
+                "top_p": 0.9,
+            }
+            if partial:
+                # Continuation: la réponse partielle devient le tour du modèle
+                prompt = [
+                    {"role": "user", "parts": [prompt]},
+                    {"role": "model", "parts": [partial]},
+                    {"role": "user", "parts": [self.CONTINUATION_PROMPT]},
+                ]
+            else:
+                generation_config["response_mime_type"] = "application/json"
+            response = await model.generate_content_async(
+                prompt,
+                generation_config=generation_config,
+                stream=True,
+                request_options={"timeout": self.request_timeout},
+            )
+            async for chunk in response:
+                text = self._gemini_chunk_text(chunk)
+                if text:
+                    parts.append(text)
+                    if on_chunk:
+                        await on_chunk(text)
+                metadata = getattr(chunk, "usage_metadata", None)
+                if usage is not None and metadata is not None:
+                    usage.input_tokens = getattr(metadata, "prompt_token_count", 0) or 0
+                    usage.output_tokens = getattr(metadata, "candidates_token_count", 0) or 0
+                    usage.cached_tokens = getattr(metadata, "cached_content_token_count", 0) or 0
+                candidates = getattr(chunk, "candidates", None) or []
+                finish_reason = getattr(candidates[0], "finish_reason", None) if candidates else None
+                if usage is not None and finish_reason:
+                    usage.truncated = getattr(finish_reason, "name", str(finish_reason)) == "MAX_TOKENS"
+        except Exception as e:
+            msg = str(e)
+            # Message plus actionnable en cas de quota
+            if (ResourceExhausted and isinstance(e, ResourceExhausted)) or ("Quota exceeded" in msg) or ("ResourceExhausted" in msg) or ("429" in msg):
+                raise RuntimeError(
+                    "Quota Gemini dépassé. Essaie un modèle compatible free-tier via `GEMINI_MODEL=models/gemini-flash-lite-latest` "
+                    "ou active la facturation sur ton projet Google Cloud."
+                ) from e
+            raise
+        return "".join(parts)
 
-                # `response.text` peut échouer selon finish_reason, on tente une extraction robuste.
-                try:
-                    return response.text
-                except Exception:
-                    candidates = getattr(response, "candidates", None) or []
-                    if candidates:
-                        content = getattr(candidates[0], "content", None)
-                        parts = getattr(content, "parts", None) or []
-                        if parts and hasattr(parts[0], "text"):
-                            return parts[0].text
-                    raise
-            except Exception as e:
-                msg = str(e)
-                # Message plus actionnable en cas de quota
-                if (ResourceExhausted and isinstance(e, ResourceExhausted)) or ("Quota exceeded" in msg) or ("ResourceExhausted" in msg) or ("429" in msg):
-                    raise RuntimeError(
-                        "Quota Gemini dépassé. Essaie un modèle compatible free-tier via `GEMINI_MODEL=models/gemini-flash-lite-latest` "
-                        "ou active la facturation sur ton projet Google Cloud."
-                    ) from e
-                raise
-        
-        return await asyncio.get_event_loop().run_in_executor(None, sync_call)
+    @staticmethod
+    def _gemini_chunk_text(chunk) -> str:
+        """Texte d'un morceau Gemini (`chunk.text` peut échouer selon finish_reason)."""
+        try:
+            return chunk.text
+        except Exception:
+            candidates = getattr(chunk, "candidates", None) or []
+            if candidates:
+                content = getattr(candidates[0], "content", None)
+                parts = getattr(content, "parts", None) or []
+                return "".join(getattr(part, "text", "") for part in parts)
+            return ""
+
+    def _response_from_dict(self, data: Dict[str, Any]) -> AIResponse:
+        """Reconstruit une AIResponse sérialisée (cache)."""
+        usage = data.get("usage")
+        if isinstance(usage, dict):
+            known = {f.name for f in fields(TokenUsage)}
+            usage = TokenUsage(**{k: v for k, v in usage.items() if k in known})
+        return AIResponse(
+            success=data.get("success", False),
+            operations=[self._operation_from_dict(op) for op in data.get("operations", [])],
+            explanation=data.get("explanation", ""),
+            error=data.get("error"),
+            provider=data.get("provider"),
+            usage=usage if isinstance(usage, TokenUsage) else None,
+            truncated=bool(data.get("truncated", False)),
+        )
+
+    @staticmethod
+    def _operation_from_dict(op: Dict[str, Any]) -> FileOperation:
+        """Construit une FileOperation à partir d'un objet JSON de la réponse."""
+        return FileOperation(
+            action=op.get("action", "modify"),
+            file_path=op.get("file_path", ""),
+            content=op.get("content"),
+            description=op.get("description", ""),
+            patches=op.get("patches"),
+            diff=op.get("diff"),
+        )
+
+    @staticmethod
+    def _load_json(response_text: str) -> Any:
+        """Décode la réponse JSON de l'IA (en retirant un éventuel bloc ```json)."""
+        response_text = response_text.strip()
+        if response_text.startswith("```json"):
+            response_text = response_text[7:]
+        if response_text.startswith("```"):
+            response_text = response_text[3:]
+        if response_text.endswith("```"):
+            response_text = response_text[:-3]
+        return json.loads(response_text.strip())
 
     def _parse_response(self, response_text: str) -> AIResponse:
         """Parse la réponse JSON de l'IA."""
         try:
-            # Nettoyer la réponse si nécessaire
-            response_text = response_text.strip()
-            if response_text.startswith("```json"):
-                response_text = response_text[7:]
-            if response_text.startswith("```"):
-                response_text = response_text[3:]
-            if response_text.endswith("```"):
-                response_text = response_text[:-3]
-            
-            data = json.loads(response_text.strip())
+            data = self._load_json(response_text)
             
-            operations = []
-            for op in data.get("operations", []):
-                operations.append(FileOperation(
-                    action=op.get("action", "modify"),
-                    file_path=op.get("file_path", ""),
-                    content=op.get("content"),
-                    description=op.get("description", "")
-                ))
+            operations = [self._operation_from_dict(op) for op in data.get("operations", [])]
             
             return AIResponse(
                 success=data.get("success", False),
@@ -425,6 +1619,20 @@ Tu travailles sur un projet situé dans le répertoire de travail. Tu as accès
             )
             
         except json.JSONDecodeError as e:
+            # JSON tronqué: garder toutes les opérations complètes
+            recovered = recover_response(response_text)
+            if recovered is not None:
+                operations = [self._operation_from_dict(op) for op in recovered["operations"]]
+                logger.warning(f"⚠️ JSON incomplet ({e}): {len(operations)} opération(s) complète(s) récupérée(s)")
+                return AIResponse(
+                    success=True,
+                    operations=operations,
+                    explanation=(
+                        f"⚠️ Réponse tronquée: {len(operations)} opération(s) complète(s) récupérée(s).\n"
+                        f"{recovered['explanation']}"
+                    ),
+                    truncated=True,
+                )
             logger.error(f"Erreur parsing JSON: {e}")
             return AIResponse(
                 success=False,
@@ -469,17 +1677,45 @@ Tu travailles sur un projet situé dans le répertoire de travail. Tu as accès
         
         return path
 
-    def apply_operations(self, operations: List[FileOperation]) -> List[Dict[str, Any]]:
+    def checks_syntax(self, op: FileOperation) -> bool:
         """
-        Applique les opérations sur les fichiers.
+        Vrai si l'opération porte sur un fichier dont la syntaxe est vérifiée
+        avant écriture: le bot la garde pour le lot final, validé en une fois
+        (suppressions comprises, pour garder l'ordre des opérations d'un chemin).
+        """
+        if self.validate_mode not in ("repair", "warn"):
+            return False
+        return self.validator.supports(self._normalize_file_path(op.file_path))
+
+    def apply_operations(self, operations: List[FileOperation], journal: Optional[ChangeJournal] = None) -> List[Dict[str, Any]]:
+        """
+        Applique les opérations sur les fichiers, en un seul lot atomique.
+        
+        Les nouveaux contenus sont d'abord calculés (patches compris), puis
+        écrits en parallèle dans des fichiers temporaires et validés par
+        renommage: soit tout le lot est appliqué, soit rien ne change. Un patch
+        non ancrable n'annule pas le lot: il est signalé (`patch_failed`) pour
+        être régénéré. Le bot applique les opérations au fil du streaming, par
+        petits lots: à l'échelle de l'instruction, c'est le journal qui rend
+        l'ensemble annulable (rollback_operations).
         
         Args:
             operations: Liste des opérations à appliquer
+            journal: Journal de l'instruction, qui reçoit la pré-image de chaque
+                fichier avant sa première modification (annulation sans git)
             
         Returns:
             Liste des résultats pour chaque opération
         """
+        with METRICS.span("apply_operations"), self._apply_lock:
+            results = self._apply_batch(operations, journal)
+        self.workspace_index.mark_changed(r["file"] for r in results)
+        return results
+
+    def _apply_batch(self, operations: List[FileOperation], journal: Optional[ChangeJournal]) -> List[Dict[str, Any]]:
         results = []
+        batch = WriteBatch()
+        pending: Dict[str, Optional[str]] = {}  # chemin absolu -> contenu (None = suppression)
         
         for op in operations:
             # Normaliser le chemin pour éviter les sous-dossiers récursifs
@@ -490,23 +1726,34 @@ Tu travailles sur un projet situé dans le répertoire de travail. Tu as accès
             
             try:
                 if op.action == "delete":
-                    if os.path.exists(full_path):
-                        os.remove(full_path)
-                        result["success"] = True
-                        logger.info(f"🗑️ Supprimé: {op.file_path}")
+                    exists = pending[full_path] is not None if full_path in pending else os.path.isfile(full_path)
+                    if exists:
+                        pending[full_path] = None
                     else:
                         result["error"] = "Fichier non trouvé"
                         
+                elif op.action == "patch":
+                    # Un fichier déjà modifié dans ce lot est patché sur sa nouvelle version
+                    content = pending[full_path] if full_path in pending else self._get_file_content(normalized_path)
+                    if content is None:
+                        reason = self.read_cache.skip_reason(full_path) if os.path.isfile(full_path) else None
+                        if reason:
+                            raise ValueError(f"Fichier non patchable ({reason}): {normalized_path}")
+                        raise FileNotFoundError(f"Fichier à patcher introuvable: {normalized_path}")
+                    try:
+                        new_content, methods = apply_patches(content, op.patches, op.diff)
+                        logger.info(f"🩹 Patch: {op.file_path} ({', '.join(methods)})")
+                    except PatchError as e:
+                        if op.content is None:
+                            result["patch_failed"] = True
+                            raise
+                        # Repli sur le contenu complet fourni avec le patch
+                        logger.warning(f"⚠️ Patch non applicable sur {op.file_path} ({e}), contenu complet utilisé")
+                        new_content = op.content
+                    pending[full_path] = new_content
+
                 elif op.action in ["create", "modify"]:
-                    # Créer les dossiers parents si nécessaire
-                    os.makedirs(os.path.dirname(full_path), exist_ok=True)
-                    
-                    with open(full_path, 'w', encoding='utf-8') as f:
-                        f.write(op.content or "")
-                    
-                    result["success"] = True
-                    emoji = "📝" if op.action == "modify" else "✨"
-                    logger.info(f"{emoji} {op.action.capitalize()}: {op.file_path}")
+                    pending[full_path] = op.content or ""
                     
                 else:
                     result["error"] = f"Action inconnue: {op.action}"
@@ -515,15 +1762,115 @@ Tu travailles sur un projet situé dans le répertoire de travail. Tu as accès
                 result["error"] = str(e)
                 logger.error(f"❌ Erreur {op.action} {op.file_path}: {e}")
             
+            result["_path"] = full_path
             results.append(result)
         
+        if any(r["error"] and not r.get("patch_failed") for r in results):
+            return self._finish_results(results, "Annulé: une autre opération du lot a échoué")
+        
+        if self.validate_mode in ("repair", "warn"):
+            self._validate_pending(results, pending)
+        
+        for full_path, content in pending.items():
+            if content is not None:
+                batch.writes[full_path] = content
+            elif os.path.isfile(full_path):
+                batch.deletes.append(full_path)
+        
+        if batch:
+            journaled = []
+            if journal is not None:
+                journaled = [path for path in list(batch.writes) + batch.deletes if path not in journal]
+                for path in journaled:
+                    journal.record(path, deleting=path in batch.deletes)
+            try:
+                stats = self.file_writer.commit(batch)
+            except BatchWriteError as e:
+                if journal is not None:
+                    journal.forget(journaled)
+                logger.error(f"❌ Lot d'écriture annulé, aucun fichier modifié: {e}")
+                for r in results:
+                    if not r["error"] and r["_path"] in e.errors:
+                        r["error"] = e.errors[r["_path"]]
+                return self._finish_results(results, "Annulé: l'écriture du lot a échoué")
+            for path in list(batch.writes) + batch.deletes:
+                self.read_cache.invalidate(path)
+            self.last_write_stats = stats
+            logger.info(f"💾 Lot écrit: {stats.summary()}")
+        
+        emojis = {"create": "✨", "modify": "📝", "patch": "🩹", "delete": "🗑️"}
+        for r in results:
+            if not r["error"]:
+                r["success"] = True
+                if r["action"] != "patch":
+                    logger.info(f"{emojis[r['action']]} {r['action'].capitalize()}: {r['file']}")
+        return self._finish_results(results)
+
+    def _validate_pending(self, results: List[Dict[str, Any]], pending: Dict[str, Optional[str]]) -> None:
+        """
+        Vérifie la syntaxe des contenus à écrire. En mode "repair", un fichier
+        invalide est retiré du lot et signalé (`validation_failed`, contenu
+        refusé dans `rejected_content`) pour une correction ciblée, sans
+        annuler les autres fichiers du lot. Un fichier dont la version actuelle
+        est déjà invalide pour le vérificateur est écrit sans blocage.
+        """
+        files = {
+            r["file"]: pending[r["_path"]]
+            for r in results
+            if not r["error"] and pending.get(r["_path"]) is not None
+        }
+        if not files:
+            return
+        start = time.perf_counter()
+        errors = self.validator.validate(files)
+        # Un fichier déjà invalide avant l'instruction (HTML toléré par les navigateurs…) n'est pas bloqué
+        previous = {}
+        for path in errors:
+            content = self._get_file_content(path)
+            if content is not None:
+                previous[path] = content
+        tolerated = set(self.validator.validate(previous)) if previous else set()
+        METRICS.observe("validate", time.perf_counter() - start)
+        for r in results:
+            error = errors.get(r["file"])
+            if error is None or r["error"] or r["action"] == "delete":
+                continue
+            if r["file"] in tolerated:
+                logger.info(f"🧪 {r['file']} était déjà invalide avant l'instruction, écrit sans blocage")
+                continue
+            if self.validate_mode == "warn":
+                r["warning"] = error
+                logger.warning(f"⚠️ Syntaxe invalide écrite quand même: {r['file']}: {error.splitlines()[0]}")
+                continue
+            r["error"] = f"Syntaxe invalide: {error}"
+            r["validation_failed"] = True
+            r["rejected_content"] = pending.pop(r["_path"], None)
+            logger.warning(f"🧪 Syntaxe invalide, fichier non écrit: {r['file']}: {error.splitlines()[0]}")
+
+    @staticmethod
+    def _finish_results(results: List[Dict[str, Any]], cancelled: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Retire les champs internes et marque les opérations non appliquées d'un lot annulé."""
+        for r in results:
+            r.pop("_path", None)
+            if cancelled and not r["error"]:
+                r["error"] = cancelled
         return results
 
-    def rollback_operations(self, operations: List[FileOperation]) -> None:
+    def rollback_operations(self, operations: List[FileOperation], journal: Optional[ChangeJournal] = None) -> None:
         """
         Annule les opérations en cas d'erreur.
-        Supprime les fichiers créés, restaure les fichiers modifiés via git.
+        
+        Avec le journal de l'instruction, seuls les chemins touchés sont remis
+        dans leur état d'origine (créés supprimés, modifiés et supprimés
+        restaurés). Sans journal, seuls les fichiers créés sont supprimés.
         """
+        self.workspace_index.mark_changed(self._normalize_file_path(op.file_path) for op in operations)
+        if journal is not None:
+            with self._apply_lock:
+                restored = journal.rollback()
+            logger.info(f"↩️ Rollback: {len(restored)} fichier(s) restauré(s)")
+            return
+        
         for op in operations:
             full_path = os.path.join(self.workspace_path, op.file_path)
             
@@ -0,0 +1,287 @@
+"""
+Écriture atomique par lots - Fichiers temporaires + fsync + renommage, en parallèle, tout ou rien
+"""
+
+import os
+import stat
+import time
+import shutil
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+# Droits par défaut d'un nouveau fichier (comme open(..., 'w')), calculés à la première écriture
+_file_mode: Optional[int] = None
+_file_mode_lock = threading.Lock()
+
+
+def _read_umask() -> int:
+    """Umask du processus, lu sans le modifier quand le système le permet (Linux: /proc)."""
+    try:
+        with open("/proc/self/status", encoding="ascii", errors="ignore") as f:
+            for line in f:
+                if line.startswith("Umask:"):
+                    return int(line.split()[1], 8)
+    except (OSError, ValueError, IndexError):
+        pass
+    # Sinon, seule lecture possible: le remplacer un instant, par une valeur restrictive
+    # (un fichier créé par un autre thread pendant ce temps n'est jamais ouvert à tous)
+    umask = os.umask(0o077)
+    os.umask(umask)
+    return umask
+
+
+def default_file_mode() -> int:
+    """Droits d'un fichier créé par le lot (umask lu une seule fois)."""
+    global _file_mode
+    with _file_mode_lock:
+        if _file_mode is None:
+            _file_mode = 0o666 & ~_read_umask()
+        return _file_mode
+
+
+class BatchWriteError(Exception):
+    """Le lot n'a pas pu être écrit ; aucun fichier du workspace n'a changé."""
+
+    def __init__(self, errors: Dict[str, str]):
+        super().__init__("; ".join(f"{path}: {error}" for path, error in errors.items()))
+        self.errors = errors
+
+
+@dataclass
+class WriteStats:
+    """Mesures d'un lot d'écritures."""
+    files: int = 0
+    deleted: int = 0
+    bytes: int = 0
+    elapsed_ms: float = 0.0
+    dir_syncs: int = 0
+
+    def summary(self) -> str:
+        rate = self.bytes / 1024 / 1024 / (self.elapsed_ms / 1000) if self.elapsed_ms else 0.0
+        text = f"{self.files} fichier(s), {self.bytes / 1024:.1f} Ko en {self.elapsed_ms:.1f} ms ({rate:.1f} Mo/s)"
+        if self.deleted:
+            text += f", {self.deleted} suppression(s)"
+        return text
+
+
+@dataclass
+class _Staged:
+    path: str
+    temp: Optional[str] = None  # None = suppression
+    backup: Optional[str] = None
+    existed: bool = False
+    size: int = 0
+
+
+@dataclass
+class WriteBatch:
+    """Écritures et suppressions à appliquer ensemble (chemins absolus)."""
+    writes: Dict[str, str] = field(default_factory=dict)
+    deletes: List[str] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.writes or self.deletes)
+
+
+class AtomicBatchWriter:
+    """
+    Applique un lot de fichiers en trois temps:
+
+    1. préparation en parallèle (pool borné): chaque contenu est écrit dans
+       un fichier temporaire du même dossier puis fsync ; l'ancienne version
+       est conservée par un lien dur (copie à défaut) ;
+    2. validation: renommages atomiques (os.replace) puis suppressions ;
+       au premier échec, les fichiers déjà remplacés sont restaurés ;
+    3. un seul fsync par dossier touché, en parallèle.
+
+    Si une étape échoue, le workspace reste dans son état initial.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, fsync: bool = True):
+        self.max_workers = max_workers or min(8, (os.cpu_count() or 1) + 4)
+        self.fsync = fsync
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="atomic-writer")
+        self.last_stats: Optional[WriteStats] = None
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+
+    # ------------------------------------------------------------------
+    # Étapes unitaires (exécutées dans le pool)
+    # ------------------------------------------------------------------
+
+    def _stage_write(self, path: str, content: str) -> _Staged:
+        directory, name = os.path.split(path)
+        staged = _Staged(path=path)
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+            staged.existed = True
+        except FileNotFoundError:
+            mode = default_file_mode()
+        fd, temp = tempfile.mkstemp(dir=directory, prefix=f".{name}.", suffix=".tmp")
+        staged.temp = temp
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(content)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            os.chmod(temp, mode)
+            staged.size = os.path.getsize(temp)
+            if staged.existed:
+                staged.backup = self._backup(path)
+        except BaseException:
+            self._discard(staged)
+            raise
+        return staged
+
+    def _stage_delete(self, path: str) -> _Staged:
+        if not os.path.isfile(path):
+            raise FileNotFoundError("Fichier non trouvé")
+        return _Staged(path=path, existed=True, backup=self._backup(path))
+
+    @staticmethod
+    def _backup(path: str) -> str:
+        """Conserve l'ancienne version (lien dur: aucune copie de données)."""
+        directory, name = os.path.split(path)
+        fd, backup = tempfile.mkstemp(dir=directory, prefix=f".{name}.", suffix=".bak")
+        os.close(fd)
+        os.remove(backup)
+        try:
+            os.link(path, backup)
+        except OSError:
+            shutil.copy2(path, backup)
+        return backup
+
+    @staticmethod
+    def _discard(staged: _Staged) -> None:
+        for leftover in (staged.temp, staged.backup):
+            if leftover:
+                try:
+                    os.remove(leftover)
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _sync_dir(directory: str) -> None:
+        try:
+            fd = os.open(directory, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+        except OSError:
+            return  # Windows: pas de fsync de dossier
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    # ------------------------------------------------------------------
+    # Lot complet
+    # ------------------------------------------------------------------
+
+    def commit(self, batch: WriteBatch) -> WriteStats:
+        """
+        Applique le lot en tout ou rien.
+
+        Raises:
+            BatchWriteError (chemin -> erreur) si le lot n'a pas pu être appliqué
+        """
+        start = time.perf_counter()
+        created_dirs = self._make_parents(batch)
+
+        futures = [(path, self._pool.submit(self._stage_write, path, content)) for path, content in batch.writes.items()]
+        futures += [(path, self._pool.submit(self._stage_delete, path)) for path in batch.deletes]
+        staged: List[_Staged] = []
+        errors: Dict[str, str] = {}
+        for path, future in futures:
+            try:
+                staged.append(future.result())
+            except Exception as e:
+                errors[path] = str(e)
+        if errors:
+            for item in staged:
+                self._discard(item)
+            self._remove_dirs(created_dirs)
+            raise BatchWriteError(errors)
+
+        done: List[_Staged] = []
+        try:
+            for item in staged:
+                if item.temp is not None:
+                    os.replace(item.temp, item.path)
+                else:
+                    os.remove(item.path)
+                done.append(item)
+        except OSError as e:
+            self._restore(done, staged)
+            self._remove_dirs(created_dirs)
+            raise BatchWriteError({item.path: str(e) for item in staged if item not in done}) from e
+
+        for item in staged:
+            if item.backup:
+                try:
+                    os.remove(item.backup)
+                except OSError:
+                    pass
+
+        directories = {os.path.dirname(item.path) for item in staged}
+        directories |= {os.path.dirname(directory) for directory in created_dirs}
+        if self.fsync:
+            list(self._pool.map(self._sync_dir, directories))
+
+        stats = WriteStats(
+            files=sum(1 for item in staged if item.temp is not None),
+            deleted=sum(1 for item in staged if item.temp is None),
+            bytes=sum(item.size for item in staged),
+            elapsed_ms=(time.perf_counter() - start) * 1000,
+            dir_syncs=len(directories) if self.fsync else 0,
+        )
+        self.last_stats = stats
+        return stats
+
+    def _restore(self, done: List[_Staged], staged: List[_Staged]) -> None:
+        """Remet les anciennes versions des fichiers déjà remplacés ou supprimés."""
+        for item in done:
+            try:
+                if item.backup:
+                    os.replace(item.backup, item.path)
+                    item.backup = None
+                elif not item.existed:
+                    os.remove(item.path)
+            except OSError as e:
+                logger.error(f"❌ Restauration impossible de {item.path}: {e}")
+        for item in staged:
+            if item not in done:
+                self._discard(item)
+
+    @staticmethod
+    def _make_parents(batch: WriteBatch) -> List[str]:
+        """Crée les dossiers parents manquants et retourne ceux qui ont été créés."""
+        created = []
+        for path in batch.writes:
+            directory = os.path.dirname(path)
+            missing = []
+            while directory and not os.path.isdir(directory):
+                missing.append(directory)
+                directory = os.path.dirname(directory)
+            for directory in reversed(missing):
+                try:
+                    os.mkdir(directory)
+                    created.append(directory)
+                except FileExistsError:
+                    pass
+        return created
+
+    @staticmethod
+    def _remove_dirs(directories: List[str]) -> None:
+        for directory in reversed(directories):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass
@@ -3,9 +3,10 @@ Bot Telegram - Serveur qui écoute les messages et orchestre les modifications
 """
 
 import os
+import asyncio
 import logging
 import time
-from typing import Optional
+from typing import Optional, Set
 from functools import wraps
 
 from telegram import Update
@@ -19,10 +20,17 @@ from telegram.ext import (
 from telegram.constants import ParseMode
 
 from .ai_handler import AIHandler
+from .change_journal import ChangeJournal
 from .git_manager import GitManager
+from .git_async import AsyncGitManager
+from .metrics import METRICS
+from .session_state import SessionStore
 
 logger = logging.getLogger(__name__)
 
+# Intervalle minimal entre deux éditions du message de progression (limites Telegram)
+PROGRESS_EDIT_INTERVAL = 1.5
+
 
 def authorized_only(func):
     """Décorateur pour restreindre l'accès aux utilisateurs autorisés."""
@@ -79,8 +87,24 @@ class TelegramBot:
         self.allowed_user_id = allowed_user_id
         self.ai_handler = ai_handler
         self.git_manager = git_manager
+        # Opérations Git hors de la boucle d'événements (un push lent ne bloque pas les autres messages)
+        self.git = AsyncGitManager(
+            git_manager,
+            workers=int(os.getenv("GIT_WORKERS", "2")),
+            timeout=float(os.getenv("GIT_TIMEOUT", "120")),
+            read_timeout=float(os.getenv("GIT_READ_TIMEOUT", "30")),
+        )
         self.github_url = github_url
         self.app: Optional[Application] = None
+        # Instructions en cours (annulables via /cancel)
+        self._active_tasks: Set[asyncio.Task] = set()
+        # Une seule instruction (ou /deploy, /reset...) à la fois sur le workspace: créé dans la boucle
+        self._workspace_lock: Optional[asyncio.Lock] = None
+        # Échanges récents par chat: les instructions de suivi n'envoient que ce qui a changé
+        self.sessions = SessionStore(
+            ttl_seconds=int(os.getenv("SESSION_TTL_SECONDS", str(30 * 60))),
+            max_turns=int(os.getenv("SESSION_MAX_TURNS", "4")),
+        )
 
         # PIN optionnel
         self.access_pin = (access_pin or os.getenv("ACCESS_PIN") or "").strip() or None
@@ -102,6 +126,33 @@ class TelegramBot:
             return
         self._pin_verified_until = time.time() + self.pin_ttl_seconds
 
+    def _get_workspace_lock(self) -> asyncio.Lock:
+        """
+        Verrou du workspace: une instruction le garde de l'appel IA jusqu'à
+        l'écriture ou l'annulation de ses fichiers ; /deploy, /reset, /diff et
+        /new l'attendent. /cancel, /status et /stats ne le prennent pas.
+        """
+        if self._workspace_lock is None:
+            self._workspace_lock = asyncio.Lock()
+        return self._workspace_lock
+
+    async def _wait_workspace(self, update: Update) -> asyncio.Lock:
+        """Retourne le verrou du workspace après avoir prévenu s'il faut attendre."""
+        lock = self._get_workspace_lock()
+        if lock.locked():
+            await update.message.reply_text("⏳ Une instruction est en cours, la commande s'exécutera ensuite (/cancel pour l'interrompre).")
+        return lock
+
+    @staticmethod
+    def _format_usage(usage) -> str:
+        """Résumé court des tokens consommés (dont ceux servis par le cache du provider)."""
+        if usage is None or not usage.input_tokens:
+            return ""
+        text = f" · {usage.input_tokens} tokens"
+        if usage.cached_tokens:
+            text += f" (⚡ {usage.cached_tokens} en cache)"
+        return text
+
     def _setup_handlers(self) -> None:
         """Configure les handlers de commandes et messages."""
         # Commandes
@@ -113,6 +164,10 @@ class TelegramBot:
         self.app.add_handler(CommandHandler("reset", self._cmd_reset))
         self.app.add_handler(CommandHandler("id", self._cmd_id))
         self.app.add_handler(CommandHandler("pin", self._cmd_pin))
+        self.app.add_handler(CommandHandler("cancel", self._cmd_cancel))
+        self.app.add_handler(CommandHandler("stats", self._cmd_stats))
+        self.app.add_handler(CommandHandler("usage", self._cmd_usage))
+        self.app.add_handler(CommandHandler("new", self._cmd_new))
         
         # Messages texte (instructions)
         self.app.add_handler(
@@ -168,6 +223,10 @@ class TelegramBot:
             "🔹 /diff - Voir les modifications en attente\n"
             "🔹 /deploy - Commit et push les modifications\n"
             "🔹 /reset - Annuler toutes les modifications\n"
+            "🔹 /cancel - Interrompre l'instruction en cours\n"
+            "🔹 /new - Nouvelle conversation (oublie les échanges précédents)\n"
+            "🔹 /stats - Temps par étape (p50/p95/p99)\n"
+            "🔹 /usage [jours] - Tokens et coût estimé par jour et par provider\n"
             "🔹 /id - Afficher ton ID Telegram\n"
             f"{pin_help}\n"
             "💬 **Pour modifier le code:**\n"
@@ -194,13 +253,14 @@ class TelegramBot:
     @authorized_only
     async def _cmd_status(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Commande /status - Statut Git."""
-        status = self.git_manager.get_status()
+        status = await self.git.get_status()
         await update.message.reply_text(f"📊 **Statut Git:**\n\n{status}", parse_mode=ParseMode.MARKDOWN)
 
     @authorized_only
     async def _cmd_diff(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Commande /diff - Affiche les différences."""
-        diff = self.git_manager.get_detailed_diff(max_lines=40)
+        async with await self._wait_workspace(update):
+            diff = await self.git.get_detailed_diff(max_lines=40)
         
         # Telegram a une limite de 4096 caractères
         if len(diff) > 3900:
@@ -219,12 +279,15 @@ class TelegramBot:
         # Récupérer le message de commit personnalisé si fourni
         commit_msg = " ".join(context.args) if context.args else "Update via Mobile Telegram"
         
-        success, report = self.git_manager.deploy(commit_msg)
-        
-        if success and self.github_url:
-            commit_url = self.git_manager.get_last_commit_url(self.github_url)
-            if commit_url:
-                report += f"\n\n🔗 {commit_url}"
+        async with await self._wait_workspace(update):
+            with METRICS.span("deploy"):
+                success, report = await self.git.deploy(commit_msg)
+            METRICS.export()
+            
+            if success and self.github_url:
+                commit_url = await self.git.get_last_commit_url(self.github_url)
+                if commit_url:
+                    report += f"\n\n🔗 {commit_url}"
         
         await update.message.reply_text(
             report,
@@ -235,9 +298,68 @@ class TelegramBot:
     @authorized_only
     async def _cmd_reset(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Commande /reset - Annule les modifications."""
-        success, msg = self.git_manager.reset_changes()
+        async with await self._wait_workspace(update):
+            success, msg = await self.git.reset_changes()
+            if success:
+                # Les échanges précédents décrivent des modifications annulées
+                self.sessions.reset(update.effective_chat.id)
         await update.message.reply_text(msg)
 
+    @authorized_only
+    async def _cmd_new(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Commande /new - Démarre une nouvelle conversation (contexte complet à la prochaine instruction)."""
+        async with await self._wait_workspace(update):
+            self.sessions.reset(update.effective_chat.id)
+        await update.message.reply_text("🆕 Nouvelle conversation: les échanges précédents sont oubliés.")
+
+    @authorized_only
+    async def _cmd_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Commande /stats - Latences par étape et état des providers."""
+        providers = "\n".join(
+            f"{p['provider']}: {p['calls']} appel(s), {p['failure_rate'] * 100:.0f}% d'échecs"
+            + (f", {p['latency_s']:.1f}s en moyenne" if p["latency_s"] else "")
+            + (" (en pause)" if p["in_cooldown"] else "")
+            for p in self.ai_handler.provider_stats()
+        )
+        await update.message.reply_text(
+            "📈 **Temps par étape** (p50 / p95 / p99):\n"
+            f"```\n{METRICS.render_text()}\n```\n"
+            f"🤖 **Providers:**\n```\n{providers}\n```\n"
+            f"📖 Cache de lecture: {self.ai_handler.read_cache.summary()}\n"
+            f"⚡ Cache de réponses: {self.ai_handler.response_cache.summary()}\n"
+            f"🔧 Git: {self.git_manager.runner.summary()}",
+            parse_mode=ParseMode.MARKDOWN
+        )
+
+    @authorized_only
+    async def _cmd_usage(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Commande /usage [jours] - Consommation de tokens, coût estimé et plus grosses instructions."""
+        days = 7
+        if context.args:
+            try:
+                days = max(1, min(365, int(context.args[0])))
+            except ValueError:
+                await update.message.reply_text("📊 Usage: `/usage [jours]`", parse_mode=ParseMode.MARKDOWN)
+                return
+        report = await asyncio.to_thread(self.ai_handler.usage_store.render_text, days)
+        if len(report) > 3900:
+            report = report[:3900] + "\n... (tronqué)"
+        await update.message.reply_text(
+            f"💰 **Consommation** ({days} j, coût estimé en USD):\n```\n{report}\n```",
+            parse_mode=ParseMode.MARKDOWN
+        )
+
+    @authorized_only
+    async def _cmd_cancel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Commande /cancel - Interrompt les instructions en cours (requête IA comprise)."""
+        tasks = [t for t in self._active_tasks if not t.done()]
+        if not tasks:
+            await update.message.reply_text("ℹ️ Aucune instruction en cours.")
+            return
+        for task in tasks:
+            task.cancel()
+        await update.message.reply_text(f"🛑 Annulation de {len(tasks)} instruction(s)...")
+
     async def _cmd_id(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Commande /id - Affiche l'ID de l'utilisateur."""
         user = update.effective_user
@@ -259,56 +381,162 @@ class TelegramBot:
             "🤔 Analyse de l'instruction en cours..."
         )
         
+        # Opérations envoyées à l'écriture au fil du streaming (et leurs résultats)
+        applied_ops = []
+        results = []
+        # Écritures en cours dans un thread: une annulation ne les interrompt pas, le rollback les attend
+        applying = set()
+        # Opérations reçues, et celles dont la syntaxe est vérifiée: appliquées ensemble en fin de réponse
+        streamed = []
+        deferred = []
+        # Pré-images des fichiers touchés: l'annulation ne restaure qu'eux
+        journal = ChangeJournal()
+        progress = {"chars": 0, "last_edit": 0.0}
+        
+        async def show_progress(force: bool = False):
+            now = time.monotonic()
+            if not force and now - progress["last_edit"] < PROGRESS_EDIT_INTERVAL:
+                return
+            progress["last_edit"] = now
+            lines = "\n".join(
+                f"{'✅' if r['success'] else '❌'} {r['action']}: `{r['file']}`"
+                for r in results
+            )
+            try:
+                await processing_msg.edit_text(
+                    f"⏳ **Génération en cours...** ({progress['chars']} caractères reçus)\n\n{lines}",
+                    parse_mode=ParseMode.MARKDOWN
+                )
+            except Exception as e:
+                # "Message is not modified", flood control... la progression n'est pas critique
+                logger.debug(f"Progression non affichée: {e}")
+        
+        async def apply(operations):
+            # Opérations notées avant l'écriture: une annulation pendant l'écriture les restaure aussi
+            applied_ops.extend(operations)
+            future = asyncio.ensure_future(
+                asyncio.to_thread(self.ai_handler.apply_operations, operations, journal)
+            )
+            applying.add(future)
+            future.add_done_callback(applying.discard)
+            return await asyncio.shield(future)
+        
+        async def rollback():
+            # Le journal contient tout ce qui a été réellement écrit: restauration systématique,
+            # après la fin des écritures en cours, hors de la boucle asyncio (attente de _apply_lock)
+            if applying:
+                await asyncio.gather(*applying, return_exceptions=True)
+            await asyncio.to_thread(self.ai_handler.rollback_operations, applied_ops, journal)
+        
+        async def on_operation(op):
+            # Appliquer chaque opération dès que son objet JSON est complet
+            # (écriture + fsync hors de la boucle asyncio). Les fichiers à
+            # vérifier attendent le lot final: validation de l'ensemble en une
+            # fois (pool de processus), rien d'invalide n'est écrit.
+            streamed.append(op)
+            if self.ai_handler.checks_syntax(op):
+                deferred.append(op)
+                return
+            results.extend(await apply([op]))
+            await show_progress(force=True)
+        
+        async def on_progress(received_chars: int):
+            progress["chars"] = received_chars
+            await show_progress()
+        
+        task = asyncio.current_task()
+        self._active_tasks.add(task)
+        started = time.perf_counter()
+        lock = self._get_workspace_lock()
+        acquired = False
         try:
-            # Appeler l'IA pour interpréter l'instruction
-            ai_response = await self.ai_handler.process_instruction(instruction)
+            # Instructions sérialisées: journaux, rapport de contexte et session ne se mélangent pas
+            if lock.locked():
+                await processing_msg.edit_text("⏳ Une autre instruction est en cours, en attente...")
+            await lock.acquire()
+            acquired = True
+            session = self.sessions.get(update.effective_chat.id)
+            
+            # Appeler l'IA pour interpréter l'instruction (streaming)
+            ai_response = await self.ai_handler.process_instruction(
+                instruction,
+                on_operation=on_operation,
+                on_progress=on_progress,
+                session=session,
+            )
             
             if not ai_response.success:
+                await rollback()
                 await processing_msg.edit_text(
                     f"❌ **Erreur:**\n{ai_response.error or 'Impossible de traiter cette instruction'}"
                 )
                 return
             
-            # Afficher les opérations prévues
-            operations_text = "\n".join([
-                f"• {op.action}: `{op.file_path}` - {op.description}"
-                for op in ai_response.operations
-            ])
+            # Fichiers vérifiés et opérations que le parser incrémental n'aurait pas vues passer
+            remaining = deferred + ai_response.operations[len(streamed):]
+            if remaining:
+                results.extend(await apply(remaining))
             
-            await processing_msg.edit_text(
-                f"🔧 **Modifications prévues:**\n{operations_text}\n\n"
-                f"📝 {ai_response.explanation}\n\n"
-                "⏳ Application en cours...",
-                parse_mode=ParseMode.MARKDOWN
-            )
+            # Patches non applicables: repli sur une réécriture complète ("modify")
+            failed_patches = [r["file"] for r in results if r.get("patch_failed")]
+            if failed_patches:
+                await processing_msg.edit_text(
+                    f"🩹 Patch non applicable sur {', '.join(failed_patches)}, réécriture complète..."
+                )
+                retry = await self.ai_handler.regenerate_files(instruction, failed_patches)
+                if retry.success and retry.operations:
+                    retry_results = await apply(retry.operations)
+                    by_file = {r["file"]: r for r in retry_results}
+                    results[:] = [
+                        by_file.get(r["file"], r) if r.get("patch_failed") else r
+                        for r in results
+                    ]
             
-            # Appliquer les opérations
-            results = self.ai_handler.apply_operations(ai_response.operations)
+            # Syntaxe invalide: seuls les fichiers fautifs sont redemandés (une fois)
+            broken = {r["file"]: r["error"] for r in results if r.get("validation_failed")}
+            if broken:
+                await processing_msg.edit_text(
+                    f"🧪 Erreur de syntaxe dans {', '.join(broken)}, correction ciblée..."
+                )
+                rejected = {r["file"]: r.get("rejected_content") for r in results if r.get("validation_failed")}
+                repair = await self.ai_handler.repair_files(instruction, broken, rejected)
+                if repair.success and repair.operations:
+                    repair_results = await apply(repair.operations)
+                    by_file = {r["file"]: r for r in repair_results}
+                    results[:] = [
+                        by_file.get(r["file"], r) if r.get("validation_failed") else r
+                        for r in results
+                    ]
             
             # Vérifier si toutes les opérations ont réussi
             all_success = all(r["success"] for r in results)
             
             if all_success:
+                if session is not None:
+                    session.add_turn(instruction, ai_response.explanation, [r["file"] for r in results])
+                
                 # Construire le rapport de succès
                 success_report = "\n".join([
-                    f"✅ {r['action']}: `{r['file']}`"
+                    f"✅ {r['action']}: `{r['file']}`" + (" ⚠️ syntaxe invalide" if r.get("warning") else "")
                     for r in results
                 ])
                 
                 # Récupérer le diff
-                diff = self.git_manager.get_diff(staged=False)
+                with METRICS.span("git_diff"):
+                    diff = await self.git.get_diff(staged=False)
                 
                 await processing_msg.edit_text(
                     f"✨ **Modifications appliquées!**\n\n"
                     f"{success_report}\n\n"
-                    f"📊 **Diff:**\n```\n{diff[:1500]}\n```\n\n"
+                    f"📝 {ai_response.explanation[:800]}\n\n"
+                    + (f"🤖 {ai_response.provider}{self._format_usage(ai_response.usage)}\n\n" if ai_response.provider else "")
+                    + f"📊 **Diff:**\n```\n{diff[:1500]}\n```\n\n"
                     "💡 Utilise /deploy pour pusher ou /reset pour annuler.",
                     parse_mode=ParseMode.MARKDOWN
                 )
             else:
-                # Rollback en cas d'erreur
-                self.ai_handler.rollback_operations(ai_response.operations)
-                self.git_manager.reset_changes()
+                # Rollback en cas d'erreur (uniquement les fichiers touchés)
+                await rollback()
                 
                 error_report = "\n".join([
                     f"{'✅' if r['success'] else '❌'} {r['action']}: {r['file']}"
@@ -322,19 +550,62 @@ class TelegramBot:
                     parse_mode=ParseMode.MARKDOWN
                 )
                 
+        except asyncio.CancelledError:
+            logger.info("🛑 Instruction annulée par l'utilisateur")
+            await rollback()
+            await processing_msg.edit_text("🛑 Instruction annulée. Aucune modification conservée.")
         except Exception as e:
             logger.error(f"Erreur traitement instruction: {e}")
+            await rollback()
             await processing_msg.edit_text(
                 f"❌ **Erreur inattendue:**\n`{str(e)}`",
                 parse_mode=ParseMode.MARKDOWN
             )
+        finally:
+            journal.close()
+            if acquired:
+                lock.release()
+            self._active_tasks.discard(task)
+            METRICS.observe("instruction", time.perf_counter() - started)
+            METRICS.export()
+
+    def _start_metrics_server(self) -> None:
+        """Expose /metrics (Prometheus) en HTTP local si METRICS_HTTP_PORT est défini."""
+        port = int(os.getenv("METRICS_HTTP_PORT", "0"))
+        if not port:
+            return
+        try:
+            METRICS.start_http_server(port, host=os.getenv("METRICS_HTTP_HOST", "127.0.0.1"))
+        except OSError as e:
+            logger.warning(f"⚠️ Serveur de mesures non démarré (port {port}): {e}")
+
+    def _build_application(self) -> Application:
+        """
+        Crée l'application Telegram.
+        Les updates sont traitées en parallèle: /cancel ou /status restent
+        disponibles pendant qu'une instruction attend le provider IA. Les
+        instructions et les commandes qui touchent au workspace passent, elles,
+        une à une (voir _get_workspace_lock).
+        """
+        async def on_shutdown(app: Application) -> None:
+            await self.ai_handler.aclose()
+            self.git.close()
+        
+        return (
+            Application.builder()
+            .token(self.token)
+            .concurrent_updates(True)
+            .post_shutdown(on_shutdown)
+            .build()
+        )
 
     def run(self) -> None:
         """Démarre le bot (bloquant)."""
         import asyncio
         
-        self.app = Application.builder().token(self.token).build()
+        self.app = self._build_application()
         self._setup_handlers()
+        self._start_metrics_server()
         
         logger.info("🚀 Démarrage du bot...")
         
@@ -386,8 +657,9 @@ class TelegramBot:
 
     async def start_async(self) -> None:
         """Démarre le bot de manière asynchrone."""
-        self.app = Application.builder().token(self.token).build()
+        self.app = self._build_application()
         self._setup_handlers()
+        self._start_metrics_server()
         
         await self.app.initialize()
         await self.app.start()
@@ -401,4 +673,6 @@ class TelegramBot:
             await self.app.updater.stop()
             await self.app.stop()
             await self.app.shutdown()
+            await self.ai_handler.aclose()
+            self.git.close()
             logger.info("🛑 Bot arrêté")
@@ -0,0 +1,191 @@
+"""
+Journal des modifications - Pré-images des fichiers touchés pour annuler une instruction sans git
+"""
+
+import os
+import stat
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Optional, List, Dict, IO
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+# Au-delà de cette taille, une pré-image est déversée sur disque (fichier temporaire)
+SPOOL_MAX_BYTES = 1024 * 1024
+
+
+@dataclass
+class JournalEntry:
+    """
+    État d'un fichier avant sa première modification par l'instruction.
+
+    - "created": le fichier n'existait pas (marqueur, rien à conserver)
+    - "modified": contenu d'origine conservé, avec son empreinte
+    - "deleted": pierre tombale: le fichier supprimé et son contenu d'origine
+    """
+    path: str
+    kind: str
+    sha256: Optional[str] = None
+    mode: Optional[int] = None
+    original: Optional[IO[bytes]] = None
+    created_dirs: List[str] = field(default_factory=list)
+
+    def read_original(self) -> bytes:
+        self.original.seek(0)
+        return self.original.read()
+
+
+class ChangeJournal:
+    """
+    Journal des pré-images d'une instruction.
+
+    Chaque chemin est enregistré avant sa première écriture ; l'annulation
+    restaure exactement ces chemins (coût proportionnel au nombre de
+    fichiers touchés), sans toucher au reste du worktree ni appeler git.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, JournalEntry] = {}
+        self._order: List[str] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self._entries
+
+    @property
+    def paths(self) -> List[str]:
+        return list(self._order)
+
+    def record(self, path: str, deleting: bool = False) -> None:
+        """
+        Enregistre la pré-image de `path` (chemin absolu) s'il n'est pas déjà
+        dans le journal: seul l'état d'avant la première modification compte.
+        """
+        with self._lock:
+            if path in self._entries:
+                return
+        entry = self._capture(path, deleting)
+        with self._lock:
+            if path not in self._entries:
+                self._entries[path] = entry
+                self._order.append(path)
+
+    @staticmethod
+    def _missing_dirs(path: str) -> List[str]:
+        missing = []
+        directory = os.path.dirname(path)
+        while directory and not os.path.isdir(directory):
+            missing.append(directory)
+            directory = os.path.dirname(directory)
+        return missing
+
+    def _capture(self, path: str, deleting: bool) -> JournalEntry:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return JournalEntry(path=path, kind="created", created_dirs=self._missing_dirs(path))
+
+        original = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+                original.write(block)
+        return JournalEntry(
+            path=path,
+            kind="deleted" if deleting else "modified",
+            sha256=digest.hexdigest(),
+            mode=stat.S_IMODE(st.st_mode),
+            original=original,
+        )
+
+    def forget(self, paths: List[str]) -> None:
+        """Retire des chemins du journal (lot finalement non écrit)."""
+        with self._lock:
+            for path in paths:
+                entry = self._entries.pop(path, None)
+                if entry is not None:
+                    self._order.remove(path)
+                    if entry.original is not None:
+                        entry.original.close()
+
+    @staticmethod
+    def _hash_file(path: str) -> Optional[str]:
+        digest = hashlib.sha256()
+        try:
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(block)
+        except FileNotFoundError:
+            return None
+        return digest.hexdigest()
+
+    def _restore(self, entry: JournalEntry) -> bool:
+        """Remet un fichier dans son état d'origine ; retourne True s'il a fallu le changer."""
+        if entry.kind == "created":
+            changed = False
+            if os.path.lexists(entry.path):
+                os.remove(entry.path)
+                changed = True
+            for directory in entry.created_dirs:
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    break  # Dossier non vide: d'autres fichiers y vivent
+            return changed
+
+        if self._hash_file(entry.path) == entry.sha256:
+            return False  # Contenu déjà identique à l'original
+        directory, name = os.path.split(entry.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=directory, prefix=f".{name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(entry.read_original())
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(temp, entry.mode)
+            os.replace(temp, entry.path)
+        except BaseException:
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+            raise
+        return True
+
+    def rollback(self) -> List[str]:
+        """
+        Restaure tous les chemins journalisés, du dernier au premier.
+
+        Returns:
+            Les chemins effectivement restaurés
+        """
+        restored = []
+        with self._lock:
+            order = list(reversed(self._order))
+        for path in order:
+            entry = self._entries[path]
+            try:
+                if self._restore(entry):
+                    restored.append(path)
+                    logger.info(f"↩️ Rollback: {entry.kind} {path}")
+            except Exception as e:
+                logger.error(f"Erreur rollback {path}: {e}")
+        self.close()
+        return restored
+
+    def close(self) -> None:
+        """Libère les pré-images (instruction terminée ou annulée)."""
+        with self._lock:
+            for entry in self._entries.values():
+                if entry.original is not None:
+                    entry.original.close()
+            self._entries.clear()
+            self._order.clear()
@@ -0,0 +1,271 @@
+"""
+Context Packer - Remplit le budget de tokens du modèle avec les fichiers les plus pertinents
+"""
+
+import re
+import math
+import logging
+from typing import Optional, List, Callable, Set, Tuple
+from dataclasses import dataclass, field
+
+from .relevance_index import tokenize
+from .symbol_index import FileSymbols, relevant_symbols
+
+logger = logging.getLogger(__name__)
+
+# Ratio moyen caractères/token pour du code et du texte mixte FR/EN (estimation prudente)
+CHARS_PER_TOKEN = 3.5
+
+# Une entrée (fichier complet) ne peut pas consommer plus de cette part du budget
+MAX_SHARE_PER_FILE = 0.5
+# En dessous de ce reste, inutile d'ajouter un extrait
+MIN_USEFUL_TOKENS = 120
+# Un fichier secondaire plus petit que ceci est envoyé en entier plutôt qu'en symboles
+MIN_SYMBOL_VIEW_TOKENS = 400
+
+_OUTLINE_RE = re.compile(
+    r"^\s*(?:export\s+|async\s+|public\s+|private\s+|protected\s+|static\s+)*"
+    r"(?:def|class|function|const|let|var|interface|type|enum|struct|impl|fn|func|module)\b"
+    r"|^\s*#{1,6}\s"
+    r"|^\s*<(?:h[1-6]|section|header|footer|nav|main|form|script|style)\b"
+    r"|^\s*[.#]?[\w-]+(?:\s*[,>+~]\s*[.#]?[\w-]+)*\s*\{\s*$"
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Estime localement le nombre de tokens d'un texte (sans tokenizer externe)."""
+    if not text:
+        return 0
+    return int(math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+@dataclass
+class PackedFile:
+    """Fichier retenu dans le contexte."""
+    path: str
+    mode: str  # "full", "outline", "excerpt", "outline+excerpt", "outline+symbols"
+    tokens: int
+
+
+@dataclass
+class PackReport:
+    """Ce que le packer a inclus et écarté."""
+    budget: int
+    used: int = 0
+    included: List[PackedFile] = field(default_factory=list)
+    dropped: List[str] = field(default_factory=list)
+    missing: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)  # réduits: déjà envoyés tels quels au tour précédent
+
+    def summary(self) -> str:
+        """Résumé court pour les logs et Telegram."""
+        modes = {}
+        for f in self.included:
+            modes[f.mode] = modes.get(f.mode, 0) + 1
+        labels = {
+            "full": "complet", "outline": "plan", "excerpt": "extrait",
+            "outline+excerpt": "plan+extrait", "outline+symbols": "plan+symboles",
+        }
+        detail = ", ".join(f"{n} {labels.get(m, m)}" for m, n in modes.items())
+        text = f"{len(self.included)} fichier(s)"
+        if detail:
+            text += f" ({detail})"
+        text += f", ~{self.used}/{self.budget} tokens"
+        if self.dropped:
+            text += f", {len(self.dropped)} écarté(s)"
+        if self.unchanged:
+            text += f", {len(self.unchanged)} inchangé(s) depuis le dernier échange"
+        return text
+
+
+class ContextPacker:
+    """
+    Remplit un budget de tokens par ordre de pertinence.
+
+    Chaque candidat est inclus en entier s'il tient, sinon sous forme de plan
+    (signatures et titres avec numéros de ligne), sinon sous forme d'extrait
+    centré sur les lignes qui mentionnent les termes de l'instruction.
+
+    Avec un index de symboles, le plan donne les plages de lignes de chaque
+    déclaration et seuls les corps des symboles pertinents sont envoyés ;
+    au-delà des `full_files` premiers candidats, c'est la forme par défaut.
+    Un fichier déjà envoyé en entier lors d'un échange précédent et inchangé
+    depuis (`already_sent`) est lui aussi réduit.
+    """
+
+    def __init__(
+        self,
+        budget_tokens: int,
+        read_file: Callable[[str], Optional[str]],
+        symbols: Optional[Callable[[str, str], Optional[FileSymbols]]] = None,
+        full_files: int = 0,
+        already_sent: Optional[Callable[[str, str], bool]] = None,
+    ):
+        """
+        Args:
+            budget_tokens: Budget de tokens disponible pour les fichiers
+            read_file: Fonction qui retourne le contenu d'un fichier (ou None)
+            symbols: Fonction (chemin, contenu) -> symboles du fichier (ou None)
+            full_files: Candidats envoyés en entier quand ils tiennent (0 = tous)
+            already_sent: Fonction (chemin, contenu) -> True si ce contenu a déjà été envoyé
+        """
+        self.budget = max(0, budget_tokens)
+        self.read_file = read_file
+        self.symbols = symbols
+        self.full_files = full_files
+        self.already_sent = already_sent
+
+    @staticmethod
+    def _render(path: str, body: str, note: str = "") -> str:
+        header = f"📄 {path}" + (f" ({note})" if note else "")
+        return f"\n{header}:\n```\n{body}\n```"
+
+    @staticmethod
+    def outline(content: str) -> str:
+        """Plan du fichier: lignes de déclaration avec leur numéro."""
+        lines = []
+        for number, line in enumerate(content.splitlines(), 1):
+            if _OUTLINE_RE.match(line):
+                lines.append(f"{number:>5}: {line.rstrip()[:160]}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def excerpt(content: str, terms: Set[str], max_tokens: int, context_lines: int = 3) -> str:
+        """Extrait autour des lignes contenant les termes de l'instruction (ou début du fichier)."""
+        lines = content.splitlines()
+        hits = [i for i, line in enumerate(lines) if terms and terms.intersection(tokenize(line))]
+        if not hits:
+            windows = [(0, len(lines))]
+        else:
+            windows = [(max(0, i - context_lines), min(len(lines), i + context_lines + 1)) for i in hits]
+
+        chunks, used, last_end = [], 0, -1
+        budget_chars = int(max_tokens * CHARS_PER_TOKEN)
+        for start, end in windows:
+            start = max(start, last_end)
+            if start >= end:
+                continue
+            if last_end != -1 and start > last_end:
+                chunks.append("   ...")
+            for i in range(start, end):
+                line = f"{i + 1:>5}: {lines[i]}"
+                if used + len(line) + 1 > budget_chars:
+                    chunks.append("   ... (tronqué)")
+                    return "\n".join(chunks)
+                chunks.append(line)
+                used += len(line) + 1
+            last_end = end
+        return "\n".join(chunks)
+
+    def _reduced_view(self, path: str, content: str, terms: Set[str], limit: int) -> Tuple[Optional[str], Optional[str]]:
+        """Plan (lignes de déclaration) et/ou extrait ciblé d'un fichier trop gros pour `limit`."""
+        line_count = content.count("\n") + 1
+        block, mode = None, None
+        outline = self.outline(content)
+        if outline:
+            candidate = self._render(path, outline, f"plan, {line_count} lignes")
+            if estimate_tokens(candidate) <= limit:
+                block, mode = candidate, "outline"
+        # Un extrait ciblé en plus du plan (ou à la place) s'il reste de la place
+        room = limit - (estimate_tokens(block) if block else 0)
+        if room >= MIN_USEFUL_TOKENS:
+            body = self.excerpt(content, terms, room - 30)
+            if body:
+                extra = self._render(path, body, f"extrait, {line_count} lignes")
+                block = (block or "") + extra
+                mode = "outline+excerpt" if mode else "excerpt"
+        return block, mode
+
+    def _symbol_view(
+        self, path: str, content: str, file_symbols: FileSymbols, terms: Set[str], limit: int
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """Plan des symboles puis corps complets des symboles pertinents, tant qu'ils tiennent dans `limit`."""
+        lines = content.splitlines()
+        block = self._render(path, file_symbols.outline(), f"symboles, {len(lines)} lignes")
+        if estimate_tokens(block) > limit:
+            return None, None
+        mode = "outline"
+        used = estimate_tokens(block)
+        taken: List[Tuple[int, int]] = []
+        for _, symbol in relevant_symbols(file_symbols, lines, terms):
+            if any(start <= symbol.start and symbol.end <= end for start, end in taken):
+                continue  # Déjà inclus dans un symbole englobant
+            body = "\n".join(f"{i:>5}: {lines[i - 1]}" for i in range(symbol.start, min(symbol.end, len(lines)) + 1))
+            extra = self._render(path, body, f"{symbol.kind} {symbol.name}, lignes {symbol.start}-{symbol.end}")
+            cost = estimate_tokens(extra)
+            if used + cost > limit:
+                continue
+            block += extra
+            used += cost
+            taken.append((symbol.start, symbol.end))
+            mode = "outline+symbols"
+        return block, mode
+
+    def pack(self, candidates: List[str], query: str, required: Optional[List[str]] = None) -> Tuple[str, PackReport]:
+        """
+        Construit la section "fichiers" du contexte.
+
+        Args:
+            candidates: Fichiers classés par pertinence décroissante
+            query: Instruction (pour choisir les extraits)
+            required: Fichiers demandés explicitement (passent en premier)
+
+        Returns:
+            Tuple (texte du contexte, rapport)
+        """
+        report = PackReport(budget=self.budget)
+        terms = set(tokenize(query))
+        parts: List[str] = []
+        required = required or []
+        ordered = list(dict.fromkeys(required + candidates))
+        per_file_cap = max(MIN_USEFUL_TOKENS, int(self.budget * MAX_SHARE_PER_FILE))
+        rank = 0
+
+        for path in ordered:
+            remaining = self.budget - report.used
+            content = self.read_file(path)
+            if content is None:
+                if path in required:
+                    report.missing.append(path)
+                    parts.append(f"\n⚠️ {path}: fichier non trouvé")
+                continue
+            if remaining < MIN_USEFUL_TOKENS:
+                report.dropped.append(path)
+                continue
+
+            limit = min(remaining, per_file_cap)
+            file_symbols = self.symbols(path, content) if self.symbols else None
+            if file_symbols is not None and not file_symbols.symbols:
+                file_symbols = None
+            seen = path not in required and self.already_sent is not None and self.already_sent(path, content)
+            secondary = seen or (self.full_files > 0 and path not in required and rank >= self.full_files)
+            if path not in required:
+                rank += 1
+
+            block, mode = self._render(path, content), "full"
+            tokens = estimate_tokens(block)
+            if file_symbols is not None and (tokens > limit or (secondary and tokens > MIN_SYMBOL_VIEW_TOKENS)):
+                view, view_mode = self._symbol_view(path, content, file_symbols, terms, limit)
+                if view is not None and (tokens > limit or estimate_tokens(view) < tokens):
+                    block, mode = view, view_mode
+                    tokens = estimate_tokens(block)
+            if seen and mode == "full" and MIN_SYMBOL_VIEW_TOKENS < tokens <= limit:
+                # Sans symboles: plan et extrait, au plus un tiers du fichier complet
+                view, view_mode = self._reduced_view(path, content, terms, max(MIN_SYMBOL_VIEW_TOKENS, tokens // 3))
+                if view is not None:
+                    block, mode = view, view_mode
+                    tokens = estimate_tokens(block)
+            if tokens > limit:
+                block, mode = self._reduced_view(path, content, terms, limit)
+                if block is None:
+                    report.dropped.append(path)
+                    continue
+                tokens = estimate_tokens(block)
+
+            if seen and mode != "full":
+                report.unchanged.append(path)
+            parts.append(block)
+            report.used += tokens
+            report.included.append(PackedFile(path, mode, tokens))
+
+        return "\n".join(parts), report
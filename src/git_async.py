@@ -0,0 +1,152 @@
+"""
+Git asynchrone - Façade de GitManager pour le bot, hors de la boucle d'événements
+Pool de threads borné dédié, délais, annulation (processus git arrêtés) et sérialisation par dépôt.
+"""
+
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Tuple, Callable, Any
+
+from .git_manager import GitManager
+
+logger = logging.getLogger(__name__)
+
+# Un verrou par dépôt, partagé par toutes les façades du processus
+_REPO_LOCKS: Dict[str, threading.Lock] = {}
+_REPO_LOCKS_GUARD = threading.Lock()
+
+
+def repo_lock(path: str) -> threading.Lock:
+    """Verrou des opérations qui modifient l'index ou l'arbre de travail d'un dépôt."""
+    key = os.path.realpath(path)
+    with _REPO_LOCKS_GUARD:
+        lock = _REPO_LOCKS.get(key)
+        if lock is None:
+            lock = _REPO_LOCKS[key] = threading.Lock()
+        return lock
+
+
+class _Job:
+    """Une opération soumise au pool: thread qui l'exécute et état d'annulation."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread: Optional[int] = None
+        self.cancelled = False
+        self.done = False
+
+
+class AsyncGitManager:
+    """
+    Exécute les méthodes de GitManager dans un pool de threads dédié et borné.
+
+    Les opérations qui écrivent (stage, commit, push, reset) passent une à
+    une par dépôt ; les lectures (statut, diffs) n'attendent pas : elles
+    utilisent `--no-optional-locks` et ne touchent jamais l'index. Une
+    opération qui dépasse son délai, ou dont la tâche est annulée (/cancel),
+    voit ses processus git arrêtés ; les étapes suivantes ne sont pas lancées.
+    """
+
+    def __init__(self, manager: GitManager, workers: int = 2, timeout: float = 120.0, read_timeout: float = 30.0):
+        """
+        Args:
+            manager: Gestionnaire Git synchrone
+            workers: Threads du pool (opérations Git simultanées)
+            timeout: Délai maximal d'une opération qui écrit (push compris), en secondes
+            read_timeout: Délai maximal d'une lecture (statut, diff)
+        """
+        self.manager = manager
+        self.timeout = timeout
+        self.read_timeout = read_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="git")
+        self._lock = repo_lock(manager.workspace_path)
+
+    async def _run(self, label: str, func: Callable[..., Any], *args, exclusive: bool, timeout: float) -> Any:
+        """
+        Exécute `func(*args)` dans le pool.
+
+        Raises:
+            asyncio.TimeoutError: délai dépassé (processus git arrêtés)
+            asyncio.CancelledError: tâche annulée (processus git arrêtés)
+        """
+        runner = self.manager.runner
+        job = _Job()
+
+        def work():
+            thread = threading.get_ident()
+            with job.lock:
+                if job.cancelled:
+                    return None
+                job.thread = thread
+                runner.reset_thread(thread)
+            try:
+                if not exclusive:
+                    return func(*args)
+                with self._lock:
+                    with job.lock:
+                        if job.cancelled:
+                            return None
+                    return func(*args)
+            finally:
+                with job.lock:
+                    job.done = True
+
+        loop = asyncio.get_running_loop()
+        try:
+            return await asyncio.wait_for(loop.run_in_executor(self._executor, work), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with job.lock:
+                job.cancelled = True
+                if job.thread is not None and not job.done:
+                    runner.cancel_thread(job.thread)
+            reason = "annulé" if isinstance(e, asyncio.CancelledError) else f"interrompu après {timeout:.0f}s"
+            logger.warning(f"⏱️ Git {label} {reason}")
+            raise
+
+    async def get_status(self) -> str:
+        try:
+            return await self._run("status", self.manager.get_status, exclusive=False, timeout=self.read_timeout)
+        except asyncio.TimeoutError:
+            return f"❌ Erreur: statut non obtenu en {self.read_timeout:.0f}s"
+
+    async def get_diff(self, staged: bool = True) -> str:
+        try:
+            return await self._run("diff", self.manager.get_diff, staged, exclusive=False, timeout=self.read_timeout)
+        except asyncio.TimeoutError:
+            return f"Erreur: diff non obtenu en {self.read_timeout:.0f}s"
+
+    async def get_detailed_diff(self, max_lines: int = 50) -> str:
+        try:
+            return await self._run(
+                "diff", self.manager.get_detailed_diff, max_lines, exclusive=False, timeout=self.read_timeout,
+            )
+        except asyncio.TimeoutError:
+            return f"Erreur: diff non obtenu en {self.read_timeout:.0f}s"
+
+    async def deploy(self, commit_message: str = "Update via Mobile Telegram") -> Tuple[bool, str]:
+        try:
+            return await self._run("deploy", self.manager.deploy, commit_message, exclusive=True, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            return False, f"⏱️ Déploiement interrompu après {self.timeout:.0f}s (réseau lent ?)"
+
+    async def reset_changes(self) -> Tuple[bool, str]:
+        try:
+            return await self._run("reset", self.manager.reset_changes, exclusive=True, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            return False, f"⏱️ Annulation interrompue après {self.timeout:.0f}s"
+
+    async def get_last_commit_url(self, github_url: str) -> str:
+        try:
+            return await self._run(
+                "url", self.manager.get_last_commit_url, github_url, exclusive=False, timeout=self.read_timeout,
+            )
+        except asyncio.TimeoutError:
+            return ""
+
+    def close(self) -> None:
+        """Arrête le pool (les opérations en cours se terminent) et les processus git persistants."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.manager.close()
@@ -3,9 +3,14 @@ Gestionnaire Git - Gère les opérations git (add, commit, push)
 """
 
 import os
+import time
 import logging
-from typing import Optional, Tuple
-from git import Repo, InvalidGitRepositoryError, GitCommandError, BadName
+from typing import Optional, List, Dict, Tuple
+from git import Repo, InvalidGitRepositoryError, GitCommandError
+
+from .metrics import METRICS
+from .git_runner import GitRunner
+from .git_status import GitStatus, iter_records, parse_porcelain_v2
 
 logger = logging.getLogger(__name__)
 
@@ -13,18 +18,28 @@ logger = logging.getLogger(__name__)
 class GitManager:
     """Gère les opérations Git pour le déploiement automatique."""
 
-    def __init__(self, workspace_path: str, branch: str = "main"):
+    def __init__(self, workspace_path: str, branch: str = "main", workspace_index=None):
         """
         Initialise le gestionnaire Git.
         
         Args:
             workspace_path: Chemin vers le répertoire de travail Git
             branch: Branche sur laquelle pousser les modifications
+            workspace_index: Index du workspace (WorkspaceIndex) dont les
+                changements invalident le statut mis en cache
         """
         self.workspace_path = workspace_path
         self.branch = branch
         self.repo: Optional[Repo] = None
+        self.workspace_index = workspace_index
+        # Statut gardé tant que ni le workspace ni les métadonnées Git n'ont changé (0 = pas de cache)
+        self.status_cache_seconds = float(os.getenv("GIT_STATUS_CACHE_SECONDS", "60"))
+        self._status_cache: Optional[Tuple[tuple, float, GitStatus]] = None
+        self._upstream: Optional[str] = None  # Upstream du dernier statut lu
+        # Commit de chaque branche sur origin (après notre dernier push, ou ls-remote après un rejet)
+        self._remote_heads: Dict[str, Optional[str]] = {}
         self._init_repo()
+        self.runner = GitRunner(self.repo.working_tree_dir)
 
     def _init_repo(self) -> None:
         """Initialise la connexion au dépôt Git."""
@@ -35,32 +50,76 @@ class GitManager:
             logger.error(f"❌ Pas de dépôt Git trouvé dans: {self.workspace_path}")
             raise ValueError(f"Le chemin {self.workspace_path} n'est pas un dépôt Git valide")
 
+    def _status_key(self, upstream: Optional[str]) -> Optional[tuple]:
+        """
+        Clé de validité du statut en cache: jeton de l'index du workspace et
+        empreintes (mtime, taille) de l'index Git, de HEAD et des références
+        de la branche. None si les changements du workspace ne sont pas suivis
+        en continu (pas d'index, ou index sans watchdog): pas de cache, chaque
+        /status relit git.
+        """
+        token = self.workspace_index.change_token() if self.workspace_index is not None else None
+        if token is None:
+            return None
+        git_dir = self.repo.git_dir
+        names = ["index", "HEAD", "packed-refs", os.path.join("refs", "heads", self.branch)]
+        if upstream:
+            names.append(os.path.join("refs", "remotes", upstream))
+        stamps = []
+        for name in names:
+            try:
+                st = os.stat(os.path.join(git_dir, name))
+                stamps.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                stamps.append(None)
+        return (token, tuple(stamps))
+
+    def invalidate_status(self) -> None:
+        """Oublie le statut en cache (après une opération Git du bot)."""
+        self._status_cache = None
+
+    def read_status(self) -> GitStatus:
+        """
+        Statut complet du dépôt en un seul appel à `git status --porcelain=v2`,
+        analysé au fil de la lecture. Réutilisé tant que l'index du workspace
+        ne signale aucun changement.
+
+        Raises:
+            GitCommandError: si git échoue
+        """
+        cached = self._status_cache
+        if cached is not None and self.status_cache_seconds > 0:
+            key, at, status = cached
+            if time.monotonic() - at < self.status_cache_seconds and key == self._status_key(self._upstream):
+                return status
+
+        with METRICS.span("git_status"):
+            # Clé prise avant l'appel: un changement pendant la lecture invalide le résultat
+            upstream = self._upstream
+            key = self._status_key(upstream)
+            with self.runner.stream(
+                "--no-optional-locks", "status", "--porcelain=v2", "-z", "--branch", "--untracked-files=all",
+            ) as chunks:
+                status = parse_porcelain_v2(iter_records(chunks))
+
+        self._upstream = status.upstream
+        if key is not None and status.upstream == upstream:
+            self._status_cache = (key, time.monotonic(), status)
+        else:
+            # Pas de suivi des changements, ou upstream changé: clé incomplète
+            self._status_cache = None
+        return status
+
     def get_status(self) -> str:
         """Retourne le statut actuel du dépôt."""
         if not self.repo:
             return "❌ Dépôt non initialisé"
-        
-        status_lines = []
-        
-        # Fichiers modifiés
-        changed = [item.a_path for item in self.repo.index.diff(None)]
-        if changed:
-            status_lines.append(f"📝 Modifiés: {', '.join(changed)}")
-        
-        # Fichiers non suivis
-        untracked = self.repo.untracked_files
-        if untracked:
-            status_lines.append(f"🆕 Non suivis: {', '.join(untracked)}")
-        
-        # Fichiers stagés
-        staged = [item.a_path for item in self.repo.index.diff("HEAD")]
-        if staged:
-            status_lines.append(f"✅ Stagés: {', '.join(staged)}")
-        
-        if not status_lines:
-            return "✨ Répertoire de travail propre"
-        
-        return "\n".join(status_lines)
+
+        try:
+            return self.read_status().render()
+        except (GitCommandError, OSError) as e:
+            logger.error(f"Erreur lors de la lecture du statut: {e}")
+            return f"❌ Erreur: {str(e)}"
 
     def get_diff(self, staged: bool = True) -> str:
         """
@@ -74,9 +133,9 @@ class GitManager:
         
         try:
             if staged:
-                diff = self.repo.git.diff("--cached", "--stat")
+                diff = self.runner.run("--no-optional-locks", "diff", "--cached", "--stat")
             else:
-                diff = self.repo.git.diff("--stat")
+                diff = self.runner.run("--no-optional-locks", "diff", "--stat")
             
             if not diff:
                 return "Aucune modification"
@@ -92,7 +151,7 @@ class GitManager:
             return ""
         
         try:
-            diff = self.repo.git.diff("--cached")
+            diff = self.runner.run("--no-optional-locks", "diff", "--cached")
             lines = diff.split("\n")
             
             if len(lines) > max_lines:
@@ -113,19 +172,35 @@ class GitManager:
             return False, "❌ Dépôt non initialisé"
         
         try:
-            self.repo.git.add(".")
+            self.runner.run("add", ".")
+            self.invalidate_status()
             logger.info("✅ Tous les fichiers ont été stagés")
             return True, "✅ Fichiers stagés avec succès"
         except GitCommandError as e:
             logger.error(f"❌ Erreur lors du staging: {e}")
             return False, f"❌ Erreur: {str(e)}"
 
-    def commit(self, message: str = "Update via Mobile Telegram") -> Tuple[bool, str]:
+    def _has_staged_changes(self) -> bool:
+        """Des changements stagés diffèrent de HEAD (tout l'index avant le premier commit)."""
+        if self.runner.object_header("HEAD") is None:
+            # Premier commit: HEAD n'existe pas encore, vérifier directement les entrées de l'index
+            return len(self.repo.index.entries) > 0
+        try:
+            self.runner.run("diff", "--cached", "--quiet")
+            return False
+        except GitCommandError as e:
+            if e.status == 1:
+                return True
+            raise
+
+    def commit(self, message: str = "Update via Mobile Telegram", check_staged: bool = True) -> Tuple[bool, str]:
         """
         Crée un commit avec le message spécifié.
         
         Args:
             message: Message du commit
+            check_staged: Vérifier qu'il y a des changements stagés (inutile
+                si l'appelant vient de lire un diff non vide)
             
         Returns:
             Tuple (succès, message/hash du commit)
@@ -134,21 +209,11 @@ class GitManager:
             return False, "❌ Dépôt non initialisé"
         
         try:
-            # Vérifier s'il y a des changements stagés
-            # Pour le premier commit, HEAD n'existe pas, donc on vérifie différemment
-            has_staged_changes = False
-            try:
-                # Essayer de vérifier avec HEAD si des commits existent
-                staged_changes = list(self.repo.index.diff("HEAD"))
-                has_staged_changes = len(staged_changes) > 0
-            except (ValueError, BadName):
-                # Si HEAD n'existe pas (premier commit), vérifier directement les entrées de l'index
-                has_staged_changes = len(self.repo.index.entries) > 0
-            
-            if not has_staged_changes:
+            if check_staged and not self._has_staged_changes():
                 return False, "⚠️ Aucun changement à commiter"
             
             commit = self.repo.index.commit(message)
+            self.invalidate_status()
             commit_hash = commit.hexsha[:8]
             logger.info(f"✅ Commit créé: {commit_hash}")
             return True, f"✅ Commit: {commit_hash}"
@@ -159,9 +224,42 @@ class GitManager:
             logger.error(f"❌ Erreur inattendue lors du commit: {e}")
             return False, f"❌ Erreur: {str(e)}"
 
+    @staticmethod
+    def _parse_push(output: str) -> List[Tuple[str, str, str]]:
+        """Lignes `git push --porcelain`: (drapeau, référence, résumé) ; "!" = rejetée."""
+        results = []
+        for line in output.splitlines():
+            parts = line.split("\t")
+            if len(parts) >= 3 and len(parts[0]) == 1:
+                results.append((parts[0], parts[1], parts[2]))
+        return results
+
+    def remote_head(self, branch: Optional[str] = None, refresh: bool = False) -> Optional[str]:
+        """
+        Commit de la branche sur origin (None si elle n'y existe pas), lu par
+        un `ls-remote` limité à cette branche puis gardé en cache.
+        """
+        branch = branch or self.branch
+        if refresh or branch not in self._remote_heads:
+            output = self.runner.run("ls-remote", "--heads", "origin", f"refs/heads/{branch}")
+            sha = None
+            for line in output.splitlines():
+                found, _, ref = line.partition("\t")
+                if ref == f"refs/heads/{branch}":
+                    sha = found
+            self._remote_heads[branch] = sha
+        return self._remote_heads[branch]
+
     def push(self) -> Tuple[bool, str]:
         """
         Pousse les modifications vers le dépôt distant.
+
+        Le push est tenté directement, sans fetch préalable : sa durée ne dépend
+        plus du nombre de branches et de tags du remote. L'upstream n'est
+        configuré (-u) que si la branche n'en a pas encore ; l'état du remote
+        n'est relu (ls-remote de la seule branche) qu'en cas de rejet. Si le
+        dernier commit connu d'origin est déjà celui de la branche, aucun
+        push n'est lancé.
         
         Returns:
             Tuple (succès, message)
@@ -180,34 +278,41 @@ class GitManager:
                 branch_ref = self.repo.heads[current_branch]
                 self.branch = current_branch
             
-            origin = self.repo.remote("origin")
+            if "origin" not in [remote.name for remote in self.repo.remotes]:
+                return False, "❌ Aucun remote 'origin' configuré"
             
-            # Vérifier si c'est le premier push (pas de branche distante)
-            try:
-                origin.fetch()
-                remote_ref = f"origin/{self.branch}"
-                # Si la branche distante n'existe pas, utiliser set_upstream
-                if remote_ref not in [ref.name for ref in self.repo.refs]:
-                    logger.info(f"🆕 Premier push vers {self.branch}, configuration upstream...")
-                    push_info = origin.push(branch_ref, set_upstream=True)
-                else:
-                    push_info = origin.push(branch_ref)
-            except Exception:
-                # Si fetch échoue, essayer directement avec set_upstream
+            # Lecture de .git/config, sans processus ni accès réseau
+            tracking = branch_ref.tracking_branch()
+            if tracking is not None and self._remote_heads.get(self.branch) == branch_ref.commit.hexsha:
+                logger.info(f"✅ origin/{self.branch} déjà à jour, push inutile")
+                return True, f"✅ origin/{self.branch} déjà à jour"
+            args = ["push", "--porcelain", "origin", f"refs/heads/{self.branch}:refs/heads/{self.branch}"]
+            if tracking is None:
                 logger.info(f"🆕 Premier push vers {self.branch}, configuration upstream...")
-                push_info = origin.push(branch_ref, set_upstream=True)
+                args.insert(1, "--set-upstream")
             
-            # Vérifier les résultats du push
-            for info in push_info:
-                if info.flags & info.ERROR:
-                    error_msg = info.summary or str(info)
-                    logger.error(f"❌ Erreur push: {error_msg}")
-                    return False, f"❌ Erreur push: {error_msg}"
-                elif info.flags & info.REJECTED:
-                    logger.error(f"❌ Push rejeté: {info.summary}")
-                    return False, f"❌ Push rejeté: {info.summary}"
+            returncode, output, stderr = self.runner.execute(*args)
+            results = self._parse_push(output)
+            rejected = [r for r in results if r[0] == "!"]
+            if rejected:
+                summary = rejected[0][2]
+                remote_sha = self.remote_head(refresh=True)
+                logger.error(f"❌ Push rejeté: {summary}")
+                if remote_sha and remote_sha != branch_ref.commit.hexsha:
+                    return False, (
+                        f"❌ Push rejeté: {summary}\n"
+                        f"origin/{self.branch} est à {remote_sha[:8]}: récupère ses changements (git pull) puis redéploie."
+                    )
+                return False, f"❌ Push rejeté: {summary}"
+            if returncode != 0:
+                raise GitCommandError(["git", *args], returncode, stderr)
             
+            self._remote_heads[self.branch] = branch_ref.commit.hexsha
+            self.invalidate_status()
+            up_to_date = bool(results) and all(flag == "=" for flag, _, _ in results)
             logger.info(f"✅ Push réussi vers {self.branch}")
+            if up_to_date:
+                return True, f"✅ origin/{self.branch} déjà à jour"
             return True, f"✅ Push vers origin/{self.branch} réussi"
         except GitCommandError as e:
             error_msg = str(e)
@@ -237,22 +342,29 @@ class GitManager:
         report = []
         
         # Étape 1: Stage
-        success, msg = self.stage_all()
+        with METRICS.span("git_stage"):
+            success, msg = self.stage_all()
         report.append(f"1️⃣ Stage: {msg}")
         if not success:
             return False, "\n".join(report)
         
         # Récupérer le diff avant commit
-        diff = self.get_diff(staged=True)
+        with METRICS.span("git_diff"):
+            diff = self.get_diff(staged=True)
         
-        # Étape 2: Commit
-        success, msg = self.commit(commit_message)
+        # Étape 2: Commit (un diff lisible et non vide suffit à savoir qu'il y a des changements stagés)
+        with METRICS.span("git_commit"):
+            if diff == "Aucune modification":
+                success, msg = False, "⚠️ Aucun changement à commiter"
+            else:
+                success, msg = self.commit(commit_message, check_staged=diff.startswith("Erreur"))
         report.append(f"2️⃣ Commit: {msg}")
         if not success:
             return False, "\n".join(report)
         
         # Étape 3: Push
-        success, msg = self.push()
+        with METRICS.span("git_push"):
+            success, msg = self.push()
         report.append(f"3️⃣ Push: {msg}")
         
         if success:
@@ -272,7 +384,9 @@ class GitManager:
             return ""
         
         try:
-            commit_hash_full = self.repo.head.commit.hexsha
+            commit_hash_full = self.runner.rev_parse("HEAD")
+            if not commit_hash_full:
+                return ""
             # Utiliser un hash court (7 caractères) pour l'URL GitHub
             commit_hash = commit_hash_full[:7]
             
@@ -310,8 +424,15 @@ class GitManager:
             return False, "❌ Dépôt non initialisé"
         
         try:
-            self.repo.git.checkout("--", ".")
-            self.repo.git.clean("-fd")
+            # Toujours lancés: le statut en cache peut ignorer une modification externe récente
+            self.runner.run("checkout", "--", ".")
+            self.runner.run("clean", "-fd")
             return True, "✅ Modifications annulées"
         except GitCommandError as e:
             return False, f"❌ Erreur: {str(e)}"
+        finally:
+            self.invalidate_status()
+
+    def close(self) -> None:
+        """Arrête les processus git persistants."""
+        self.runner.close()
@@ -0,0 +1,265 @@
+"""
+Exécution Git - Processus `git cat-file --batch-check` persistant pour la résolution des révisions
+Les autres commandes sont lancées une à une, comptées et chronométrées par sous-commande.
+"""
+
+import os
+import time
+import signal
+import logging
+import threading
+import subprocess
+from contextlib import contextmanager
+from typing import Optional, List, Dict, Set, Tuple, Iterator
+from git import Git, GitCommandError
+
+from .metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Taille des lectures sur la sortie d'une commande lue au fil de l'eau
+READ_CHUNK = 64 * 1024
+
+
+def _git_env() -> Dict[str, str]:
+    """Environnement des commandes: messages non traduits (sorties analysées), pas d'invite interactive."""
+    env = dict(os.environ)
+    env.update({"LANGUAGE": "C", "LC_ALL": "C", "GIT_TERMINAL_PROMPT": "0"})
+    return env
+
+
+def _kill_tree(proc: subprocess.Popen) -> None:
+    """Arrête git et ses sous-processus (ssh, remote-https…) qui garderaient les tubes ouverts."""
+    try:
+        if os.name == "posix":
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except OSError:
+        pass
+
+
+class _BatchProcess:
+    """Un `git cat-file --batch-check` gardé ouvert, relancé s'il meurt."""
+
+    def __init__(self, runner: "GitRunner", option: str):
+        self.runner = runner
+        self.option = option
+        self._proc: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+
+    def _start(self) -> subprocess.Popen:
+        if self._proc is None or self._proc.poll() is not None:
+            self.runner._count_fork("cat-file")
+            self._proc = subprocess.Popen(
+                [self.runner.git, "cat-file", self.option],
+                cwd=self.runner.path, env=self.runner.env,
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            )
+        return self._proc
+
+    def query(self, rev: str) -> Optional[Tuple[str, str, int]]:
+        """(sha, type, taille) de l'objet, None s'il n'existe pas."""
+        if not rev or "\n" in rev:
+            return None
+        start = time.perf_counter()
+        with self._lock:
+            for attempt in (0, 1):
+                proc = self._start()
+                try:
+                    proc.stdin.write(rev.encode("utf-8", "surrogateescape") + b"\n")
+                    proc.stdin.flush()
+                    header = proc.stdout.readline()
+                    if not header:
+                        raise BrokenPipeError("cat-file terminé")
+                    parts = header.decode("utf-8", "replace").split()
+                    if len(parts) != 3:
+                        return None  # "<rev> missing" ou "<rev> ambiguous"
+                    sha, kind, size = parts[0], parts[1], int(parts[2])
+                    break
+                except (BrokenPipeError, OSError, ValueError) as e:
+                    self._kill()
+                    if attempt:
+                        logger.warning(f"⚠️ git cat-file {self.option} indisponible: {e}")
+                        return None
+        METRICS.observe("git_cat_file", time.perf_counter() - start)
+        return sha, kind, size
+
+    def _kill(self) -> None:
+        if self._proc is not None:
+            try:
+                self._proc.kill()
+                self._proc.wait(timeout=1)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+            self._proc = None
+
+    def close(self) -> None:
+        with self._lock:
+            if self._proc is not None:
+                try:
+                    self._proc.stdin.close()
+                    self._proc.wait(timeout=1)
+                except (OSError, subprocess.TimeoutExpired):
+                    self._kill()
+                self._proc = None
+
+
+class GitRunner:
+    """
+    Lance les commandes git d'un dépôt.
+
+    Les résolutions de révisions (HEAD, commit d'une branche) passent par un
+    processus `git cat-file --batch-check` persistant, sans fork par lecture. Les
+    commandes porcelaine (add, diff, checkout, clean, push…) n'ont pas de
+    mode persistant côté git : elles restent un processus chacune, mais sont
+    comptées (`forks`) et chronométrées par sous-commande dans METRICS
+    (étape "git_exec").
+
+    Les processus en cours sont rattachés au thread qui les a lancés :
+    `cancel_thread` les arrête et fait échouer les commandes suivantes de
+    ce thread jusqu'au prochain `reset_thread` (annulation d'une opération
+    lancée par la façade asynchrone).
+    """
+
+    def __init__(self, path: str, git: Optional[str] = None):
+        """
+        Args:
+            path: Racine du dépôt (répertoire de travail)
+            git: Exécutable git (défaut: celui de GitPython)
+        """
+        self.path = path
+        self.git = git or Git.GIT_PYTHON_GIT_EXECUTABLE or "git"
+        self.env = _git_env()
+        self.forks = 0
+        self.forks_by_command: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._active: Dict[int, Set[subprocess.Popen]] = {}  # thread -> processus en cours
+        self._cancelled: Set[int] = set()
+        self._check = _BatchProcess(self, "--batch-check")
+
+    def _count_fork(self, command: str) -> None:
+        with self._lock:
+            self.forks += 1
+            self.forks_by_command[command] = self.forks_by_command.get(command, 0) + 1
+
+    def _command(self, args: Tuple[str, ...]) -> Tuple[List[str], str]:
+        """Ligne de commande et sous-commande (après les options globales comme --no-optional-locks)."""
+        name = next((a for a in args if not a.startswith("-")), "git")
+        return [self.git, *args], name
+
+    def _spawn(self, command: List[str], stdin: Optional[int] = None) -> subprocess.Popen:
+        thread = threading.get_ident()
+        with self._lock:
+            if thread in self._cancelled:
+                raise GitCommandError(command, "annulé")
+            proc = subprocess.Popen(
+                command, cwd=self.path, env=self.env, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                start_new_session=os.name == "posix",  # groupe de processus arrêté d'un bloc
+            )
+            self._active.setdefault(thread, set()).add(proc)
+        return proc
+
+    def _release(self, proc: subprocess.Popen) -> None:
+        with self._lock:
+            procs = self._active.get(threading.get_ident())
+            if procs is not None:
+                procs.discard(proc)
+
+    def execute(self, *args: str, input: Optional[bytes] = None, timeout: Optional[float] = None) -> Tuple[int, str, str]:
+        """
+        Exécute une commande et retourne (code de retour, sortie, erreurs) sans
+        lever d'exception si git échoue.
+
+        Raises:
+            GitCommandError: si la commande est annulée ou dépasse `timeout`
+        """
+        command, name = self._command(args)
+        with METRICS.span("git_exec", provider=name):
+            proc = self._spawn(command, subprocess.PIPE if input is not None else None)
+            self._count_fork(name)
+            try:
+                stdout, stderr = proc.communicate(input, timeout=timeout)
+            except subprocess.TimeoutExpired as e:
+                _kill_tree(proc)
+                proc.communicate()
+                raise GitCommandError(command, f"délai de {timeout:.0f}s dépassé") from e
+            finally:
+                self._release(proc)
+        return proc.returncode, stdout.decode("utf-8", "replace"), stderr.decode("utf-8", "replace")
+
+    def run(self, *args: str, input: Optional[bytes] = None, timeout: Optional[float] = None) -> str:
+        """
+        Exécute une commande et retourne sa sortie (sans le dernier saut de ligne).
+
+        Raises:
+            GitCommandError: si git échoue (code de retour non nul), est annulé ou dépasse `timeout`
+        """
+        returncode, out, err = self.execute(*args, input=input, timeout=timeout)
+        if returncode != 0:
+            raise GitCommandError(self._command(args)[0], returncode, err)
+        return out[:-1] if out.endswith("\n") else out
+
+    @contextmanager
+    def stream(self, *args: str) -> Iterator[Iterator[bytes]]:
+        """
+        Exécute une commande dont la sortie est lue par blocs au fil de l'eau.
+
+        Raises:
+            GitCommandError: si git échoue (à la sortie du bloc)
+        """
+        command, name = self._command(args)
+        with METRICS.span("git_exec", provider=name):
+            proc = self._spawn(command)
+            self._count_fork(name)
+            # stderr vidé en parallèle: un tube d'erreurs plein bloquerait git (et la lecture de stdout)
+            errors: List[bytes] = []
+            drain = threading.Thread(target=lambda: errors.append(proc.stderr.read()), daemon=True)
+            drain.start()
+            try:
+                yield iter(lambda: proc.stdout.read(READ_CHUNK), b"")
+            finally:
+                proc.stdout.close()
+                returncode = proc.wait()
+                drain.join()
+                proc.stderr.close()
+                self._release(proc)
+            if returncode != 0:
+                raise GitCommandError(command, returncode, b"".join(errors))
+
+    def cancel_thread(self, thread: int) -> None:
+        """Arrête les commandes lancées par un thread et refuse les suivantes."""
+        with self._lock:
+            self._cancelled.add(thread)
+            procs = list(self._active.get(thread, ()))
+        for proc in procs:
+            _kill_tree(proc)
+
+    def reset_thread(self, thread: int) -> None:
+        """Le thread peut de nouveau lancer des commandes (début d'une nouvelle opération)."""
+        with self._lock:
+            self._cancelled.discard(thread)
+            self._active.pop(thread, None)
+
+    def object_header(self, rev: str) -> Optional[Tuple[str, str, int]]:
+        """(sha, type, taille) d'un objet ou d'une révision ("HEAD", "HEAD^{tree}"…), None si absent."""
+        return self._check.query(rev)
+
+    def rev_parse(self, rev: str) -> Optional[str]:
+        """SHA complet d'une révision, sans lancer de processus."""
+        found = self.object_header(rev)
+        return found[0] if found else None
+
+    def stats(self) -> Dict[str, object]:
+        """Processus git lancés depuis le démarrage (total et par sous-commande)."""
+        with self._lock:
+            return {"forks": self.forks, "by_command": dict(self.forks_by_command)}
+
+    def summary(self) -> str:
+        stats = self.stats()
+        detail = ", ".join(f"{name} {count}" for name, count in sorted(stats["by_command"].items()))
+        return f"{stats['forks']} processus git" + (f" ({detail})" if detail else "")
+
+    def close(self) -> None:
+        """Arrête le processus cat-file persistant."""
+        self._check.close()
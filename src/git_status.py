@@ -0,0 +1,111 @@
+"""
+Statut Git - Lecture de `git status --porcelain=v2 -z --branch` en un seul passage
+Modifiés, non suivis, stagés, conflits et avance/retard sur l'upstream, sans parcourir l'index trois fois.
+"""
+
+import os
+from dataclasses import dataclass, field
+from typing import Optional, List, Tuple, Iterable, Iterator
+
+# Nombre maximal de fichiers listés par catégorie dans le message Telegram
+MAX_LISTED = 50
+
+
+@dataclass
+class GitStatus:
+    """Résultat d'un `git status` (chemins relatifs à la racine du dépôt)."""
+    branch: Optional[str] = None  # None si HEAD détachée
+    oid: Optional[str] = None  # None avant le premier commit
+    upstream: Optional[str] = None
+    ahead: int = 0
+    behind: int = 0
+    modified: List[str] = field(default_factory=list)  # modifiés dans l'arbre de travail
+    staged: List[str] = field(default_factory=list)  # différents de HEAD dans l'index
+    untracked: List[str] = field(default_factory=list)
+    conflicted: List[str] = field(default_factory=list)
+    renamed: List[Tuple[str, str]] = field(default_factory=list)  # (ancien, nouveau)
+
+    @property
+    def clean(self) -> bool:
+        return not (self.modified or self.staged or self.untracked or self.conflicted)
+
+    def render(self) -> str:
+        """Texte affiché par /status."""
+        lines = []
+        for label, paths in (
+            ("⚔️ Conflits", self.conflicted),
+            ("📝 Modifiés", self.modified),
+            ("🆕 Non suivis", self.untracked),
+            ("✅ Stagés", self.staged),
+        ):
+            if paths:
+                shown = ", ".join(paths[:MAX_LISTED])
+                if len(paths) > MAX_LISTED:
+                    shown += f" … (+{len(paths) - MAX_LISTED})"
+                lines.append(f"{label}: {shown}")
+        if not lines:
+            lines.append("✨ Répertoire de travail propre")
+        if self.upstream and (self.ahead or self.behind):
+            lines.append(f"🔀 {self.upstream}: {self.ahead} en avance, {self.behind} en retard")
+        return "\n".join(lines)
+
+
+def iter_records(chunks: Iterable[bytes]) -> Iterator[str]:
+    """Découpe la sortie `-z` en enregistrements au fil de la lecture."""
+    rest = b""
+    for chunk in chunks:
+        if not chunk:
+            continue
+        parts = (rest + chunk).split(b"\0")
+        rest = parts.pop()
+        for part in parts:
+            if part:
+                yield os.fsdecode(part)
+    if rest:
+        yield os.fsdecode(rest)
+
+
+def parse_porcelain_v2(records: Iterable[str]) -> GitStatus:
+    """
+    Analyse les enregistrements de `git status --porcelain=v2 -z --branch`.
+
+    Format (git-status(1)):
+        # branch.oid <commit> | (initial)
+        # branch.head <branche> | (detached)
+        # branch.upstream <upstream>
+        # branch.ab +<avance> -<retard>
+        1 <XY> <sub> <mH> <mI> <mW> <hH> <hI> <chemin>
+        2 <XY> <sub> <mH> <mI> <mW> <hH> <hI> <Xscore> <chemin>\\0<ancien chemin>
+        u <XY> <sub> <m1> <m2> <m3> <mW> <h1> <h2> <h3> <chemin>
+        ? <chemin>
+    X décrit l'index (par rapport à HEAD), Y l'arbre de travail ; "." = inchangé.
+    """
+    status = GitStatus()
+    records = iter(records)
+    for record in records:
+        kind = record[:1]
+        if kind == "#":
+            key, _, value = record[2:].partition(" ")
+            if key == "branch.oid":
+                status.oid = None if value == "(initial)" else value
+            elif key == "branch.head":
+                status.branch = None if value == "(detached)" else value
+            elif key == "branch.upstream":
+                status.upstream = value
+            elif key == "branch.ab":
+                ahead, _, behind = value.partition(" ")
+                status.ahead, status.behind = int(ahead), abs(int(behind))
+        elif kind == "1" or kind == "2":
+            fields = record.split(" ", 9 if kind == "2" else 8)
+            xy, path = fields[1], fields[-1]
+            if kind == "2":
+                status.renamed.append((next(records, ""), path))
+            if xy[0] != ".":
+                status.staged.append(path)
+            if xy[1] != ".":
+                status.modified.append(path)
+        elif kind == "u":
+            status.conflicted.append(record.split(" ", 10)[-1])
+        elif kind == "?":
+            status.untracked.append(record[2:])
+    return status
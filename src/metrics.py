@@ -0,0 +1,225 @@
+"""
+Mesures de latence - Durée de chaque étape (contexte, appel IA, parsing, écriture, git) par provider
+Percentiles sur une fenêtre glissante, export texte (Telegram) et Prometheus (fichier ou HTTP local).
+"""
+
+import os
+import time
+import logging
+import tempfile
+import threading
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, List, Dict, Any, Tuple, Iterator
+
+logger = logging.getLogger(__name__)
+
+# Percentiles publiés (Telegram et Prometheus)
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Ordre d'affichage des étapes connues (les autres suivent par ordre alphabétique)
+STAGE_ORDER = [
+    "instruction", "build_context", "rate_limit_wait", "provider_call", "first_token", "parse_response",
+    "validate", "apply_operations", "git_status", "git_diff", "deploy", "git_stage", "git_commit", "git_push",
+]
+
+
+class LatencyWindow:
+    """Dernières durées d'une étape (fenêtre glissante) et totaux depuis le démarrage."""
+
+    def __init__(self, size: int):
+        self.samples: deque = deque(maxlen=size)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+
+    def observe(self, seconds: float, error: bool = False) -> None:
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+        if error:
+            self.errors += 1
+
+    def percentiles(self) -> Dict[float, float]:
+        """Percentiles de la fenêtre (rang le plus proche)."""
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {q: 0.0 for q in QUANTILES}
+        return {q: ordered[min(len(ordered) - 1, max(0, int(q * len(ordered) + 0.5) - 1))] for q in QUANTILES}
+
+
+class Metrics:
+    """
+    Registre des durées par (étape, provider).
+
+    Usage:
+        with METRICS.span("build_context"):
+            ...
+        METRICS.observe("first_token", 0.42, provider="groq/llama-3.1-70b-versatile")
+    """
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self._series: Dict[Tuple[str, str], LatencyWindow] = {}
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def observe(self, stage: str, seconds: float, provider: str = "", error: bool = False) -> None:
+        """Enregistre une durée (en secondes) pour une étape."""
+        key = (stage, provider or "")
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = LatencyWindow(self.window)
+            series.observe(seconds, error)
+
+    def reset(self) -> None:
+        """Oublie toutes les mesures."""
+        with self._lock:
+            self._series.clear()
+
+    @contextmanager
+    def span(self, stage: str, provider: str = "") -> Iterator[None]:
+        """
+        Mesure la durée du bloc. Une exception est comptée comme erreur puis
+        propagée ; une annulation (tâche asyncio annulée) n'est pas mesurée.
+        """
+        start = time.perf_counter()
+        outcome: Optional[bool] = False
+        try:
+            yield
+        except Exception:
+            outcome = True
+            raise
+        except BaseException:
+            outcome = None
+            raise
+        finally:
+            if outcome is not None:
+                self.observe(stage, time.perf_counter() - start, provider, error=outcome)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Une ligne par (étape, provider): nombre, erreurs, moyenne, p50/p95/p99, max de la fenêtre."""
+        with self._lock:
+            items = [(key, series, list(series.samples)) for key, series in self._series.items()]
+        rank = {stage: i for i, stage in enumerate(STAGE_ORDER)}
+        items.sort(key=lambda item: (rank.get(item[0][0], len(rank)), item[0][0], item[0][1]))
+        rows = []
+        for (stage, provider), series, samples in items:
+            percentiles = series.percentiles()
+            rows.append({
+                "stage": stage,
+                "provider": provider,
+                "count": series.count,
+                "errors": series.errors,
+                "sum_s": series.total,
+                "avg_s": series.total / series.count if series.count else 0.0,
+                "p50_s": percentiles[0.5],
+                "p95_s": percentiles[0.95],
+                "p99_s": percentiles[0.99],
+                "max_s": max(samples) if samples else 0.0,
+            })
+        return rows
+
+    def render_text(self) -> str:
+        """Tableau compact pour Telegram (une ligne par étape)."""
+        rows = self.snapshot()
+        if not rows:
+            return "Aucune mesure pour l'instant."
+        lines = []
+        for row in rows:
+            label = row["stage"] + (f" [{row['provider']}]" if row["provider"] else "")
+            errors = f", {row['errors']} err." if row["errors"] else ""
+            lines.append(
+                f"{label}: {_fmt(row['p50_s'])} / {_fmt(row['p95_s'])} / {_fmt(row['p99_s'])} "
+                f"(n={row['count']}{errors})"
+            )
+        return "\n".join(lines)
+
+    def prometheus_text(self) -> str:
+        """Exposition au format texte Prometheus (un summary par étape)."""
+        name = "remotedev_stage_duration_seconds"
+        lines = [
+            f"# HELP {name} Durée des étapes du bot (fenêtre glissante pour les quantiles).",
+            f"# TYPE {name} summary",
+        ]
+        errors = []
+        for row in self.snapshot():
+            labels = f'stage="{_escape(row["stage"])}",provider="{_escape(row["provider"])}"'
+            for q in QUANTILES:
+                key = f"p{int(q * 100)}_s"
+                lines.append(f'{name}{{{labels},quantile="{q}"}} {row[key]:.6f}')
+            lines.append(f"{name}_sum{{{labels}}} {row['sum_s']:.6f}")
+            lines.append(f"{name}_count{{{labels}}} {row['count']}")
+            errors.append(f"remotedev_stage_errors_total{{{labels}}} {row['errors']}")
+        lines.append("# HELP remotedev_stage_errors_total Étapes terminées par une exception.")
+        lines.append("# TYPE remotedev_stage_errors_total counter")
+        lines.extend(errors)
+        lines.append("# HELP remotedev_start_time_seconds Démarrage du bot (epoch).")
+        lines.append("# TYPE remotedev_start_time_seconds gauge")
+        lines.append(f"remotedev_start_time_seconds {self.started:.0f}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """Écrit l'exposition dans un fichier (collecteur textfile de node_exporter), atomiquement."""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=directory, prefix=".metrics.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(self.prometheus_text())
+            os.chmod(temp, 0o644)
+            os.replace(temp, path)
+        except BaseException:
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+            raise
+
+    def export(self) -> None:
+        """Met à jour le fichier Prometheus si METRICS_PROMETHEUS_FILE est défini."""
+        path = os.getenv("METRICS_PROMETHEUS_FILE")
+        if not path:
+            return
+        try:
+            self.write_prometheus(path)
+        except OSError as e:
+            logger.warning(f"⚠️ Export Prometheus impossible ({path}): {e}")
+
+    def start_http_server(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """Sert /metrics en HTTP dans un thread (écoute locale par défaut)."""
+        metrics = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), _Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        logger.info(f"📈 Mesures Prometheus sur http://{host}:{server.server_port}/metrics")
+        return server
+
+
+def _fmt(seconds: float) -> str:
+    return f"{seconds * 1000:.0f}ms" if seconds < 1 else f"{seconds:.1f}s"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Registre partagé par le bot, le handler IA et le gestionnaire Git
+METRICS = Metrics(window=int(os.getenv("METRICS_WINDOW", "500")))
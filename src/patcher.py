@@ -0,0 +1,179 @@
+"""
+Patcher - Applique des blocs search/replace ou des hunks de diff unifié avec ancrage tolérant
+"""
+
+import re
+import logging
+from difflib import SequenceMatcher
+from typing import Optional, List, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Similarité minimale pour accepter un ancrage approximatif
+FUZZY_THRESHOLD = 0.85
+
+_HUNK_HEADER_RE = re.compile(r"^@@ .* @@")
+
+
+class PatchError(Exception):
+    """Un bloc ne peut pas être ancré dans le fichier."""
+
+
+def _indent(line: str) -> str:
+    return line[:len(line) - len(line.lstrip())]
+
+
+def _reindent(lines: List[str], source_indent: str, target_indent: str) -> List[str]:
+    """Décale l'indentation des lignes de remplacement comme celle du texte trouvé."""
+    if source_indent == target_indent:
+        return lines
+    out = []
+    for line in lines:
+        if line.strip() and line.startswith(source_indent):
+            out.append(target_indent + line[len(source_indent):])
+        elif line.strip() and not source_indent:
+            out.append(target_indent + line)
+        else:
+            out.append(line)
+    return out
+
+
+def _first_indent(lines: List[str]) -> str:
+    for line in lines:
+        if line.strip():
+            return _indent(line)
+    return ""
+
+
+def _find_block(lines: List[str], block: List[str]) -> Tuple[int, int, str]:
+    """
+    Localise `block` dans `lines`.
+
+    Returns:
+        (début, fin, méthode) — la fin est exclusive
+    """
+    n = len(block)
+    if n == 0:
+        raise PatchError("bloc de recherche vide")
+
+    # 1. Correspondance exacte ligne à ligne
+    exact = [i for i in range(len(lines) - n + 1) if lines[i:i + n] == block]
+    if len(exact) == 1:
+        return exact[0], exact[0] + n, "exact"
+    if len(exact) > 1:
+        raise PatchError(f"bloc ambigu ({len(exact)} occurrences)")
+
+    # 2. Correspondance en ignorant les espaces de début/fin de ligne
+    stripped = [line.strip() for line in lines]
+    target = [line.strip() for line in block]
+    loose = [i for i in range(len(lines) - n + 1) if stripped[i:i + n] == target]
+    if len(loose) == 1:
+        return loose[0], loose[0] + n, "espaces"
+    if len(loose) > 1:
+        raise PatchError(f"bloc ambigu ({len(loose)} occurrences)")
+
+    # 3. Ancrage approximatif: fenêtre de même taille la plus similaire
+    wanted = "\n".join(target)
+    best, best_ratio = None, 0.0
+    matcher = SequenceMatcher(autojunk=False)
+    matcher.set_seq2(wanted)
+    for size in {n, max(1, n - 1), n + 1}:
+        for i in range(len(lines) - size + 1):
+            matcher.set_seq1("\n".join(stripped[i:i + size]))
+            if matcher.real_quick_ratio() < FUZZY_THRESHOLD or matcher.quick_ratio() < FUZZY_THRESHOLD:
+                continue
+            ratio = matcher.ratio()
+            if ratio > best_ratio:
+                best, best_ratio = (i, i + size), ratio
+    if best and best_ratio >= FUZZY_THRESHOLD:
+        return best[0], best[1], f"approx {best_ratio:.0%}"
+    raise PatchError("bloc introuvable dans le fichier")
+
+
+def apply_search_replace(content: str, search: str, replace: str) -> Tuple[str, str]:
+    """
+    Remplace `search` par `replace` dans `content`.
+
+    Returns:
+        (nouveau contenu, méthode d'ancrage utilisée)
+    """
+    if search and content.count(search) == 1:
+        return content.replace(search, replace, 1), "exact"
+
+    lines = content.split("\n")
+    block = search.strip("\n").split("\n")
+    start, end, method = _find_block(lines, block)
+    replacement = replace.strip("\n").split("\n") if replace.strip("\n") else []
+    replacement = _reindent(replacement, _first_indent(block), _first_indent(lines[start:end]))
+    return "\n".join(lines[:start] + replacement + lines[end:]), method
+
+
+def parse_unified_diff(diff: str) -> List[Dict[str, str]]:
+    """Convertit des hunks de diff unifié en blocs search/replace."""
+    blocks = []
+    search, replace = [], []
+    in_hunk = False
+
+    def flush():
+        if search or replace:
+            blocks.append({"search": "\n".join(search), "replace": "\n".join(replace)})
+
+    for line in diff.split("\n"):
+        if line.startswith(("--- ", "+++ ", "diff ", "index ")) and not in_hunk:
+            continue
+        if _HUNK_HEADER_RE.match(line):
+            flush()
+            search, replace = [], []
+            in_hunk = True
+            continue
+        if not in_hunk:
+            continue
+        if line.startswith("\\"):
+            continue  # "\ No newline at end of file"
+        tag, text = (line[:1], line[1:]) if line else (" ", "")
+        if tag == "-":
+            search.append(text)
+        elif tag == "+":
+            replace.append(text)
+        else:
+            search.append(text)
+            replace.append(text)
+    flush()
+    return blocks
+
+
+def apply_patches(content: str, patches: Optional[List[Dict[str, str]]] = None, diff: Optional[str] = None) -> Tuple[str, List[str]]:
+    """
+    Applique une série de blocs (et/ou un diff unifié) au contenu d'un fichier.
+
+    Returns:
+        (nouveau contenu, méthodes d'ancrage utilisées)
+
+    Raises:
+        PatchError si un bloc ne peut pas être appliqué
+    """
+    blocks = list(patches or [])
+    if diff:
+        blocks.extend(parse_unified_diff(diff))
+    if not blocks:
+        raise PatchError("aucun bloc à appliquer")
+
+    methods = []
+    for number, block in enumerate(blocks, 1):
+        if not isinstance(block, dict):
+            raise PatchError(f"bloc {number} invalide")
+        search = block.get("search") or ""
+        replace = block.get("replace") or ""
+        if not isinstance(search, str) or not isinstance(replace, str):
+            raise PatchError(f"bloc {number}: search/replace doivent être du texte")
+        if not search.strip():
+            # Pas d'ancre: ajout en fin de fichier
+            content = content.rstrip("\n") + "\n" + replace.strip("\n") + "\n"
+            methods.append("ajout")
+            continue
+        try:
+            content, method = apply_search_replace(content, search, replace)
+        except PatchError as e:
+            raise PatchError(f"bloc {number}: {e}") from e
+        methods.append(method)
+    return content, methods
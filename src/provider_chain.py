@@ -0,0 +1,151 @@
+"""
+Chaîne de providers - Statistiques par provider, classement adaptatif et classification des erreurs
+"""
+
+import time
+import asyncio
+import logging
+from typing import Any, List, Optional, Dict
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+# Erreurs qui justifient de basculer sur le provider suivant
+FALLBACK_ERRORS = {"quota", "server", "timeout", "network", "invalid_json"}
+
+# Lissage exponentiel des latences et du taux d'échec
+EWMA_ALPHA = 0.3
+
+
+@dataclass
+class ProviderStats:
+    """Latence et fiabilité observées d'un provider."""
+    calls: int = 0
+    failures: int = 0
+    ewma_latency: Optional[float] = None
+    failure_rate: float = 0.0
+    cooldown_until: float = 0.0
+    last_error: Optional[str] = None
+    errors_by_kind: Dict[str, int] = field(default_factory=dict)
+
+    def record_success(self, latency: float) -> None:
+        self.calls += 1
+        if self.ewma_latency is None:
+            self.ewma_latency = latency
+        else:
+            self.ewma_latency = EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.ewma_latency
+        self.failure_rate = (1 - EWMA_ALPHA) * self.failure_rate
+
+    def record_failure(self, kind: str, cooldown: float = 0.0) -> None:
+        self.calls += 1
+        self.failures += 1
+        self.failure_rate = EWMA_ALPHA + (1 - EWMA_ALPHA) * self.failure_rate
+        self.last_error = kind
+        self.errors_by_kind[kind] = self.errors_by_kind.get(kind, 0) + 1
+        if cooldown > 0:
+            self.cooldown_until = time.time() + cooldown
+
+    @property
+    def in_cooldown(self) -> bool:
+        return time.time() < self.cooldown_until
+
+    def score(self) -> float:
+        """Plus bas = meilleur. Un provider jamais appelé n'a pas encore de score."""
+        if self.ewma_latency is None:
+            return float("inf")
+        return self.ewma_latency * (1 + 2 * self.failure_rate)
+
+
+@dataclass
+class ProviderSlot:
+    """Provider configuré: client, modèle, budgets et statistiques."""
+    provider: Any  # AIProvider
+    client: Any
+    model: str
+    context_window: int
+    input_budget: int
+    limiter: Any = None  # RateLimiter partagé du provider/modèle
+    stats: ProviderStats = field(default_factory=ProviderStats)
+
+    @property
+    def label(self) -> str:
+        return f"{self.provider.value}/{self.model}"
+
+
+class ProviderAttemptError(Exception):
+    """Échec d'un appel à un provider précis de la chaîne."""
+
+    def __init__(self, slot: ProviderSlot, kind: str, original: BaseException):
+        super().__init__(str(original) or kind)
+        self.slot = slot
+        self.kind = kind
+        self.original = original
+
+    @property
+    def can_fallback(self) -> bool:
+        return self.kind in FALLBACK_ERRORS
+
+
+def order_slots(slots: List[ProviderSlot], adaptive: bool = True) -> List[ProviderSlot]:
+    """
+    Ordonne la chaîne: les providers en pause (quota, 5xx) passent en dernier ;
+    en mode adaptatif, les autres sont triés par score (latence x fiabilité),
+    l'ordre configuré départageant les providers sans historique.
+    """
+    indexed = list(enumerate(slots))
+    if adaptive:
+        best_known = min((s.stats.score() for s in slots if s.stats.ewma_latency is not None), default=None)
+
+        def key(item):
+            index, slot = item
+            score = slot.stats.score()
+            # Le provider configuré en premier garde sa place tant qu'il n'a pas d'historique
+            if score == float("inf") and index == 0 and best_known is not None:
+                score = best_known
+            return (slot.stats.in_cooldown, score, index)
+    else:
+        def key(item):
+            index, slot = item
+            return (slot.stats.in_cooldown, index)
+    return [slot for _, slot in sorted(indexed, key=key)]
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    code = getattr(error, "status_code", None)
+    if code is None:
+        response = getattr(error, "response", None)
+        code = getattr(response, "status_code", None)
+    if code is None:
+        code = getattr(error, "code", None)
+        if callable(code):
+            code = None
+    return code if isinstance(code, int) else None
+
+
+def classify_error(error: BaseException) -> str:
+    """
+    Classe une erreur de provider: "quota", "server", "timeout", "network",
+    "invalid_json" ou "other". Suit la chaîne des causes (erreurs ré-emballées).
+    """
+    seen = set()
+    current: Optional[BaseException] = error
+    while current is not None and id(current) not in seen:
+        seen.add(id(current))
+        name = type(current).__name__
+        message = str(current)
+
+        if isinstance(current, asyncio.TimeoutError) or "Timeout" in name or name == "DeadlineExceeded":
+            return "timeout"
+        if name in ("JSONDecodeError", "InvalidJSONResponse"):
+            return "invalid_json"
+        code = _status_code(current)
+        if code == 429 or name in ("RateLimitError", "ResourceExhausted", "TooManyRequests") \
+                or "Quota exceeded" in message or "RESOURCE_EXHAUSTED" in message:
+            return "quota"
+        if (code is not None and code >= 500) or name in ("InternalServerError", "ServiceUnavailable", "OverloadedError"):
+            return "server"
+        if name in ("APIConnectionError", "ConnectError", "ConnectTimeout", "ReadError", "RemoteProtocolError") \
+                or isinstance(current, ConnectionError):
+            return "network"
+        current = current.__cause__ or current.__context__
+    return "other"
@@ -0,0 +1,197 @@
+"""
+Limiteur de débit - Seaux à jetons par provider/modèle (requêtes et tokens par minute) et backoff
+"""
+
+import os
+import re
+import time
+import random
+import asyncio
+import logging
+from typing import Optional, Dict, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Limites par défaut (requêtes/min, tokens/min) des offres gratuites ; 0 = illimité
+DEFAULT_LIMITS = {
+    "groq": (30, 0),
+    "gemini": (15, 0),
+}
+
+_RETRY_DELAY_RE = re.compile(r"retry(?:_delay)?\s*(?:in|\{\s*seconds:)\s*([\d.]+)", re.IGNORECASE)
+
+
+class TokenBucket:
+    """Seau à jetons rempli en continu à `per_minute` jetons par minute."""
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.capacity = per_minute
+        self.level = per_minute
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.per_minute / 60)
+        self._updated = now
+
+    def delay(self, amount: float) -> float:
+        """Secondes d'attente avant de pouvoir prélever `amount` jetons."""
+        self._refill()
+        # Une demande plus grosse que le seau passe dès qu'il est plein (le niveau devient négatif)
+        needed = min(amount, self.capacity)
+        if self.level >= needed:
+            return 0.0
+        return (needed - self.level) * 60 / self.per_minute
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.level -= amount
+
+
+class RateLimiter:
+    """
+    Limiteur d'un provider/modèle: un seau pour les requêtes par minute, un
+    autre pour les tokens par minute. Les appels attendent leur tour dans
+    l'ordre d'arrivée ; un 429 met tout le provider en pause (Retry-After).
+    """
+
+    def __init__(self, name: str, rpm: float = 0, tpm: float = 0):
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.paused_until = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.acquired = 0
+        self.waits = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.throttled = 0
+        self.retries = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.requests is not None or self.tokens is not None
+
+    def _delay(self, tokens: int) -> float:
+        delay = max(0.0, self.paused_until - time.monotonic())
+        if self.requests is not None:
+            delay = max(delay, self.requests.delay(1))
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.delay(tokens))
+        return delay
+
+    async def acquire(self, tokens: int = 0) -> float:
+        """
+        Attend qu'une requête de `tokens` tokens d'entrée soit permise.
+
+        Returns:
+            Le temps d'attente en secondes
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        start = time.monotonic()
+        self.queue_depth += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        try:
+            async with self._lock:
+                delay = self._delay(tokens)
+                if delay > 0:
+                    logger.info(f"⏳ Limite de débit {self.name}: attente {delay:.1f}s (file: {self.queue_depth})")
+                while delay > 0:
+                    await asyncio.sleep(delay)
+                    delay = self._delay(tokens)
+                if self.requests is not None:
+                    self.requests.take(1)
+                if self.tokens is not None:
+                    self.tokens.take(tokens)
+        finally:
+            self.queue_depth -= 1
+        waited = time.monotonic() - start
+        self.acquired += 1
+        if waited > 0.01:
+            self.waits += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+        return waited
+
+    def record_usage(self, actual_tokens: int, estimated_tokens: int) -> None:
+        """Corrige le seau de tokens avec la consommation réelle renvoyée par le provider."""
+        if self.tokens is not None and actual_tokens:
+            self.tokens.take(actual_tokens - estimated_tokens)
+
+    def pause(self, seconds: float) -> None:
+        """Suspend tous les appels au provider (429 avec Retry-After)."""
+        self.throttled += 1
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        """Compteurs du limiteur."""
+        return {
+            "rpm": self.requests.per_minute if self.requests else None,
+            "tpm": self.tokens.per_minute if self.tokens else None,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "acquired": self.acquired,
+            "waits": self.waits,
+            "total_wait_s": round(self.total_wait, 3),
+            "max_wait_s": round(self.max_wait, 3),
+            "avg_wait_s": round(self.total_wait / self.waits, 3) if self.waits else 0.0,
+            "throttled": self.throttled,
+            "retries": self.retries,
+        }
+
+
+# Limiteurs partagés par toutes les instances (un par provider/modèle)
+_LIMITERS: Dict[Tuple[str, str], RateLimiter] = {}
+
+
+def get_limiter(provider: str, model: str) -> RateLimiter:
+    """
+    Retourne le limiteur d'un provider/modèle, configuré par
+    AI_RATE_LIMIT_<PROVIDER>_RPM et AI_RATE_LIMIT_<PROVIDER>_TPM (0 = illimité).
+    """
+    key = (provider, model)
+    limiter = _LIMITERS.get(key)
+    if limiter is None:
+        default_rpm, default_tpm = DEFAULT_LIMITS.get(provider, (0, 0))
+        prefix = f"AI_RATE_LIMIT_{provider.upper()}"
+        rpm = float(os.getenv(f"{prefix}_RPM", str(default_rpm)))
+        tpm = float(os.getenv(f"{prefix}_TPM", str(default_tpm)))
+        limiter = RateLimiter(f"{provider}/{model}", rpm=rpm, tpm=tpm)
+        _LIMITERS[key] = limiter
+        if limiter.enabled:
+            logger.info(f"🚦 Limite de débit {limiter.name}: {rpm:.0f} req/min, {tpm:.0f} tokens/min")
+    return limiter
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """
+    Délai demandé par le provider avant de réessayer: en-têtes Retry-After /
+    retry-after-ms, ou délai indiqué dans le message (RetryInfo de Gemini).
+    """
+    seen = set()
+    current: Optional[BaseException] = error
+    while current is not None and id(current) not in seen:
+        seen.add(id(current))
+        headers = getattr(getattr(current, "response", None), "headers", None)
+        if headers is not None:
+            try:
+                if headers.get("retry-after-ms"):
+                    return float(headers["retry-after-ms"]) / 1000
+                if headers.get("retry-after"):
+                    return float(headers["retry-after"])
+            except (TypeError, ValueError):
+                pass  # Date HTTP: ignorée, le backoff s'applique
+        match = _RETRY_DELAY_RE.search(str(current))
+        if match:
+            return float(match.group(1))
+        current = current.__cause__ or current.__context__
+    return None
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Backoff exponentiel avec « full jitter » (attempt commence à 0)."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
@@ -0,0 +1,169 @@
+"""
+Cache de lecture - Contenu décodé des fichiers, indexé par (chemin, mtime_ns, taille), LRU borné en octets
+"""
+
+import os
+import mmap
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+# Octets examinés pour repérer un fichier binaire (octet nul)
+SNIFF_BYTES = 8192
+# Au-delà, le fichier est projeté en mémoire (mmap) au lieu d'être lu d'un bloc
+MMAP_MIN_BYTES = 256 * 1024
+
+
+@dataclass
+class _CachedFile:
+    key: Tuple[int, int]  # (mtime_ns, taille)
+    text: Optional[str]  # None: binaire, trop gros ou non décodable
+    reason: Optional[str] = None
+
+
+class FileReadCache:
+    """
+    Cache des fichiers lus pour le contexte et les patchs.
+
+    Une entrée reste valide tant que le mtime et la taille du fichier n'ont
+    pas changé (un seul stat par lecture). Les fichiers binaires ou trop gros
+    sont détectés sur leur préfixe, sans être décodés, et mémorisés comme
+    tels. Au-delà de `max_bytes`, les entrées les moins récemment lues sont
+    évincées.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, max_file_bytes: int = 2 * 1024 * 1024):
+        """
+        Args:
+            max_bytes: Taille totale maximale des contenus gardés en mémoire
+            max_file_bytes: Taille au-delà de laquelle un fichier n'est jamais décodé
+        """
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self._entries: "OrderedDict[str, _CachedFile]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.bytes_read = 0
+        self.evictions = 0
+        self.skipped: Dict[str, int] = {"binaire": 0, "trop gros": 0, "non UTF-8": 0}
+
+    def read(self, path: str) -> Optional[str]:
+        """
+        Contenu texte de `path`.
+
+        Returns:
+            Le texte, ou None si le fichier n'existe pas, est binaire, trop gros
+            ou n'est pas en UTF-8 (voir `skip_reason`)
+
+        Raises:
+            OSError autre que FileNotFoundError (droits, etc.)
+        """
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self.invalidate(path)
+            return None
+        key = (st.st_mtime_ns, st.st_size)
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry.key == key:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                if entry.text is not None:
+                    self.bytes_saved += st.st_size
+                return entry.text
+            self.misses += 1
+
+        text, reason = self._load(path, st.st_size)
+        if reason:
+            logger.debug(f"Fichier ignoré ({reason}): {path}")
+        self._store(path, _CachedFile(key, text, reason))
+        return text
+
+    def skip_reason(self, path: str) -> Optional[str]:
+        """Raison pour laquelle le dernier `read` de `path` n'a rien retourné."""
+        with self._lock:
+            entry = self._entries.get(path)
+            return entry.reason if entry is not None else None
+
+    def _load(self, path: str, size: int) -> Tuple[Optional[str], Optional[str]]:
+        if size > self.max_file_bytes:
+            self.skipped["trop gros"] += 1
+            return None, "trop gros"
+        with open(path, "rb") as f:
+            data = None
+            if size >= MMAP_MIN_BYTES:
+                # Gros fichier: le préfixe suffit à écarter un binaire, sans tout lire
+                try:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        if mapped.find(b"\0", 0, SNIFF_BYTES) != -1:
+                            self.skipped["binaire"] += 1
+                            return None, "binaire"
+                        data = mapped[:]
+                except ValueError:
+                    pass  # Fichier vidé entre-temps: lecture classique
+            if data is None:
+                data = f.read()
+                if b"\0" in data[:SNIFF_BYTES]:
+                    self.skipped["binaire"] += 1
+                    return None, "binaire"
+        self.bytes_read += len(data)
+        try:
+            return data.decode("utf-8"), None
+        except UnicodeDecodeError:
+            self.skipped["non UTF-8"] += 1
+            return None, "non UTF-8"
+
+    def _store(self, path: str, entry: _CachedFile) -> None:
+        size = entry.key[1] if entry.text is not None else 0
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(path, None)
+            if previous is not None and previous.text is not None:
+                self._bytes -= previous.key[1]
+            self._entries[path] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                if evicted.text is not None:
+                    self._bytes -= evicted.key[1]
+                self.evictions += 1
+
+    def invalidate(self, path: str) -> None:
+        """Oublie un fichier (écrit ou supprimé par le bot)."""
+        with self._lock:
+            entry = self._entries.pop(path, None)
+            if entry is not None and entry.text is not None:
+                self._bytes -= entry.key[1]
+
+    def stats(self) -> Dict[str, Any]:
+        """Compteurs du cache (taux de succès, octets évités)."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+                "bytes_read": self.bytes_read,
+                "evictions": self.evictions,
+                "skipped": dict(self.skipped),
+            }
+
+    def summary(self) -> str:
+        stats = self.stats()
+        return (
+            f"{stats['hit_rate'] * 100:.0f}% de succès ({stats['hits']}/{stats['hits'] + stats['misses']}), "
+            f"{stats['bytes_saved'] / 1024:.0f} Ko de lectures évitées, {stats['bytes'] / 1024:.0f} Ko en cache"
+        )
@@ -0,0 +1,315 @@
+"""
+Index de pertinence - Classement lexical (BM25 + trigrammes) des fichiers du workspace
+Fonctionne entièrement hors ligne, sans dépendance externe.
+"""
+
+import os
+import re
+import math
+import time
+import logging
+import threading
+from typing import Optional, List, Dict, Set, Tuple
+from dataclasses import dataclass
+
+from .workspace_index import WorkspaceIndex, IndexDelta
+
+logger = logging.getLogger(__name__)
+
+# Paramètres BM25 classiques
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Un terme présent dans le chemin compte plus qu'une occurrence dans le contenu
+PATH_WEIGHT = 3.0
+# Au-delà de cette fréquence documentaire, un terme ne sert qu'à départager
+COMMON_TERM_RATIO = 0.25
+COMMON_TERM_MIN_DF = 1000
+# Bonus quand l'instruction cite explicitement le nom du fichier
+FILENAME_MENTION_BOOST = 25.0
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+_FILENAME_RE = re.compile(r"[\w\-./]+\.\w+", re.UNICODE)
+
+STOPWORDS = {
+    # Français
+    "le", "la", "les", "un", "une", "des", "de", "du", "et", "ou", "en", "au", "aux",
+    "dans", "sur", "pour", "par", "avec", "sans", "que", "qui", "ce", "cet", "cette",
+    "ces", "son", "sa", "ses", "mon", "ma", "mes", "ton", "ta", "tes", "est", "sont",
+    "il", "elle", "on", "nous", "vous", "ils", "je", "tu", "me", "te", "se", "ne", "pas",
+    "plus", "fais", "faire", "ajoute", "mets", "peux", "stp",
+    # Anglais
+    "the", "an", "and", "or", "in", "on", "to", "for", "of", "with", "is", "are", "be",
+    "it", "this", "that", "add", "make", "please", "from", "as", "at", "by",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Découpe un texte en termes (identifiants camelCase/snake_case éclatés, minuscules)."""
+    terms = []
+    for word in _WORD_RE.findall(text):
+        lower = word.lower()
+        if len(lower) >= 2 and lower not in STOPWORDS and not lower.isdigit():
+            terms.append(lower)
+        if "_" in word or not word.islower():
+            for part in word.split("_"):
+                for sub in _CAMEL_RE.findall(part):
+                    sub = sub.lower()
+                    if len(sub) >= 2 and sub != lower and sub not in STOPWORDS and not sub.isdigit():
+                        terms.append(sub)
+    return terms
+
+
+def _trigrams(term: str) -> Set[str]:
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass
+class RankedFile:
+    """Fichier classé par pertinence."""
+    path: str
+    score: float
+
+
+class RelevanceIndex:
+    """
+    Index inversé BM25 sur les chemins, identifiants et contenus du workspace.
+
+    Mis à jour incrémentalement à partir des deltas de `WorkspaceIndex`.
+    Les termes de l'instruction absents du vocabulaire sont rapprochés de
+    termes proches par similarité de trigrammes (fautes de frappe, pluriels).
+    """
+
+    def __init__(self, workspace_index: WorkspaceIndex, max_file_bytes: Optional[int] = None):
+        """
+        Initialise l'index (la construction est faite à la demande ou en arrière-plan).
+
+        Args:
+            workspace_index: Index des fichiers du workspace
+            max_file_bytes: Taille au-delà de laquelle seul le chemin est indexé
+        """
+        self.workspace_index = workspace_index
+        self.root = workspace_index.root
+        self.max_file_bytes = max_file_bytes or int(os.getenv("AI_INDEX_MAX_FILE_BYTES", str(256 * 1024)))
+        self._lock = threading.RLock()
+        self._built = threading.Event()
+        # État de la construction et deltas reçus pendant celle-ci: verrou court, jamais tenu pendant l'indexation
+        self._state_lock = threading.Lock()
+        self._building = False
+        self._queued: List[IndexDelta] = []
+        self._doc_terms: Dict[str, Dict[str, float]] = {}
+        self._doc_len: Dict[str, float] = {}
+        self._postings: Dict[str, Dict[str, float]] = {}
+        self._trigram_terms: Dict[str, Set[str]] = {}
+        self._by_basename: Dict[str, Set[str]] = {}
+        self._total_len = 0.0
+
+    # ------------------------------------------------------------------
+    # Construction
+    # ------------------------------------------------------------------
+
+    def start_background_build(self) -> None:
+        """Construit l'index dans un thread pour ne pas retarder le démarrage."""
+        with self._state_lock:
+            if self._building or self._built.is_set():
+                return
+            self._building = True
+        threading.Thread(target=self.build, name="relevance-index", daemon=True).start()
+
+    def build(self) -> None:
+        """
+        Indexe tous les fichiers connus de l'index du workspace, puis les
+        deltas reçus pendant la construction (fichiers déjà lus modifiés depuis).
+        """
+        start = time.perf_counter()
+        with self._state_lock:
+            self._building = True
+        with self._lock:
+            for rel_path in self.workspace_index.files():
+                self._add_doc(rel_path)
+            while True:
+                with self._state_lock:
+                    queued, self._queued = self._queued, []
+                    if not queued:
+                        self._building = False
+                        self._built.set()
+                        break
+                for delta in queued:
+                    self._apply(delta)
+        logger.info(
+            f"✅ Index de pertinence construit: {len(self._doc_terms)} fichiers, "
+            f"{len(self._postings)} termes en {(time.perf_counter() - start) * 1000:.0f} ms"
+        )
+
+    def _read_text(self, rel_path: str) -> str:
+        """Lit le contenu texte d'un fichier (vide si binaire ou trop gros)."""
+        stat = self.workspace_index.file_stat(rel_path)
+        if stat and stat[1] > self.max_file_bytes:
+            return ""
+        try:
+            with open(os.path.join(self.root, rel_path), 'rb') as f:
+                data = f.read(self.max_file_bytes + 1)
+        except OSError:
+            return ""
+        if len(data) > self.max_file_bytes or b"\0" in data[:1024]:
+            return ""
+        return data.decode('utf-8', errors='ignore')
+
+    def _add_doc(self, rel_path: str) -> None:
+        weights: Dict[str, float] = {}
+        for term in tokenize(rel_path.replace(os.sep, " ")):
+            weights[term] = weights.get(term, 0.0) + PATH_WEIGHT
+        for term in tokenize(self._read_text(rel_path)):
+            weights[term] = weights.get(term, 0.0) + 1.0
+
+        length = sum(weights.values())
+        self._doc_terms[rel_path] = weights
+        self._doc_len[rel_path] = length
+        self._total_len += length
+        for term, tf in weights.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                for gram in _trigrams(term):
+                    self._trigram_terms.setdefault(gram, set()).add(term)
+            postings[rel_path] = tf
+        self._by_basename.setdefault(os.path.basename(rel_path).lower(), set()).add(rel_path)
+
+    def _remove_doc(self, rel_path: str) -> None:
+        weights = self._doc_terms.pop(rel_path, None)
+        if weights is None:
+            return
+        self._total_len -= self._doc_len.pop(rel_path, 0.0)
+        for term in weights:
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(rel_path, None)
+            if not postings:
+                del self._postings[term]
+                for gram in _trigrams(term):
+                    terms = self._trigram_terms.get(gram)
+                    if terms:
+                        terms.discard(term)
+                        if not terms:
+                            del self._trigram_terms[gram]
+        names = self._by_basename.get(os.path.basename(rel_path).lower())
+        if names:
+            names.discard(rel_path)
+
+    def update(self, delta: IndexDelta) -> None:
+        """
+        Applique un delta de l'index du workspace. Pendant la construction, le
+        delta est mis de côté (appliqué à la fin de celle-ci) sans attendre ;
+        avant, il est ignoré: la construction lira l'état à jour.
+        """
+        if not delta.count:
+            return
+        if not self._built.is_set():
+            with self._state_lock:
+                if not self._built.is_set():
+                    if self._building:
+                        self._queued.append(delta)
+                    return
+        with self._lock:
+            self._apply(delta)
+
+    def _apply(self, delta: IndexDelta) -> None:
+        for rel_path in delta.removed:
+            self._remove_doc(rel_path)
+        for rel_path in delta.modified:
+            self._remove_doc(rel_path)
+            self._add_doc(rel_path)
+        for rel_path in delta.added:
+            self._remove_doc(rel_path)
+            self._add_doc(rel_path)
+
+    # ------------------------------------------------------------------
+    # Recherche
+    # ------------------------------------------------------------------
+
+    def _expand_term(self, term: str, max_terms: int = 3) -> List[Tuple[str, float]]:
+        """Retourne le terme lui-même ou, s'il est inconnu, des termes proches (trigrammes)."""
+        if term in self._postings:
+            return [(term, 1.0)]
+        if len(term) < 4:
+            return []
+        grams = _trigrams(term)
+        counts: Dict[str, int] = {}
+        for gram in grams:
+            for candidate in self._trigram_terms.get(gram, ()):
+                counts[candidate] = counts.get(candidate, 0) + 1
+        scored = []
+        for candidate, shared in counts.items():
+            similarity = shared / (len(grams) + len(_trigrams(candidate)) - shared)
+            if similarity >= 0.5:
+                scored.append((candidate, similarity))
+        scored.sort(key=lambda x: -x[1])
+        return scored[:max_terms]
+
+    @property
+    def ready(self) -> bool:
+        return self._built.is_set()
+
+    def search(self, query: str, limit: int = 10) -> List[RankedFile]:
+        """
+        Classe les fichiers du workspace par pertinence pour `query`.
+
+        N'attend jamais la construction de l'index : tant qu'elle n'est pas
+        terminée, la liste est vide (l'appelant se replie sur les fichiers
+        principaux) et la construction est lancée en arrière-plan si besoin.
+
+        Args:
+            query: Texte de l'instruction
+            limit: Nombre maximum de résultats
+
+        Returns:
+            Liste de RankedFile triée par score décroissant
+        """
+        if not self._built.is_set():
+            self.start_background_build()
+            return []
+
+        with self._lock:
+            n_docs = len(self._doc_terms)
+            if not n_docs:
+                return []
+            avg_len = (self._total_len / n_docs) or 1.0
+            scores: Dict[str, float] = {}
+            scores_get = scores.get
+            doc_len = self._doc_len
+            norm_base = BM25_K1 * (1 - BM25_B)
+            norm_slope = BM25_K1 * BM25_B / avg_len
+
+            expanded: Dict[str, float] = {}
+            for term in set(tokenize(query)):
+                for vocab_term, similarity in self._expand_term(term):
+                    expanded[vocab_term] = max(similarity, expanded.get(vocab_term, 0.0))
+
+            # Termes rares d'abord: les termes très fréquents ne font que départager
+            # les candidats déjà trouvés (évite de parcourir des listes énormes).
+            common_df = max(COMMON_TERM_MIN_DF, int(n_docs * COMMON_TERM_RATIO))
+            for vocab_term in sorted(expanded, key=lambda t: len(self._postings[t])):
+                postings = self._postings[vocab_term]
+                df = len(postings)
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5)) * expanded[vocab_term]
+                if df > common_df and scores:
+                    items = [(p, postings[p]) for p in scores if p in postings]
+                else:
+                    items = postings.items()
+                weight = idf * (BM25_K1 + 1)
+                for rel_path, tf in items:
+                    norm = norm_base + norm_slope * doc_len[rel_path]
+                    scores[rel_path] = scores_get(rel_path, 0.0) + weight * tf / (tf + norm)
+
+            # Fichiers cités explicitement ("modifie index.html")
+            for mention in _FILENAME_RE.findall(query):
+                mention = mention.strip("./").lower()
+                for rel_path in self._by_basename.get(os.path.basename(mention), ()):
+                    if rel_path.replace(os.sep, "/").lower().endswith(mention):
+                        scores[rel_path] = scores.get(rel_path, 0.0) + FILENAME_MENTION_BOOST
+
+        ranked = sorted(scores.items(), key=lambda x: (-x[1], x[0]))[:limit]
+        return [RankedFile(path, score) for path, score in ranked]
@@ -0,0 +1,182 @@
+"""
+Cache de réponses IA - LRU en mémoire + stockage disque persistant entre redémarrages
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_instruction(instruction: str) -> str:
+    """Normalise une instruction pour que les renvois quasi identiques partagent la même clé."""
+    text = re.sub(r"\s+", " ", instruction.strip().lower())
+    return text.rstrip(" .!?…")
+
+
+class ResponseCache:
+    """
+    Cache des réponses IA, indexé par provider, modèle, instruction normalisée
+    et empreinte du contexte envoyé.
+
+    Deux niveaux: un LRU borné en mémoire et un répertoire de fichiers JSON
+    (un par entrée) qui survit aux redémarrages. Les entrées expirent après
+    `ttl_seconds` et le disque est élagué au-delà de `max_disk_entries`.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_entries: int = 64,
+        max_disk_entries: int = 500,
+        ttl_seconds: int = 24 * 60 * 60,
+    ):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    @staticmethod
+    def make_key(provider: str, model: str, instruction: str, context: str) -> str:
+        """
+        Clé du cache: hash de (provider, modèle, instruction normalisée, hash du contexte).
+
+        L'instruction brute est retirée du contexte avant hachage: seule sa forme
+        normalisée compte, le reste du contexte (arborescence, fichiers) est haché tel quel.
+        """
+        packed = context.replace(instruction, "") if instruction else context
+        context_hash = hashlib.sha256(packed.encode("utf-8")).hexdigest()
+        material = json.dumps([provider, model, normalize_instruction(instruction), context_hash])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _expired(self, entry: Dict[str, Any]) -> bool:
+        return time.time() - entry.get("created", 0) > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Retourne la réponse mise en cache (dict sérialisable) ou None."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if self._expired(entry):
+                    del self._memory[key]
+                else:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return entry["payload"]
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._remember(key, entry)
+            return entry["payload"]
+
+    def put(self, key: str, payload: Dict[str, Any]) -> None:
+        """Enregistre une réponse en mémoire et sur disque."""
+        if not self.enabled:
+            return
+        entry = {"created": time.time(), "payload": payload}
+        with self._lock:
+            self._remember(key, entry)
+        self._write_disk(key, entry)
+
+    def _remember(self, key: str, entry: Dict[str, Any]) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _read_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ Cache: entrée illisible {path}: {e}")
+            return None
+        if self._expired(entry):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry
+
+    def _write_disk(self, key: str, entry: Dict[str, Any]) -> None:
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"⚠️ Cache: écriture impossible {path}: {e}")
+            return
+        self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        """Supprime les entrées expirées puis les plus anciennes au-delà de la limite."""
+        entries = []
+        now = time.time()
+        try:
+            for shard in os.scandir(self.directory):
+                if not shard.is_dir():
+                    continue
+                for item in os.scandir(shard.path):
+                    if item.name.endswith(".json"):
+                        entries.append((item.stat().st_mtime, item.path))
+        except OSError:
+            return
+        entries.sort()
+        excess = len(entries) - self.max_disk_entries
+        for index, (mtime, path) in enumerate(entries):
+            if index < excess or now - mtime > self.ttl_seconds:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Compteurs du cache."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+    def summary(self) -> str:
+        stats = self.stats()
+        return (
+            f"{stats['hit_rate'] * 100:.0f}% de succès ({stats['hits']}/{stats['hits'] + stats['misses']}, "
+            f"dont {stats['disk_hits']} depuis le disque), {stats['memory_entries']} réponse(s) en mémoire"
+        )
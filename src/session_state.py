@@ -0,0 +1,130 @@
+"""
+Sessions de conversation - Ce que chaque chat a déjà demandé, modifié et envoyé au modèle
+Les instructions de suivi (« maintenant mets le bouton en bleu ») repartent de là au lieu d'un contexte complet.
+"""
+
+import time
+import hashlib
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Deque
+
+logger = logging.getLogger(__name__)
+
+# Longueur maximale d'une explication reprise dans l'historique compact
+HISTORY_EXPLANATION_CHARS = 240
+
+
+def fingerprint(content: str) -> str:
+    """Empreinte courte d'un contenu envoyé au modèle."""
+    return hashlib.blake2b(content.encode("utf-8", "surrogatepass"), digest_size=8).hexdigest()
+
+
+@dataclass
+class SessionTurn:
+    """Un échange réussi: instruction, réponse résumée et fichiers touchés."""
+    instruction: str
+    explanation: str
+    files: List[str]
+    at: float = field(default_factory=time.time)
+
+
+@dataclass
+class ChatSession:
+    """
+    État d'une conversation: derniers échanges et empreintes des fichiers
+    envoyés en entier au modèle (pour n'envoyer ensuite que ce qui a changé).
+    """
+    chat_id: int
+    turns: Deque[SessionTurn]
+    sent: Dict[str, str] = field(default_factory=dict)  # chemin -> empreinte du contenu envoyé
+    pending: Dict[str, str] = field(default_factory=dict)  # envoyés pendant l'échange en cours
+    updated: float = field(default_factory=time.time)
+
+    @property
+    def is_follow_up(self) -> bool:
+        return bool(self.turns)
+
+    def add_turn(self, instruction: str, explanation: str, files: List[str]) -> None:
+        """Mémorise un échange dont les modifications ont été appliquées (et les fichiers envoyés pour lui)."""
+        self.turns.append(SessionTurn(instruction, explanation, list(dict.fromkeys(files))))
+        self.sent.update(self.pending)
+        self.pending.clear()
+        self.updated = time.time()
+
+    def working_set(self, limit: int = 8) -> List[str]:
+        """Fichiers touchés par les derniers échanges, du plus récent au plus ancien."""
+        files: List[str] = []
+        for turn in reversed(self.turns):
+            for path in turn.files:
+                if path not in files:
+                    files.append(path)
+        return files[:limit]
+
+    def unchanged_since_sent(self, path: str, content: str) -> bool:
+        """Le fichier a déjà été envoyé en entier dans cet état."""
+        return self.sent.get(path) == fingerprint(content)
+
+    def mark_sent(self, path: str, content: str) -> None:
+        """Fichier envoyé en entier pour l'échange en cours (retenu si l'échange aboutit)."""
+        self.pending[path] = fingerprint(content)
+
+    def history_text(self) -> str:
+        """Historique compact des échanges (du plus ancien au plus récent)."""
+        lines = []
+        for index, turn in enumerate(self.turns, 1):
+            explanation = " ".join(turn.explanation.split())
+            if len(explanation) > HISTORY_EXPLANATION_CHARS:
+                explanation = explanation[:HISTORY_EXPLANATION_CHARS].rstrip() + "…"
+            line = f"{index}. « {turn.instruction.strip()[:300]} »"
+            if explanation:
+                line += f" → {explanation}"
+            if turn.files:
+                line += f" (fichiers: {', '.join(turn.files[:10])})"
+            lines.append(line)
+        return "\n".join(lines)
+
+
+class SessionStore:
+    """
+    Sessions par chat Telegram, en mémoire.
+
+    Une session expire après `ttl_seconds` sans échange (l'instruction
+    suivante repart d'un contexte complet) et ne garde que les `max_turns`
+    derniers échanges.
+    """
+
+    def __init__(self, ttl_seconds: int = 30 * 60, max_turns: int = 4):
+        self.ttl_seconds = ttl_seconds
+        self.max_turns = max_turns
+        self._sessions: Dict[int, ChatSession] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_turns > 0
+
+    def get(self, chat_id: int) -> Optional[ChatSession]:
+        """Session active du chat (None si désactivé), créée ou renouvelée si expirée."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(chat_id)
+            if session is not None and now - session.updated > self.ttl_seconds:
+                logger.info(f"🕘 Session du chat {chat_id} expirée ({len(session.turns)} échange(s))")
+                session = None
+            if session is None:
+                session = ChatSession(chat_id, deque(maxlen=self.max_turns))
+                self._sessions[chat_id] = session
+            return session
+
+    def reset(self, chat_id: Optional[int] = None) -> None:
+        """Oublie la session d'un chat (ou toutes)."""
+        with self._lock:
+            if chat_id is None:
+                self._sessions.clear()
+            else:
+                self._sessions.pop(chat_id, None)
@@ -0,0 +1,199 @@
+"""
+Parser JSON incrémental - Extrait les opérations au fil du flux de la réponse IA et raccorde les réponses tronquées
+"""
+
+import re
+import json
+import logging
+from typing import Optional, List, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+
+class OperationStreamParser:
+    """
+    Parser incrémental pour la réponse JSON de l'IA.
+
+    Suit l'imbrication des objets/tableaux et des chaînes caractère par
+    caractère, et retourne chaque objet du tableau `operations` dès que son
+    accolade fermante arrive, sans attendre la fin de la réponse.
+    """
+
+    def __init__(self, array_key: str = "operations"):
+        self.array_key = array_key
+        self.text = ""
+        self.operations: List[Dict[str, Any]] = []
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._pending_key: Optional[str] = None
+        self._array_level: Optional[int] = None
+        self._object_start: Optional[int] = None
+        self._started = False
+
+    @property
+    def in_operations(self) -> bool:
+        """True pendant la lecture du tableau d'opérations."""
+        return self._array_level is not None
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """
+        Ajoute un morceau de réponse.
+
+        Returns:
+            Les opérations complètes apparues dans ce morceau
+        """
+        self.text += chunk
+        completed = []
+        text = self.text
+        stack = self._stack
+
+        for i in range(self._pos, len(text)):
+            c = text[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if len(stack) == 1 and stack[0] == '{':
+                        self._last_string = text[self._string_start + 1:i]
+                continue
+
+            if not self._started:
+                # Ignorer tout ce qui précède le premier objet (```json, texte parasite)
+                if c != '{':
+                    continue
+                self._started = True
+
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c == ':':
+                if len(stack) == 1:
+                    self._pending_key = self._last_string
+            elif c == ',':
+                if len(stack) == 1:
+                    self._pending_key = None
+            elif c == '{':
+                stack.append(c)
+                if self._array_level is not None and len(stack) == self._array_level + 1:
+                    self._object_start = i
+            elif c == '[':
+                stack.append(c)
+                if len(stack) == 2 and self._pending_key == self.array_key:
+                    self._array_level = len(stack)
+            elif c in '}]':
+                if not stack:
+                    continue
+                stack.pop()
+                if c == '}' and self._object_start is not None and len(stack) == self._array_level:
+                    raw = text[self._object_start:i + 1]
+                    self._object_start = None
+                    try:
+                        op = json.loads(raw)
+                    except json.JSONDecodeError as e:
+                        logger.warning(f"⚠️ Opération illisible ignorée dans le flux: {e}")
+                        continue
+                    if isinstance(op, dict):
+                        self.operations.append(op)
+                        completed.append(op)
+                elif c == ']' and self._array_level is not None and len(stack) == self._array_level - 1:
+                    self._array_level = None
+
+        self._pos = len(text)
+        return completed
+
+
+_EXPLANATION_RE = re.compile(r'"explanation"\s*:\s*("(?:[^"\\]|\\.)*")', re.DOTALL)
+
+
+def recover_response(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Récupère une réponse JSON tronquée ou abîmée: toutes les opérations
+    complètes du tableau `operations` (et l'explication si elle est lisible).
+
+    Returns:
+        Un dict au format de la réponse, ou None si aucune opération n'est récupérable
+    """
+    parser = OperationStreamParser()
+    parser.feed(text)
+    if not parser.operations:
+        return None
+    explanation = ""
+    match = _EXPLANATION_RE.search(text)
+    if match:
+        try:
+            explanation = json.loads(match.group(1))
+        except json.JSONDecodeError:
+            pass
+    return {"success": True, "explanation": explanation, "operations": parser.operations}
+
+
+class ContinuationStitcher:
+    """
+    Raccorde la suite d'une réponse tronquée au texte déjà reçu.
+
+    Les premiers caractères de la suite sont retenus le temps de retirer ce
+    que le modèle ajoute souvent en reprenant: bloc ```json, espaces déjà
+    envoyés, ou recouvrement avec la fin du texte précédent.
+    """
+
+    MIN_OVERLAP = 16
+
+    def __init__(self, previous: str, on_chunk, lookahead: int = 256, skip: str = ""):
+        """
+        Args:
+            previous: Texte déjà reçu (et transmis)
+            on_chunk: Callback async qui reçoit la suite nettoyée
+            lookahead: Nombre de caractères retenus avant de raccorder
+            skip: Préfixe attendu à retirer s'il est répété (espaces de fin retirés du pré-remplissage)
+        """
+        self.previous = previous
+        self.on_chunk = on_chunk
+        self.lookahead = lookahead
+        self.skip = skip
+        self.text = ""
+        self._buffer = ""
+        self._released = False
+
+    async def feed(self, chunk: str) -> None:
+        if self._released:
+            await self._forward(chunk)
+            return
+        self._buffer += chunk
+        if len(self._buffer) >= self.lookahead:
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Transmet ce qui est encore retenu (fin du flux)."""
+        if self._released:
+            return
+        self._released = True
+        text = self._trim(self._buffer)
+        self._buffer = ""
+        if text:
+            await self._forward(text)
+
+    async def _forward(self, text: str) -> None:
+        self.text += text
+        if self.on_chunk:
+            await self.on_chunk(text)
+
+    def _trim(self, text: str) -> str:
+        stripped = text.lstrip()
+        for fence in ("```json", "```"):
+            if stripped.startswith(fence):
+                text = stripped[len(fence):].lstrip("\n")
+                break
+        if self.skip and text.startswith(self.skip):
+            text = text[len(self.skip):]
+        for size in range(min(len(text), len(self.previous), self.lookahead), self.MIN_OVERLAP - 1, -1):
+            if self.previous.endswith(text[:size]):
+                return text[size:]
+        return text
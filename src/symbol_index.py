@@ -0,0 +1,469 @@
+"""
+Index des symboles - Classes, fonctions, exports et imports des fichiers Python/JS/TS/HTML avec leurs lignes
+Fonctionne hors ligne: `ast` pour Python, analyse légère ligne à ligne pour JS/TS, `html.parser` pour HTML.
+"""
+
+import os
+import re
+import ast
+import time
+import logging
+import threading
+from html.parser import HTMLParser
+from typing import Optional, List, Dict, Set, Tuple
+from dataclasses import dataclass, field
+
+from .workspace_index import WorkspaceIndex, IndexDelta
+from .relevance_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+PYTHON_EXTENSIONS = {".py", ".pyw"}
+SCRIPT_EXTENSIONS = {".js", ".jsx", ".mjs", ".cjs", ".ts", ".tsx"}
+HTML_EXTENSIONS = {".html", ".htm"}
+
+# Une déclaration sans accolade (const x = ...) se termine au plus tard après ces lignes
+MAX_STATEMENT_LINES = 20
+
+
+@dataclass
+class Symbol:
+    """Déclaration d'un fichier, avec ses lignes (1-indexées, incluses)."""
+    name: str
+    kind: str  # "class", "function", "method", "const", "type", "element"
+    start: int
+    end: int
+    signature: str
+    parent: Optional[str] = None
+    exported: bool = False
+
+
+@dataclass
+class FileSymbols:
+    """Symboles et dépendances d'un fichier."""
+    path: str
+    symbols: List[Symbol] = field(default_factory=list)
+    imports: List[str] = field(default_factory=list)
+    exports: List[str] = field(default_factory=list)
+
+    def outline(self) -> str:
+        """Plan du fichier: imports, exports puis déclarations avec leurs plages de lignes."""
+        lines = []
+        if self.imports:
+            lines.append(f"imports: {', '.join(self.imports)}"[:300])
+        if self.exports:
+            lines.append(f"exports: {', '.join(self.exports)}"[:300])
+        for symbol in self.symbols:
+            indent = "  " if symbol.parent else ""
+            lines.append(f"{symbol.start:>5}-{symbol.end:<5} {indent}{symbol.signature[:160]}")
+        return "\n".join(lines)
+
+
+# ----------------------------------------------------------------------
+# Python
+# ----------------------------------------------------------------------
+
+def _python_signature(node: ast.AST) -> str:
+    if isinstance(node, ast.ClassDef):
+        bases = ", ".join(ast.unparse(base) for base in node.bases)
+        return f"class {node.name}({bases})" if bases else f"class {node.name}"
+    prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+    returns = f" -> {ast.unparse(node.returns)}" if node.returns is not None else ""
+    return f"{prefix} {node.name}({ast.unparse(node.args)}){returns}"
+
+
+def _node_start(node: ast.AST) -> int:
+    decorators = getattr(node, "decorator_list", None) or []
+    return min([node.lineno] + [d.lineno for d in decorators])
+
+
+def _extract_python(path: str, content: str) -> FileSymbols:
+    result = FileSymbols(path)
+    try:
+        tree = ast.parse(content)
+    except (SyntaxError, ValueError):
+        return _extract_python_fallback(path, content)
+
+    functions = (ast.FunctionDef, ast.AsyncFunctionDef)
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            result.imports.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            result.imports.append("." * node.level + (node.module or ""))
+        elif isinstance(node, ast.ClassDef):
+            result.symbols.append(Symbol(node.name, "class", _node_start(node), node.end_lineno, _python_signature(node)))
+            for child in node.body:
+                if isinstance(child, functions):
+                    result.symbols.append(Symbol(
+                        child.name, "method", _node_start(child), child.end_lineno,
+                        _python_signature(child), parent=node.name,
+                    ))
+        elif isinstance(node, functions):
+            result.symbols.append(Symbol(node.name, "function", _node_start(node), node.end_lineno, _python_signature(node)))
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            for target in targets:
+                if isinstance(target, ast.Name) and target.id.isupper():
+                    result.symbols.append(Symbol(target.id, "const", node.lineno, node.end_lineno, f"{target.id} = ..."))
+        elif isinstance(node, ast.If) and "__main__" in ast.unparse(node.test):
+            result.symbols.append(Symbol("__main__", "block", node.lineno, node.end_lineno, "if __name__ == '__main__'"))
+
+    # __all__ s'il est défini, sinon les noms publics du module
+    declared = None
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(isinstance(t, ast.Name) and t.id == "__all__" for t in node.targets):
+            if isinstance(node.value, (ast.List, ast.Tuple)):
+                declared = [e.value for e in node.value.elts if isinstance(e, ast.Constant) and isinstance(e.value, str)]
+    if declared is None:
+        declared = [s.name for s in result.symbols if s.parent is None and s.kind != "block" and not s.name.startswith("_")]
+    result.exports = declared
+    return result
+
+
+_PY_DEF_RE = re.compile(r"^(\s*)(?:async\s+)?(def|class)\s+(\w+)")
+
+
+def _extract_python_fallback(path: str, content: str) -> FileSymbols:
+    """Fichier Python invalide (en cours d'écriture): découpage par indentation."""
+    result = FileSymbols(path)
+    lines = content.splitlines()
+    open_symbols: List[Tuple[int, Symbol]] = []
+    for number, line in enumerate(lines, 1):
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        indent = len(line) - len(line.lstrip())
+        while open_symbols and indent <= open_symbols[-1][0]:
+            open_symbols.pop()
+        match = _PY_DEF_RE.match(line)
+        if not match:
+            for _, symbol in open_symbols:
+                symbol.end = number
+            continue
+        for _, symbol in open_symbols:
+            symbol.end = number
+        parent = open_symbols[-1][1] if open_symbols else None
+        if parent is not None and parent.kind != "class":
+            continue  # Fonctions imbriquées: incluses dans le corps du parent
+        kind = "class" if match.group(2) == "class" else ("method" if parent else "function")
+        symbol = Symbol(match.group(3), kind, number, number, line.strip().rstrip(":"),
+                        parent=parent.name if parent else None)
+        result.symbols.append(symbol)
+        open_symbols.append((indent, symbol))
+    return result
+
+
+# ----------------------------------------------------------------------
+# JavaScript / TypeScript
+# ----------------------------------------------------------------------
+
+_JS_IMPORT_RE = re.compile(r"""^\s*import\s+(?:[^'"]*?\s+from\s+)?['"]([^'"]+)['"]""")
+_JS_REQUIRE_RE = re.compile(r"""\brequire\(\s*['"]([^'"]+)['"]\s*\)""")
+_JS_EXPORT_LIST_RE = re.compile(r"^\s*export\s*\{([^}]*)\}")
+_JS_DECL_RES = [
+    ("class", re.compile(r"^\s*(export\s+(?:default\s+)?)?(?:abstract\s+)?class\s+(\w+)")),
+    ("function", re.compile(r"^\s*(export\s+(?:default\s+)?)?(?:async\s+)?function\s*\*?\s*(\w+)\s*[(<]")),
+    ("function", re.compile(
+        r"^\s*(export\s+)?(?:const|let|var)\s+(\w+)\s*(?::[^=]+)?=\s*(?:async\s+)?"
+        r"(?:function\b|\([^)]*\)\s*(?::[^=]+)?=>|\w+\s*=>)"
+    )),
+    ("type", re.compile(r"^\s*(export\s+)?(?:declare\s+)?(?:interface|type|enum)\s+(\w+)")),
+    ("const", re.compile(r"^\s*(export\s+)?(?:const|let|var)\s+(\w+)")),
+]
+_JS_METHOD_RE = re.compile(
+    r"^\s*(?:(?:public|private|protected|static|readonly|async|get|set|override)\s+)*\*?\s*"
+    r"(#?\w+)\s*(?:<[^>]*>)?\s*\([^)]*\)?\s*(?::\s*[^{]+)?\{?\s*$"
+)
+_JS_KEYWORDS = {"if", "for", "while", "switch", "catch", "function", "return", "else", "do", "try", "with"}
+
+
+def _scan_braces(content: str) -> Tuple[List[int], List[int], List[bool]]:
+    """
+    Profondeur d'accolades au début et à la fin de chaque ligne, et présence
+    d'une accolade ouvrante, en ignorant chaînes, gabarits et commentaires.
+    """
+    starts, ends, opens = [], [], []
+    depth = 0
+    state = None  # None, "'", '"', "`", "//", "/*"
+    line_open = False
+    starts.append(0)
+    i, n = 0, len(content)
+    while i < n:
+        ch = content[i]
+        if ch == "\n":
+            if state == "//":
+                state = None
+            ends.append(depth)
+            opens.append(line_open)
+            starts.append(depth)
+            line_open = False
+        elif state is None:
+            if ch in "'\"`":
+                state = ch
+            elif ch == "/" and content.startswith("//", i):
+                state = "//"
+            elif ch == "/" and content.startswith("/*", i):
+                state = "/*"
+                i += 1
+            elif ch == "{":
+                depth += 1
+                line_open = True
+            elif ch == "}":
+                depth = max(0, depth - 1)
+        elif state == "/*":
+            if ch == "*" and content.startswith("*/", i):
+                state = None
+                i += 1
+        elif state in ("'", '"', "`"):
+            if ch == "\\":
+                i += 1
+            elif ch == state:
+                state = None
+            elif ch == "\n" and state != "`":
+                state = None
+        i += 1
+    ends.append(depth)
+    opens.append(line_open)
+    return starts, ends, opens
+
+
+def _block_end(index: int, lines: List[str], starts: List[int], ends: List[int], opens: List[bool]) -> int:
+    """Dernière ligne (index 0) de la déclaration commençant à `index`."""
+    depth = starts[index]
+    opened = False
+    for j in range(index, len(lines)):
+        opened = opened or opens[j]
+        if opened and ends[j] <= depth:
+            return j
+        if not opened and (lines[j].rstrip().endswith(";") or j - index >= MAX_STATEMENT_LINES):
+            return j
+    return len(lines) - 1
+
+
+def _extract_script(path: str, content: str) -> FileSymbols:
+    result = FileSymbols(path)
+    lines = content.splitlines()
+    starts, ends, opens = _scan_braces(content)
+    classes: List[Symbol] = []
+
+    for index, line in enumerate(lines):
+        import_match = _JS_IMPORT_RE.match(line)
+        if import_match:
+            result.imports.append(import_match.group(1))
+            continue
+        result.imports.extend(_JS_REQUIRE_RE.findall(line))
+        export_list = _JS_EXPORT_LIST_RE.match(line)
+        if export_list:
+            for name in export_list.group(1).split(","):
+                name = name.strip().split(" as ")[-1].strip()
+                if name:
+                    result.exports.append(name)
+            continue
+
+        depth = starts[index]
+        if depth == 0:
+            for kind, pattern in _JS_DECL_RES:
+                match = pattern.match(line)
+                if not match:
+                    continue
+                end = _block_end(index, lines, starts, ends, opens)
+                symbol = Symbol(
+                    match.group(2), kind, index + 1, end + 1, line.strip().rstrip("{").strip(),
+                    exported=bool(match.group(1)),
+                )
+                result.symbols.append(symbol)
+                if symbol.exported:
+                    result.exports.append(symbol.name)
+                if kind == "class":
+                    classes.append(symbol)
+                break
+            continue
+
+        # Méthodes: un niveau sous la classe qui les contient
+        owner = next((c for c in classes if c.start - 1 < index < c.end - 1), None)
+        if owner is None or depth != starts[owner.start - 1] + 1:
+            continue
+        match = _JS_METHOD_RE.match(line)
+        if match and match.group(1) not in _JS_KEYWORDS:
+            end = _block_end(index, lines, starts, ends, opens)
+            result.symbols.append(Symbol(
+                match.group(1), "method", index + 1, end + 1, line.strip().rstrip("{").strip(), parent=owner.name,
+            ))
+    result.exports = list(dict.fromkeys(result.exports))
+    return result
+
+
+# ----------------------------------------------------------------------
+# HTML
+# ----------------------------------------------------------------------
+
+_HTML_LANDMARKS = {"head", "header", "nav", "main", "section", "article", "aside", "footer", "form", "script", "style", "template"}
+_HTML_HEADINGS = {"h1", "h2", "h3"}
+_HTML_VOID = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+
+class _HTMLOutliner(HTMLParser):
+    """Repère les blocs structurants (landmarks, titres, éléments avec id) et les ressources liées."""
+
+    def __init__(self, result: FileSymbols):
+        super().__init__(convert_charrefs=True)
+        self.result = result
+        self.stack: List[Tuple[str, Optional[Symbol]]] = []
+        self.heading: Optional[Symbol] = None
+
+    def _parent(self) -> Optional[str]:
+        for _, symbol in reversed(self.stack):
+            if symbol is not None:
+                return symbol.name
+        return None
+
+    def handle_starttag(self, tag, attrs):
+        attributes = dict(attrs)
+        if tag == "link" and attributes.get("href"):
+            self.result.imports.append(attributes["href"])
+        elif tag == "script" and attributes.get("src"):
+            self.result.imports.append(attributes["src"])
+        if tag in _HTML_VOID:
+            return
+        line = self.getpos()[0]
+        symbol = None
+        element_id = attributes.get("id")
+        if tag in _HTML_LANDMARKS or tag in _HTML_HEADINGS or element_id:
+            name = f"{tag}#{element_id}" if element_id else tag
+            label = f"<{tag}" + (f' id="{element_id}"' if element_id else "")
+            if attributes.get("class"):
+                label += f' class="{attributes["class"]}"'
+            symbol = Symbol(name, "element", line, line, label + ">", parent=self._parent())
+            self.result.symbols.append(symbol)
+            if tag in _HTML_HEADINGS:
+                self.heading = symbol
+        self.stack.append((tag, symbol))
+
+    def handle_endtag(self, tag):
+        if tag in _HTML_VOID:
+            return
+        for position in range(len(self.stack) - 1, -1, -1):
+            if self.stack[position][0] == tag:
+                line = self.getpos()[0]
+                for _, symbol in self.stack[position:]:
+                    if symbol is not None:
+                        symbol.end = max(symbol.end, line)
+                del self.stack[position:]
+                break
+        if tag in _HTML_HEADINGS:
+            self.heading = None
+
+    def handle_data(self, data):
+        if self.heading is not None and data.strip() and len(self.heading.signature) < 120:
+            self.heading.signature += f" {data.strip()}"
+
+
+def _extract_html(path: str, content: str) -> FileSymbols:
+    result = FileSymbols(path)
+    parser = _HTMLOutliner(result)
+    try:
+        parser.feed(content)
+        parser.close()
+    except Exception as e:
+        logger.debug(f"HTML non analysable {path}: {e}")
+    last_line = content.count("\n") + 1
+    for _, symbol in parser.stack:
+        if symbol is not None:
+            symbol.end = last_line  # Balise jamais fermée
+    return result
+
+
+def extract_symbols(path: str, content: str) -> Optional[FileSymbols]:
+    """Extrait les symboles d'un fichier ; None pour les langages non pris en charge."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in PYTHON_EXTENSIONS:
+        return _extract_python(path, content)
+    if extension in SCRIPT_EXTENSIONS:
+        return _extract_script(path, content)
+    if extension in HTML_EXTENSIONS:
+        return _extract_html(path, content)
+    return None
+
+
+class SymbolIndex:
+    """
+    Symboles des fichiers du workspace, analysés à la demande et gardés tant
+    que le fichier ne change pas (clé: mtime et taille de l'index du workspace).
+
+    Les deltas de `WorkspaceIndex` invalident les fichiers modifiés ou supprimés.
+    """
+
+    def __init__(self, workspace_index: WorkspaceIndex):
+        self.workspace_index = workspace_index
+        self._lock = threading.Lock()
+        self._files: Dict[str, Tuple[Tuple[int, int], Optional[FileSymbols]]] = {}
+        self.hits = 0
+        self.parses = 0
+        self.parse_ms = 0.0
+
+    @staticmethod
+    def supports(rel_path: str) -> bool:
+        extension = os.path.splitext(rel_path)[1].lower()
+        return extension in PYTHON_EXTENSIONS | SCRIPT_EXTENSIONS | HTML_EXTENSIONS
+
+    def get(self, rel_path: str, content: str) -> Optional[FileSymbols]:
+        """
+        Symboles de `rel_path` dont le contenu est `content` (déjà lu par l'appelant).
+
+        Returns:
+            FileSymbols, ou None si le langage n'est pas pris en charge
+        """
+        if not self.supports(rel_path):
+            return None
+        key = self.workspace_index.file_stat(rel_path)
+        with self._lock:
+            cached = self._files.get(rel_path)
+            if key is not None and cached is not None and cached[0] == key:
+                self.hits += 1
+                return cached[1]
+        start = time.perf_counter()
+        symbols = extract_symbols(rel_path, content)
+        with self._lock:
+            self.parses += 1
+            self.parse_ms += (time.perf_counter() - start) * 1000
+            if key is not None:
+                self._files[rel_path] = (key, symbols)
+        return symbols
+
+    def update(self, delta: IndexDelta) -> None:
+        """Oublie les fichiers modifiés ou supprimés (ré-analysés au prochain accès)."""
+        if not delta.count:
+            return
+        with self._lock:
+            for rel_path in delta.modified + delta.removed:
+                self._files.pop(rel_path, None)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "files": len(self._files),
+                "hits": self.hits,
+                "parses": self.parses,
+                "parse_ms": round(self.parse_ms, 1),
+            }
+
+
+def relevant_symbols(file_symbols: FileSymbols, lines: List[str], terms: Set[str]) -> List[Tuple[float, Symbol]]:
+    """
+    Symboles d'un fichier classés par pertinence pour les termes de l'instruction:
+    un terme dans le nom compte plus qu'une mention dans le corps.
+    """
+    scored = []
+    for symbol in file_symbols.symbols:
+        if symbol.kind == "class" and any(s.parent == symbol.name for s in file_symbols.symbols):
+            continue  # Les méthodes sont proposées une à une
+        name_hits = terms.intersection(tokenize(symbol.name))
+        body_terms = set()
+        for line in lines[symbol.start - 1:symbol.end]:
+            body_terms.update(tokenize(line))
+        body_hits = terms.intersection(body_terms)
+        score = 3.0 * len(name_hits) + len(body_hits)
+        if score:
+            scored.append((score, symbol))
+    scored.sort(key=lambda item: (-item[0], item[1].start))
+    return scored
@@ -0,0 +1,372 @@
+"""
+Suivi de consommation - Tokens et coût estimé de chaque appel IA, par instruction, provider et jour
+Stockage SQLite local: détail des appels (rétention bornée) et cumuls journaliers (conservés).
+"""
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional, List, Dict, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Tarifs indicatifs en USD par million de tokens: (entrée, entrée lue depuis le cache, sortie).
+# Recherche par préfixe du nom de modèle (le plus long l'emporte) ; surchargeables via USAGE_PRICES.
+PRICES: Dict[str, Tuple[float, float, float]] = {
+    "claude-3-5-haiku": (0.80, 0.08, 4.00),
+    "claude-3-haiku": (0.25, 0.03, 1.25),
+    "claude-haiku": (0.80, 0.08, 4.00),
+    "claude-3-5-sonnet": (3.00, 0.30, 15.00),
+    "claude-3-7-sonnet": (3.00, 0.30, 15.00),
+    "claude-sonnet": (3.00, 0.30, 15.00),
+    "claude-3-opus": (15.00, 1.50, 75.00),
+    "claude-opus": (15.00, 1.50, 75.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "o3-mini": (1.10, 0.55, 4.40),
+    "llama-3.1-8b": (0.05, 0.05, 0.08),
+    "llama-3.1-70b": (0.59, 0.59, 0.79),
+    "llama-3.3-70b": (0.59, 0.59, 0.79),
+    "mixtral-8x7b": (0.24, 0.24, 0.24),
+    "gemma": (0.20, 0.20, 0.20),
+    "gemini-flash-lite": (0.075, 0.01875, 0.30),
+    "gemini-1.5-flash": (0.075, 0.01875, 0.30),
+    "gemini-2.0-flash": (0.10, 0.025, 0.40),
+    "gemini-flash": (0.10, 0.025, 0.40),
+    "gemini-1.5-pro": (1.25, 0.3125, 5.00),
+    "gemini-pro": (1.25, 0.3125, 5.00),
+}
+# Écriture dans le cache de préfixe Anthropic: facturée 1,25 fois l'entrée
+CACHE_WRITE_FACTOR = 1.25
+
+
+@dataclass
+class UsageScope:
+    """Instruction en cours: les appels IA faits pendant son traitement lui sont rattachés."""
+    instruction_id: str
+    instruction: str
+    context: str = ""  # résumé du contexte envoyé (fichiers, tokens)
+
+
+# Instruction et étape courantes (héritées par les tâches asyncio créées pendant le traitement)
+CURRENT_SCOPE: ContextVar[Optional[UsageScope]] = ContextVar("usage_scope", default=None)
+CURRENT_STAGE: ContextVar[str] = ContextVar("usage_stage", default="generation")
+
+
+@dataclass
+class UsageRecord:
+    """Un appel à un provider (un essai: les nouveaux essais et continuations sont des appels distincts)."""
+    provider: str
+    model: str
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+    cache_write_tokens: int = 0
+    estimated_tokens: int = 0  # estimation locale de l'entrée (providers qui ne renvoient rien)
+    duration_ms: float = 0.0
+    first_token_ms: Optional[float] = None
+    success: bool = True
+    error: Optional[str] = None  # type d'erreur (quota, server, timeout...)
+    stage: str = "generation"  # generation, continuation, plan, file
+    instruction_id: str = ""
+    instruction: str = ""
+    context: str = ""
+
+
+def parse_prices(spec: str) -> Dict[str, Tuple[float, float, float]]:
+    """
+    Tarifs au format "modèle=entrée/cache/sortie" séparés par des virgules
+    (ex: "gpt-4o=2.5/1.25/10,llama-3.3=0.59/0.59/0.79"), en USD par million de tokens.
+    """
+    prices = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        model, values = item.split("=", 1)
+        try:
+            numbers = [float(v) for v in values.split("/")]
+        except ValueError:
+            logger.warning(f"⚠️ Tarif ignoré (format modèle=entrée/cache/sortie): {item.strip()}")
+            continue
+        if len(numbers) == 2:
+            numbers = [numbers[0], numbers[0], numbers[1]]
+        if len(numbers) == 3:
+            prices[model.strip().lower()] = tuple(numbers)
+    return prices
+
+
+def estimate_cost(record: UsageRecord, prices: Optional[Dict[str, Tuple[float, float, float]]] = None) -> Optional[float]:
+    """Coût estimé d'un appel en USD (0 pour Ollama, None si le modèle n'a pas de tarif connu)."""
+    if record.provider == "ollama":
+        return 0.0
+    model = record.model.lower()
+    if model.startswith("models/"):
+        model = model[len("models/"):]
+    table = prices if prices is not None else PRICES
+    match = max((prefix for prefix in table if model.startswith(prefix)), key=len, default=None)
+    if match is None:
+        return None
+    input_price, cached_price, output_price = table[match]
+    fresh = max(0, record.input_tokens - record.cached_tokens - record.cache_write_tokens)
+    return (
+        fresh * input_price
+        + record.cached_tokens * cached_price
+        + record.cache_write_tokens * input_price * CACHE_WRITE_FACTOR
+        + record.output_tokens * output_price
+    ) / 1_000_000
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS calls (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    day TEXT NOT NULL,
+    instruction_id TEXT,
+    instruction TEXT,
+    context TEXT,
+    stage TEXT,
+    provider TEXT NOT NULL,
+    model TEXT NOT NULL,
+    input_tokens INTEGER NOT NULL,
+    output_tokens INTEGER NOT NULL,
+    cached_tokens INTEGER NOT NULL,
+    cache_write_tokens INTEGER NOT NULL,
+    estimated_tokens INTEGER NOT NULL,
+    duration_ms REAL,
+    first_token_ms REAL,
+    success INTEGER NOT NULL,
+    error TEXT,
+    cost REAL
+);
+CREATE INDEX IF NOT EXISTS calls_ts ON calls (ts);
+CREATE INDEX IF NOT EXISTS calls_instruction ON calls (instruction_id);
+CREATE TABLE IF NOT EXISTS daily (
+    day TEXT NOT NULL,
+    provider TEXT NOT NULL,
+    calls INTEGER NOT NULL DEFAULT 0,
+    errors INTEGER NOT NULL DEFAULT 0,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    cached_tokens INTEGER NOT NULL DEFAULT 0,
+    cost REAL NOT NULL DEFAULT 0,
+    unpriced INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, provider)
+);
+"""
+
+
+class UsageStore:
+    """
+    Journal de consommation des appels IA.
+
+    Chaque appel est inséré dans `calls` et ajouté au cumul `daily`
+    (jour, provider) dans la même transaction. Le détail est élagué après
+    `retention_days` ; les cumuls journaliers sont conservés.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str],
+        retention_days: int = 90,
+        prices: Optional[Dict[str, Tuple[float, float, float]]] = None,
+    ):
+        """
+        Args:
+            path: Fichier SQLite (None = suivi désactivé)
+            retention_days: Durée de conservation du détail des appels
+            prices: Tarifs ajoutés à PRICES (ou qui les remplacent)
+        """
+        self.path = path
+        self.retention_days = retention_days
+        self.prices = dict(PRICES, **(prices or {}))
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pruned_day: Optional[str] = None
+        if path:
+            try:
+                self._open(path)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"⚠️ Suivi de consommation désactivé ({path}): {e}")
+                self._conn = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._conn is not None
+
+    def _open(self, path: str) -> None:
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        self._conn = conn
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def record(self, record: UsageRecord) -> Optional[float]:
+        """
+        Enregistre un appel. Une erreur SQLite est journalisée sans
+        interrompre l'instruction.
+
+        Returns:
+            Le coût estimé de l'appel (None si inconnu)
+        """
+        cost = estimate_cost(record, self.prices)
+        if self._conn is None:
+            return cost
+        now = time.time()
+        day = time.strftime("%Y-%m-%d", time.localtime(now))
+        try:
+            with self._lock:
+                conn = self._conn
+                conn.execute("BEGIN")
+                try:
+                    conn.execute(
+                        "INSERT INTO calls (ts, day, instruction_id, instruction, context, stage, provider, model, "
+                        "input_tokens, output_tokens, cached_tokens, cache_write_tokens, estimated_tokens, "
+                        "duration_ms, first_token_ms, success, error, cost) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            now, day, record.instruction_id, record.instruction[:200], record.context, record.stage,
+                            record.provider, record.model, record.input_tokens, record.output_tokens,
+                            record.cached_tokens, record.cache_write_tokens, record.estimated_tokens,
+                            record.duration_ms, record.first_token_ms, int(record.success), record.error, cost,
+                        ),
+                    )
+                    conn.execute(
+                        "INSERT INTO daily (day, provider, calls, errors, input_tokens, output_tokens, cached_tokens, "
+                        "cost, unpriced) VALUES (?, ?, 1, ?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT (day, provider) DO UPDATE SET calls = calls + 1, errors = errors + excluded.errors, "
+                        "input_tokens = input_tokens + excluded.input_tokens, "
+                        "output_tokens = output_tokens + excluded.output_tokens, "
+                        "cached_tokens = cached_tokens + excluded.cached_tokens, "
+                        "cost = cost + excluded.cost, unpriced = unpriced + excluded.unpriced",
+                        (
+                            # Même mesure que par instruction: estimation locale si le provider ne renvoie rien
+                            day, f"{record.provider}/{record.model}", int(not record.success),
+                            max(record.input_tokens, record.estimated_tokens), record.output_tokens, record.cached_tokens, cost or 0.0, int(cost is None),
+                        ),
+                    )
+                    if self._pruned_day != day:
+                        conn.execute("DELETE FROM calls WHERE ts < ?", (now - self.retention_days * 86400,))
+                        self._pruned_day = day
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Consommation non enregistrée: {e}")
+        return cost
+
+    # ------------------------------------------------------------------
+    # Lecture
+    # ------------------------------------------------------------------
+
+    def _query(self, sql: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        if self._conn is None:
+            return []
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            columns = [c[0] for c in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    @staticmethod
+    def _since(days: int) -> str:
+        return time.strftime("%Y-%m-%d", time.localtime(time.time() - (days - 1) * 86400))
+
+    def daily(self, days: int = 7) -> List[Dict[str, Any]]:
+        """Cumuls par jour (tous providers confondus), du plus récent au plus ancien."""
+        return self._query(
+            "SELECT day, SUM(calls) AS calls, SUM(errors) AS errors, SUM(input_tokens) AS input_tokens, "
+            "SUM(output_tokens) AS output_tokens, SUM(cached_tokens) AS cached_tokens, SUM(cost) AS cost, "
+            "SUM(unpriced) AS unpriced FROM daily WHERE day >= ? GROUP BY day ORDER BY day DESC",
+            (self._since(days),),
+        )
+
+    def by_provider(self, days: int = 7) -> List[Dict[str, Any]]:
+        """Cumuls par provider/modèle sur la période, du plus coûteux au moins coûteux."""
+        return self._query(
+            "SELECT provider, SUM(calls) AS calls, SUM(errors) AS errors, SUM(input_tokens) AS input_tokens, "
+            "SUM(output_tokens) AS output_tokens, SUM(cached_tokens) AS cached_tokens, SUM(cost) AS cost, "
+            "SUM(unpriced) AS unpriced FROM daily WHERE day >= ? GROUP BY provider "
+            "ORDER BY SUM(cost) DESC, SUM(input_tokens) DESC",
+            (self._since(days),),
+        )
+
+    def largest(self, limit: int = 5, days: int = 7) -> List[Dict[str, Any]]:
+        """Instructions les plus lourdes en entrée (repérer un contexte qui gonfle)."""
+        return self._query(
+            "SELECT instruction_id, MAX(ts) AS ts, MAX(instruction) AS instruction, MAX(context) AS context, "
+            "COUNT(*) AS calls, SUM(MAX(input_tokens, estimated_tokens)) AS input_tokens, "
+            "SUM(cached_tokens) AS cached_tokens, SUM(output_tokens) AS output_tokens, SUM(cost) AS cost "
+            "FROM calls WHERE ts >= ? AND instruction_id != '' GROUP BY instruction_id "
+            "ORDER BY input_tokens DESC LIMIT ?",
+            (time.time() - days * 86400, limit),
+        )
+
+    def render_text(self, days: int = 7, limit: int = 5) -> str:
+        """Rapport compact pour Telegram: totaux, jours, providers, plus grosses instructions."""
+        if not self.enabled:
+            return "Suivi de consommation désactivé (USAGE_DB)."
+        per_day = self.daily(days)
+        if not per_day:
+            return f"Aucun appel enregistré sur les {days} derniers jours."
+
+        def cost_text(row: Dict[str, Any]) -> str:
+            text = f"${row['cost'] or 0:.4f}"
+            return text + ("+?" if row.get("unpriced") else "")
+
+        total = {key: sum(row[key] or 0 for row in per_day) for key in per_day[0] if key != "day"}
+        lines = [
+            f"Total {days} j: {total['calls']} appel(s), {_tokens(total['input_tokens'])} entrée "
+            f"(dont {_tokens(total['cached_tokens'])} en cache), {_tokens(total['output_tokens'])} sortie, "
+            f"{cost_text(total)}",
+            "",
+        ]
+        for row in per_day:
+            lines.append(
+                f"{row['day']}: {row['calls']} appel(s), {_tokens(row['input_tokens'])} / "
+                f"{_tokens(row['output_tokens'])}, {cost_text(row)}"
+            )
+        lines.append("")
+        for row in self.by_provider(days):
+            errors = f", {row['errors']} err." if row["errors"] else ""
+            lines.append(
+                f"{row['provider']}: {row['calls']} appel(s){errors}, {_tokens(row['input_tokens'])} / "
+                f"{_tokens(row['output_tokens'])}, {cost_text(row)}"
+            )
+        biggest = self.largest(limit, days)
+        if biggest:
+            lines.append("")
+            lines.append("Plus grosses instructions (entrée):")
+            for row in biggest:
+                when = time.strftime("%d/%m %H:%M", time.localtime(row["ts"]))
+                instruction = (row["instruction"] or "")[:50]
+                lines.append(
+                    f"{when} {_tokens(row['input_tokens'])} en {row['calls']} appel(s), ${row['cost'] or 0:.4f}: "
+                    f"{instruction}"
+                )
+                if row["context"]:
+                    lines.append(f"    {row['context']}")
+        return "\n".join(lines)
+
+
+def _tokens(count: Optional[int]) -> str:
+    count = count or 0
+    if count >= 1_000_000:
+        return f"{count / 1_000_000:.1f}M"
+    if count >= 1_000:
+        return f"{count / 1_000:.1f}k"
+    return str(count)
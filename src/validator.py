@@ -0,0 +1,310 @@
+"""
+Validation avant écriture - Syntaxe des fichiers générés (Python, JSON, YAML, HTML, JS) vérifiée en parallèle
+Les fichiers sont contrôlés dans un pool de processus ; un fichier invalide n'est pas écrit mais corrigé.
+"""
+
+import os
+import json
+import shutil
+import logging
+import tempfile
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from html.parser import HTMLParser
+from typing import Optional, List, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Balises HTML sans fermeture, et balises dont la fermeture est implicite
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr",
+}
+OPTIONAL_CLOSE = {
+    "html", "head", "body", "p", "li", "dt", "dd", "tr", "td", "th", "thead", "tbody", "tfoot", "option",
+    "optgroup", "colgroup", "caption", "rb", "rt", "rp",
+}
+# Délai d'une vérification par Node
+TOOL_TIMEOUT = 10.0
+
+
+def _located(message: str, content: str, line: Optional[int]) -> str:
+    """Message d'erreur suivi de la ligne fautive (pour une correction ciblée)."""
+    if not line:
+        return message
+    lines = content.splitlines()
+    text = f"ligne {line}: {message}"
+    if 0 < line <= len(lines):
+        text += f"\n{line:>5} | {lines[line - 1].rstrip()[:200]}"
+    return text
+
+
+def check_python(path: str, content: str) -> Optional[str]:
+    try:
+        compile(content, path, "exec", dont_inherit=True)
+    except SyntaxError as e:
+        return _located(f"{type(e).__name__}: {e.msg}", content, e.lineno)
+    except ValueError as e:
+        return str(e)
+    return None
+
+
+def check_json(path: str, content: str) -> Optional[str]:
+    try:
+        json.loads(content)
+    except json.JSONDecodeError as e:
+        return _located(f"JSON invalide: {e.msg}", content, e.lineno)
+    return None
+
+
+def check_yaml(path: str, content: str) -> Optional[str]:
+    try:
+        import yaml
+    except ImportError:
+        return None  # PyYAML absent: pas de vérification
+    try:
+        list(yaml.safe_load_all(content))
+    except yaml.YAMLError as e:
+        mark = getattr(e, "problem_mark", None)
+        problem = getattr(e, "problem", None) or str(e).splitlines()[0]
+        return _located(f"YAML invalide: {problem}", content, mark.line + 1 if mark is not None else None)
+    return None
+
+
+class _HTMLChecker(HTMLParser):
+    """Repère les balises fermées sans avoir été ouvertes et celles jamais refermées."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack: List[Tuple[str, int]] = []
+        self.error: Optional[Tuple[str, int]] = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in VOID_ELEMENTS:
+            self.stack.append((tag, self.getpos()[0]))
+
+    def handle_startendtag(self, tag, attrs):
+        pass
+
+    def handle_endtag(self, tag):
+        if self.error or tag in VOID_ELEMENTS:
+            return
+        for index in range(len(self.stack) - 1, -1, -1):
+            if self.stack[index][0] == tag:
+                unclosed = [t for t in self.stack[index + 1:] if t[0] not in OPTIONAL_CLOSE]
+                if unclosed:
+                    name, line = unclosed[-1]
+                    self.error = (f"<{name}> (ligne {line}) non fermée avant </{tag}>", self.getpos()[0])
+                del self.stack[index:]
+                return
+        if tag not in OPTIONAL_CLOSE:
+            self.error = (f"</{tag}> sans balise ouvrante", self.getpos()[0])
+
+
+def check_html(path: str, content: str) -> Optional[str]:
+    checker = _HTMLChecker()
+    checker.feed(content)
+    checker.close()
+    if checker.error:
+        message, line = checker.error
+        return _located(f"HTML mal formé: {message}", content, line)
+    unclosed = [t for t in checker.stack if t[0] not in OPTIONAL_CLOSE]
+    if unclosed:
+        name, line = unclosed[-1]
+        return _located(f"HTML mal formé: <{name}> jamais fermée", content, line)
+    return None
+
+
+# Vérifie chaque fichier passé en argument: script classique, sinon module ES (import/export)
+_NODE_CHECKER = r"""
+const fs = require("fs"), vm = require("vm");
+const errors = {};
+const located = (e) => {
+  const at = /^[^\n]*:(\d+)\n/.exec(e.stack || "");
+  return { message: `${e.name}: ${e.message}`, line: at ? Number(at[1]) : null };
+};
+for (const file of process.argv.slice(1)) {
+  const source = fs.readFileSync(file, "utf8");
+  try { new vm.Script(source, { filename: file }); continue; } catch (e) {
+    if (!(e instanceof SyntaxError)) continue;
+    let error = located(e);
+    if (vm.SourceTextModule && /import|export|await|module/.test(e.message)) {
+      try { new vm.SourceTextModule(source, { identifier: file }); continue; } catch (e2) { error = located(e2); }
+    }
+    errors[file] = error;
+  }
+}
+process.stdout.write(JSON.stringify(errors));
+"""
+
+
+def check_scripts(items: List[Tuple[str, str]], node: str) -> Dict[str, str]:
+    """
+    JavaScript: tous les fichiers du lot vérifiés par un seul processus Node
+    (analyse sans exécution). Ignoré si Node n'est pas installé.
+    """
+    if not items or not node or shutil.which(node) is None:
+        return {}
+    with tempfile.TemporaryDirectory(prefix="validate-") as directory:
+        temp_paths = {}
+        for index, (path, content) in enumerate(items):
+            temp = os.path.join(directory, f"{index}{os.path.splitext(path)[1] or '.js'}")
+            with open(temp, "w", encoding="utf-8") as f:
+                f.write(content)
+            temp_paths[temp] = (path, content)
+        try:
+            proc = subprocess.run(
+                [node, "--experimental-vm-modules", "--no-warnings", "-e", _NODE_CHECKER, *temp_paths],
+                capture_output=True, text=True, timeout=TOOL_TIMEOUT,
+            )
+            found = json.loads(proc.stdout or "{}")
+        except (OSError, subprocess.TimeoutExpired, ValueError) as e:
+            logger.debug(f"Vérification JavaScript impossible: {e}")
+            return {}
+    errors = {}
+    for temp, error in found.items():
+        path, content = temp_paths[temp]
+        errors[path] = _located(error.get("message", "SyntaxError"), content, error.get("line"))
+    return errors
+
+
+_CHECKERS = {
+    ".py": check_python,
+    ".json": check_json,
+    ".yaml": check_yaml,
+    ".yml": check_yaml,
+    ".html": check_html,
+    ".htm": check_html,
+}
+_SCRIPT_EXTENSIONS = {".js", ".mjs", ".cjs"}
+# JSON avec commentaires et virgules finales (JSONC), accepté par les outils qui le lisent
+_JSONC_PREFIXES = ("tsconfig", "jsconfig")
+_JSONC_NAMES = {".eslintrc.json", "devcontainer.json", ".devcontainer.json"}
+_JSONC_DIRS = {".vscode", ".devcontainer"}
+
+
+def is_jsonc(path: str) -> bool:
+    """Fichier .json lu comme du JSONC (tsconfig.json, .vscode/settings.json…) : pas vérifié par json.loads."""
+    parts = path.replace("\\", "/").lower().split("/")
+    name = parts[-1]
+    return (
+        name in _JSONC_NAMES
+        or (name.endswith(".json") and name.startswith(_JSONC_PREFIXES))
+        or any(part in _JSONC_DIRS for part in parts[:-1])
+    )
+
+
+def _checker_for(path: str):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".json" and is_jsonc(path):
+        return None
+    return _CHECKERS.get(extension)
+
+
+def validate_content(path: str, content: str) -> Optional[str]:
+    """Erreur de syntaxe du contenu (None si valide ou format non vérifié), hors JavaScript."""
+    checker = _checker_for(path)
+    return checker(path, content) if checker else None
+
+
+def _validate_chunk(items: List[Tuple[str, str]], node: str) -> List[Tuple[str, Optional[str]]]:
+    """Vérifie un lot de fichiers (exécuté dans un worker du pool ou sur place)."""
+    scripts = [(path, content) for path, content in items if os.path.splitext(path)[1].lower() in _SCRIPT_EXTENSIONS]
+    script_errors = check_scripts(scripts, node)
+    return [
+        (path, script_errors.get(path) if path in script_errors else validate_content(path, content))
+        for path, content in items
+    ]
+
+
+class FileValidator:
+    """
+    Vérifie la syntaxe des fichiers avant écriture.
+
+    Les lots d'au moins `pool_min_files` fichiers sont répartis sur un pool
+    de processus (démarré au premier lot, puis réutilisé) ; les plus petits
+    sont vérifiés sur place, l'aller-retour vers un worker coûtant plus que
+    la vérification d'un seul fichier. Sur une machine à un seul cœur, tout
+    est vérifié sur place. Le JavaScript d'un lot est confié à un seul
+    processus Node. Dans le pool, les fichiers dont la vérification dépasse
+    `timeout` sont écrits sans contrôle.
+    """
+
+    def __init__(self, workers: int = 0, node: str = "node", timeout: float = 5.0, pool_min_files: int = 4):
+        """
+        Args:
+            workers: Processus du pool (0 = automatique, -1 = pas de pool)
+            node: Exécutable Node pour vérifier le JavaScript ("" = pas de vérification JS)
+            timeout: Délai maximal d'une validation de lot (secondes)
+            pool_min_files: Taille de lot à partir de laquelle le pool est utilisé
+        """
+        cpus = os.cpu_count() or 1
+        self.workers = (min(4, cpus) if cpus > 1 else 0) if workers == 0 else max(0, workers)
+        self.node = node
+        self.timeout = timeout
+        self.pool_min_files = pool_min_files
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.checked = 0
+        self.failed = 0
+
+    def supports(self, path: str) -> bool:
+        if _checker_for(path) is not None:
+            return True
+        return os.path.splitext(path)[1].lower() in _SCRIPT_EXTENSIONS and bool(self.node)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: pas de fork d'un processus qui fait tourner des threads (boucle asyncio, écritures)
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def validate(self, files: Dict[str, str]) -> Dict[str, str]:
+        """
+        Args:
+            files: Chemin -> contenu à écrire
+
+        Returns:
+            Chemin -> message d'erreur, pour les seuls fichiers invalides
+        """
+        items = [(path, content) for path, content in files.items() if self.supports(path)]
+        if not items:
+            return {}
+        if self.workers and len(items) >= self.pool_min_files:
+            results = self._validate_pooled(items)
+        else:
+            results = _validate_chunk(items, self.node)
+        errors = {path: error for path, error in results if error}
+        self.checked += len(items)
+        self.failed += len(errors)
+        return errors
+
+    def _validate_pooled(self, items: List[Tuple[str, str]]) -> List[Tuple[str, Optional[str]]]:
+        size = max(1, -(-len(items) // (self.workers * 2)))
+        chunks = [items[i:i + size] for i in range(0, len(items), size)]
+        try:
+            pool = self._get_pool()
+            futures = [pool.submit(_validate_chunk, chunk, self.node) for chunk in chunks]
+        except (BrokenProcessPool, RuntimeError, OSError) as e:
+            logger.warning(f"⚠️ Pool de validation indisponible ({e}), vérification sur place")
+            self.close()
+            return _validate_chunk(items, self.node)
+        done, not_done = wait(futures, timeout=self.timeout)
+        results: List[Tuple[str, Optional[str]]] = []
+        for future in futures:
+            if future in not_done:
+                future.cancel()
+                continue
+            try:
+                results.extend(future.result())
+            except BrokenProcessPool as e:
+                logger.warning(f"⚠️ Worker de validation perdu: {e}")
+                self.close()
+        if not_done:
+            logger.warning(f"⏱️ Validation de {len(items)} fichier(s) au-delà de {self.timeout:.0f}s: contrôle partiel")
+        return results
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
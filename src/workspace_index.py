@@ -0,0 +1,392 @@
+"""
+Index du workspace - Arborescence des fichiers gardée en mémoire et mise à jour par deltas
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Optional, List, Dict, Set, Tuple, Iterable
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+# Dossiers jamais indexés (en plus des dossiers cachés)
+IGNORED_DIRS = {"node_modules", "venv", "__pycache__", ".git"}
+
+
+@dataclass
+class IndexDelta:
+    """Changements détectés depuis le dernier rafraîchissement."""
+    added: List[str] = field(default_factory=list)
+    modified: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    elapsed_ms: float = 0.0
+
+    @property
+    def count(self) -> int:
+        return len(self.added) + len(self.modified) + len(self.removed)
+
+
+@dataclass
+class _DirEntry:
+    mtime_ns: int
+    subdirs: List[str]
+    files: List[str]
+
+
+class WorkspaceIndex:
+    """
+    Index en mémoire des fichiers du workspace.
+
+    Construit une seule fois, puis mis à jour à partir des événements du
+    système de fichiers (watchdog, si installé) ou, à défaut, par comparaison
+    des mtimes : seuls les dossiers dont le mtime a changé sont relistés.
+    """
+
+    def __init__(self, root: str, watch: bool = True, sweep_interval: Optional[float] = None):
+        """
+        Initialise et construit l'index.
+
+        Args:
+            root: Chemin du workspace
+            watch: Utiliser les notifications du système de fichiers si disponibles
+            sweep_interval: Sans watchdog, intervalle minimal (secondes) entre deux
+                vérifications des mtimes de tous les fichiers (0 = à chaque refresh)
+        """
+        self.root = root
+        if sweep_interval is None:
+            sweep_interval = float(os.getenv("AI_INDEX_SWEEP_SECONDS", "30"))
+        self.sweep_interval = sweep_interval
+        self._last_sweep = time.monotonic()
+        self._hinted: Set[str] = set()  # fichiers écrits par le bot, revérifiés au prochain refresh
+        self.generation = 0
+        self.events = 0  # Événements watchdog reçus (changements pas encore rafraîchis compris)
+        self._dirs: Dict[str, _DirEntry] = {}
+        self._files: Dict[str, Tuple[int, int]] = {}  # chemin relatif -> (mtime_ns, taille)
+        self._lock = threading.RLock()
+        self._dirty: Set[str] = set()
+        self._observer = None
+        self._structure_cache: Dict[Optional[int], Tuple[int, str]] = {}
+
+        start = time.perf_counter()
+        self._scan_dir("")
+        logger.info(
+            f"✅ Index du workspace construit: {len(self._files)} fichiers, "
+            f"{len(self._dirs)} dossiers en {(time.perf_counter() - start) * 1000:.0f} ms"
+        )
+
+        if watch:
+            self._start_watcher()
+
+    # ------------------------------------------------------------------
+    # Construction / mise à jour
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _is_ignored_dir(name: str) -> bool:
+        return name.startswith('.') or name in IGNORED_DIRS
+
+    def _full(self, rel_path: str) -> str:
+        return os.path.join(self.root, rel_path) if rel_path else self.root
+
+    def _list_dir(self, rel_dir: str) -> Optional[Tuple[int, List[str], List[str], Dict[str, Tuple[int, int]]]]:
+        """Liste un dossier: (mtime_ns, sous-dossiers, fichiers, stats des fichiers)."""
+        full = self._full(rel_dir)
+        try:
+            mtime_ns = os.stat(full).st_mtime_ns
+            subdirs, files, stats = [], [], {}
+            with os.scandir(full) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not self._is_ignored_dir(entry.name):
+                                subdirs.append(entry.name)
+                        elif not entry.name.startswith('.'):
+                            st = entry.stat()
+                            files.append(entry.name)
+                            stats[entry.name] = (st.st_mtime_ns, st.st_size)
+                    except OSError:
+                        continue
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        except OSError as e:
+            logger.warning(f"⚠️ Index: lecture impossible de {full}: {e}")
+            return None
+        subdirs.sort()
+        files.sort()
+        return mtime_ns, subdirs, files, stats
+
+    def _scan_dir(self, rel_dir: str, delta: Optional[IndexDelta] = None) -> None:
+        """Indexe récursivement un dossier (nouveau ou reconstruit)."""
+        stack = [rel_dir]
+        while stack:
+            current = stack.pop()
+            listing = self._list_dir(current)
+            if listing is None:
+                continue
+            mtime_ns, subdirs, files, stats = listing
+            self._dirs[current] = _DirEntry(mtime_ns, subdirs, files)
+            for name in files:
+                rel_path = os.path.join(current, name) if current else name
+                self._files[rel_path] = stats[name]
+                if delta is not None:
+                    delta.added.append(rel_path)
+            stack.extend(os.path.join(current, d) if current else d for d in reversed(subdirs))
+
+    def _drop_dir(self, rel_dir: str, delta: IndexDelta) -> None:
+        """Retire un dossier et tout son sous-arbre de l'index."""
+        entry = self._dirs.pop(rel_dir, None)
+        if entry is None:
+            return
+        for name in entry.files:
+            rel_path = os.path.join(rel_dir, name) if rel_dir else name
+            if self._files.pop(rel_path, None) is not None:
+                delta.removed.append(rel_path)
+        for sub in entry.subdirs:
+            self._drop_dir(os.path.join(rel_dir, sub) if rel_dir else sub, delta)
+
+    def _rescan_dir(self, rel_dir: str, delta: IndexDelta) -> None:
+        """Reliste un dossier dont le contenu a changé et calcule le delta."""
+        old = self._dirs.get(rel_dir)
+        listing = self._list_dir(rel_dir)
+        if listing is None:
+            if old is not None:
+                self._drop_dir(rel_dir, delta)
+            return
+        mtime_ns, subdirs, files, stats = listing
+        if old is None:
+            self._scan_dir(rel_dir, delta)
+            return
+
+        join = (lambda n: os.path.join(rel_dir, n)) if rel_dir else (lambda n: n)
+        old_files = set(old.files)
+        for name in files:
+            rel_path = join(name)
+            if name not in old_files:
+                delta.added.append(rel_path)
+            elif self._files.get(rel_path) != stats[name]:
+                delta.modified.append(rel_path)
+            self._files[rel_path] = stats[name]
+        new_files = set(files)
+        for name in old.files:
+            if name not in new_files:
+                rel_path = join(name)
+                self._files.pop(rel_path, None)
+                delta.removed.append(rel_path)
+
+        old_subdirs = set(old.subdirs)
+        new_subdirs = set(subdirs)
+        for name in old.subdirs:
+            if name not in new_subdirs:
+                self._drop_dir(join(name), delta)
+        self._dirs[rel_dir] = _DirEntry(mtime_ns, subdirs, files)
+        for name in subdirs:
+            if name not in old_subdirs:
+                self._scan_dir(join(name), delta)
+
+    def _stat_file(self, rel_path: str, delta: IndexDelta) -> None:
+        """Vérifie un fichier connu (contenu modifié en place)."""
+        try:
+            st = os.stat(self._full(rel_path))
+        except OSError:
+            return  # La suppression sera vue via le mtime du dossier parent
+        stamp = (st.st_mtime_ns, st.st_size)
+        if self._files.get(rel_path) != stamp:
+            self._files[rel_path] = stamp
+            delta.modified.append(rel_path)
+
+    def mark_changed(self, rel_paths: Iterable[str]) -> None:
+        """Signale des fichiers modifiés par le bot: revérifiés au prochain refresh, même entre deux balayages."""
+        with self._lock:
+            self._hinted.update(rel_paths)
+
+    def refresh(self, full: bool = False) -> IndexDelta:
+        """
+        Met à jour l'index et retourne les changements depuis le dernier appel.
+
+        Avec watchdog, seuls les chemins signalés sont revérifiés. Sinon, les
+        mtimes des dossiers sont comparés à chaque appel (créations,
+        suppressions) ; ceux de tous les fichiers (modifications en place)
+        au plus une fois par `sweep_interval`, ou si `full`. Les fichiers
+        signalés par `mark_changed` sont toujours revérifiés. Aucune relecture
+        de contenu.
+        """
+        start = time.perf_counter()
+        delta = IndexDelta()
+        with self._lock:
+            hinted, self._hinted = self._hinted, set()
+            if self._observer is not None:
+                dirty, self._dirty = self._dirty, set()
+                dirs_to_check = set()
+                files_to_check = set()
+                for rel in dirty:
+                    if rel in self._dirs:
+                        dirs_to_check.add(rel)
+                    elif rel in self._files:
+                        files_to_check.add(rel)
+                    # Création/suppression: le dossier parent a changé
+                    dirs_to_check.add(os.path.dirname(rel))
+            else:
+                dirs_to_check = set(self._dirs)
+                now = time.monotonic()
+                if full or now - self._last_sweep >= self.sweep_interval:
+                    files_to_check = set(self._files)
+                    self._last_sweep = now
+                else:
+                    files_to_check = set()
+            files_to_check |= hinted
+
+            # Parents d'abord pour éviter de relister un sous-arbre supprimé
+            for rel_dir in sorted(dirs_to_check, key=lambda d: d.count(os.sep) if d else -1):
+                entry = self._dirs.get(rel_dir)
+                if entry is None:
+                    parent = os.path.dirname(rel_dir)
+                    if rel_dir and parent in self._dirs:
+                        self._rescan_dir(parent, delta)
+                    continue
+                try:
+                    mtime_ns = os.stat(self._full(rel_dir)).st_mtime_ns
+                except OSError:
+                    mtime_ns = None
+                if mtime_ns != entry.mtime_ns:
+                    self._rescan_dir(rel_dir, delta)
+
+            seen = set(delta.added) | set(delta.modified) | set(delta.removed)
+            for rel_path in files_to_check:
+                if rel_path in self._files and rel_path not in seen:
+                    self._stat_file(rel_path, delta)
+
+            if delta.count:
+                self.generation += 1
+        delta.elapsed_ms = (time.perf_counter() - start) * 1000
+        return delta
+
+    # ------------------------------------------------------------------
+    # Surveillance du système de fichiers (optionnelle)
+    # ------------------------------------------------------------------
+
+    def _start_watcher(self) -> None:
+        """Démarre watchdog s'il est installé (sinon: mode mtime)."""
+        try:
+            from watchdog.observers import Observer  # type: ignore
+            from watchdog.events import FileSystemEventHandler  # type: ignore
+        except Exception:
+            logger.info("ℹ️ watchdog non installé, index rafraîchi par comparaison des mtimes")
+            return
+
+        index = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                # Simples lectures (git status, le bot lui-même): rien n'a changé
+                if event.event_type in ("opened", "closed_no_write"):
+                    return
+                for attr in ("src_path", "dest_path"):
+                    path = getattr(event, attr, None)
+                    if path:
+                        index._mark_dirty(path)
+
+        try:
+            observer = Observer()
+            observer.schedule(_Handler(), self.root, recursive=True)
+            observer.daemon = True
+            observer.start()
+            self._observer = observer
+            logger.info("✅ Index du workspace: surveillance watchdog active")
+        except Exception as e:
+            logger.warning(f"⚠️ watchdog indisponible ({e}), mode mtime")
+
+    def _mark_dirty(self, path) -> None:
+        if isinstance(path, bytes):
+            path = os.fsdecode(path)
+        rel = os.path.relpath(path, self.root)
+        if rel == os.curdir:
+            rel = ""
+        parts = rel.split(os.sep)
+        if rel.startswith(os.pardir) or parts[0] == ".git":
+            return
+        with self._lock:
+            # Compté même hors de l'index (.github, fichiers suivis par git…): invalide le statut Git
+            self.events += 1
+            if not any(self._is_ignored_dir(p) for p in parts[:-1]):
+                self._dirty.add(rel)
+
+    @property
+    def watching(self) -> bool:
+        return self._observer is not None
+
+    def change_token(self) -> Optional[Tuple[int, int]]:
+        """
+        Jeton qui change à chaque modification du workspace, y compris celles
+        pas encore prises en compte par refresh() et celles des dossiers non
+        indexés (cachés, node_modules…), .git excepté. None sans watchdog: les
+        changements ne sont alors connus qu'en comparant les mtimes, par
+        balayages espacés, et ne peuvent pas servir de clé de cache.
+        """
+        if self._observer is None:
+            return None
+        with self._lock:
+            return self.generation, self.events
+
+    def close(self) -> None:
+        """Arrête la surveillance du système de fichiers."""
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
+
+    # ------------------------------------------------------------------
+    # Requêtes
+    # ------------------------------------------------------------------
+
+    def files(self) -> List[str]:
+        """Retourne tous les fichiers indexés (chemins relatifs)."""
+        with self._lock:
+            return list(self._files)
+
+    def file_stat(self, rel_path: str) -> Optional[Tuple[int, int]]:
+        """Retourne (mtime_ns, taille) d'un fichier indexé."""
+        return self._files.get(rel_path)
+
+    def find_by_name(self, names) -> List[str]:
+        """Retourne les fichiers dont le nom est dans `names`, les moins profonds d'abord."""
+        names = set(names)
+        with self._lock:
+            found = [p for p in self._files if os.path.basename(p) in names]
+        found.sort(key=lambda p: (p.count(os.sep), p))
+        return found
+
+    def structure(self, max_files_per_dir: Optional[int] = None) -> str:
+        """
+        Retourne l'arborescence du workspace (mise en cache par génération).
+
+        Args:
+            max_files_per_dir: Si défini, n'affiche que les N premiers fichiers de
+                chaque dossier suivis du nombre de fichiers omis (arborescence compacte)
+        """
+        with self._lock:
+            cached = self._structure_cache.get(max_files_per_dir)
+            if cached and cached[0] == self.generation:
+                return cached[1]
+
+            lines = []
+            root_name = os.path.basename(self.root) or '.'
+            stack = [("", 0)]
+            while stack:
+                rel_dir, level = stack.pop()
+                entry = self._dirs.get(rel_dir)
+                if entry is None:
+                    continue
+                folder_name = os.path.basename(rel_dir) if rel_dir else root_name
+                lines.append(f"{'  ' * level}📁 {folder_name}/")
+                sub_indent = '  ' * (level + 1)
+                shown = entry.files if max_files_per_dir is None else entry.files[:max_files_per_dir]
+                lines.extend(f"{sub_indent}📄 {name}" for name in shown)
+                if len(shown) < len(entry.files):
+                    lines.append(f"{sub_indent}… (+{len(entry.files) - len(shown)} fichiers)")
+                for sub in reversed(entry.subdirs):
+                    stack.append((os.path.join(rel_dir, sub) if rel_dir else sub, level + 1))
+
+            text = '\n'.join(lines) if lines else "Répertoire vide"
+            self._structure_cache[max_files_per_dir] = (self.generation, text)
+            return text
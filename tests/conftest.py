@@ -0,0 +1,32 @@
+"""
+Configuration des tests - Racine du projet importable (`from src...`) comme depuis main.py
+"""
+
+import os
+import sys
+import subprocess
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def git(path: str, *args: str) -> str:
+    """Lance une commande git dans `path` (identité fixe pour les commits)."""
+    return subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        cwd=path, check=True, capture_output=True, text=True,
+    ).stdout
+
+
+@pytest.fixture
+def repo(tmp_path):
+    """Dépôt Git sur la branche main avec un fichier suivi (tracked.txt) commité."""
+    path = str(tmp_path / "repo")
+    os.makedirs(path)
+    git(path, "init", "-q", "-b", "main")
+    with open(os.path.join(path, "tracked.txt"), "w", encoding="utf-8") as f:
+        f.write("original\n")
+    git(path, "add", ".")
+    git(path, "commit", "-q", "-m", "initial")
+    return path
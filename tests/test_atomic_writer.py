@@ -0,0 +1,25 @@
+"""
+Tests de l'écriture atomique - Droits des nouveaux fichiers selon l'umask du processus
+"""
+
+import os
+import stat
+
+from src import atomic_writer
+from src.atomic_writer import AtomicBatchWriter, WriteBatch
+
+
+def test_new_file_mode_follows_umask(tmp_path, monkeypatch):
+    monkeypatch.setattr(atomic_writer, "_file_mode", None)
+    previous = os.umask(0o027)
+    try:
+        writer = AtomicBatchWriter(max_workers=1, fsync=False)
+        batch = WriteBatch()
+        batch.writes[str(tmp_path / "new.txt")] = "content\n"
+        writer.commit(batch)
+        writer.close()
+        # Lecture de l'umask sans le modifier
+        assert os.umask(0o027) == 0o027
+    finally:
+        os.umask(previous)
+    assert stat.S_IMODE(os.stat(tmp_path / "new.txt").st_mode) == 0o640
@@ -0,0 +1,80 @@
+"""
+Tests du bot - Annulation d'une instruction pendant une écriture en cours
+"""
+
+import os
+import time
+import asyncio
+import threading
+import types
+
+from src.ai_handler import AIHandler, AIResponse, FileOperation
+from src.bot import TelegramBot
+from src.session_state import SessionStore
+
+
+class _Message:
+    def __init__(self):
+        self.texts = []
+
+    async def reply_text(self, text, **kwargs):
+        self.texts.append(text)
+        return self
+
+    async def edit_text(self, text, **kwargs):
+        self.texts.append(text)
+
+
+def _update(message: _Message, text: str):
+    return types.SimpleNamespace(
+        effective_user=types.SimpleNamespace(id=1),
+        effective_chat=types.SimpleNamespace(id=1),
+        message=types.SimpleNamespace(text=text, reply_text=message.reply_text),
+    )
+
+
+def test_cancel_during_apply_rolls_back_written_files(tmp_path, monkeypatch):
+    monkeypatch.setenv("USAGE_DB", "off")
+    workspace = str(tmp_path)
+    with open(os.path.join(workspace, "existing.md"), "w", encoding="utf-8") as f:
+        f.write("original\n")
+    handler = AIHandler("ollama", workspace, fallback_providers=[])
+
+    writing = threading.Event()
+    apply_operations = handler.apply_operations
+
+    def slow_apply(operations, journal=None):
+        writing.set()
+        time.sleep(0.3)  # /cancel arrive pendant l'écriture
+        return apply_operations(operations, journal)
+
+    async def process_instruction(instruction, on_operation=None, on_progress=None, session=None):
+        await on_operation(FileOperation(action="create", file_path="created.md", content="new\n"))
+        await on_operation(FileOperation(action="modify", file_path="existing.md", content="changed\n"))
+        return AIResponse(success=True, operations=[], explanation="")
+
+    monkeypatch.setattr(handler, "apply_operations", slow_apply)
+    monkeypatch.setattr(handler, "process_instruction", process_instruction)
+
+    bot = TelegramBot.__new__(TelegramBot)
+    bot.__dict__.update(
+        allowed_user_id=1, access_pin=None, ai_handler=handler, sessions=SessionStore(),
+        _active_tasks=set(), _workspace_lock=None,
+    )
+    message = _Message()
+
+    async def scenario():
+        task = asyncio.ensure_future(bot._handle_instruction(_update(message, "instruction"), None))
+        await asyncio.to_thread(writing.wait, 5)
+        task.cancel()
+        await task
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        asyncio.run(handler.aclose())
+
+    assert not os.path.exists(os.path.join(workspace, "created.md"))
+    with open(os.path.join(workspace, "existing.md"), encoding="utf-8") as f:
+        assert f.read() == "original\n"
+    assert message.texts[-1].startswith("🛑 Instruction annulée")
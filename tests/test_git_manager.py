@@ -0,0 +1,43 @@
+"""
+Tests de GitManager - Statut en cache et annulation des modifications
+"""
+
+import os
+
+from src.git_manager import GitManager
+from src.workspace_index import WorkspaceIndex
+
+
+def test_reset_discards_edit_made_after_cached_status(repo):
+    index = WorkspaceIndex(repo, watch=False, sweep_interval=3600)
+    manager = GitManager(repo, branch="main", workspace_index=index)
+    try:
+        assert manager.read_status().clean
+
+        # Modification externe: ni watchdog ni balayage ne la signalent encore
+        tracked = os.path.join(repo, "tracked.txt")
+        with open(tracked, "w", encoding="utf-8") as f:
+            f.write("edited outside the bot\n")
+
+        ok, message = manager.reset_changes()
+
+        assert ok, message
+        with open(tracked, encoding="utf-8") as f:
+            assert f.read() == "original\n"
+        assert manager.read_status().clean
+    finally:
+        manager.close()
+        index.close()
+
+
+def test_status_sees_external_edit_without_watchdog(repo):
+    index = WorkspaceIndex(repo, watch=False, sweep_interval=3600)
+    manager = GitManager(repo, branch="main", workspace_index=index)
+    try:
+        assert manager.read_status().clean
+        with open(os.path.join(repo, "tracked.txt"), "w", encoding="utf-8") as f:
+            f.write("edited outside the bot\n")
+        assert manager.read_status().modified == ["tracked.txt"]
+    finally:
+        manager.close()
+        index.close()
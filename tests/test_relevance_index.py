@@ -0,0 +1,41 @@
+"""
+Tests de RelevanceIndex - Mises à jour et recherches pendant la construction en arrière-plan
+"""
+
+import os
+import time
+import threading
+
+from src.relevance_index import RelevanceIndex
+from src.workspace_index import WorkspaceIndex
+
+
+def test_update_during_build_does_not_wait_and_is_applied(tmp_path, monkeypatch):
+    for name in ("alpha.py", "beta.py"):
+        (tmp_path / name).write_text(f"def {name[:-3]}(): pass\n", encoding="utf-8")
+    workspace = WorkspaceIndex(str(tmp_path), watch=False, sweep_interval=0)
+    index = RelevanceIndex(workspace)
+
+    indexing = threading.Event()
+    add_doc = index._add_doc
+
+    def slow_add_doc(rel_path):
+        indexing.set()
+        time.sleep(0.2)
+        add_doc(rel_path)
+
+    monkeypatch.setattr(index, "_add_doc", slow_add_doc)
+    index.start_background_build()
+    assert indexing.wait(5)
+
+    # Fichier déjà lu par la construction, modifié pendant celle-ci
+    (tmp_path / "alpha.py").write_text("def gamma(): pass\n", encoding="utf-8")
+    os.utime(tmp_path / "alpha.py", ns=(0, time.time_ns() + 10**9))
+    started = time.perf_counter()
+    index.update(workspace.refresh())
+    assert index.search("gamma") == []
+    assert time.perf_counter() - started < 0.1
+
+    assert index._built.wait(5)
+    assert [hit.path for hit in index.search("gamma")] == ["alpha.py"]
+    workspace.close()
@@ -0,0 +1,34 @@
+"""
+Tests du cache de réponses - Réponse restituée à l'identique après un redémarrage
+"""
+
+import asyncio
+from dataclasses import asdict
+
+from src.ai_handler import AIHandler, AIResponse, FileOperation, TokenUsage
+from src.response_cache import ResponseCache
+
+
+def test_cached_response_keeps_usage_and_truncation(tmp_path, monkeypatch):
+    monkeypatch.setenv("USAGE_DB", "off")
+    handler = AIHandler("ollama", str(tmp_path / "workspace"), fallback_providers=[])
+    response = AIResponse(
+        success=True,
+        operations=[FileOperation(action="create", file_path="a.py", content="x = 1\n")],
+        explanation="ok",
+        provider="ollama/test",
+        usage=TokenUsage(input_tokens=1200, output_tokens=80, cached_tokens=1000, truncated=True, continuations=1),
+        truncated=True,
+    )
+    key = ResponseCache.make_key("ollama", "test", "instruction", "context")
+    ResponseCache(str(tmp_path / "cache")).put(key, asdict(response))
+
+    # Nouvelle instance: entrée relue depuis le disque (JSON)
+    cache = ResponseCache(str(tmp_path / "cache"))
+    restored = handler._response_from_dict(cache.get(key))
+    asyncio.run(handler.aclose())
+
+    assert restored.usage == response.usage
+    assert restored.truncated
+    assert restored.operations[0].file_path == "a.py"
+    assert "1/1" in cache.summary()